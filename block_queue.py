@@ -0,0 +1,147 @@
+"""
+Applies and restores the block queue settings of the staged devices
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+from pathlib import Path
+from typing import Iterable
+
+from grpc_interceptor.exceptions import FailedPrecondition
+
+import constant
+import metrics
+
+logger = logging.getLogger("BlockQueue")
+
+
+def read_queue_setting(device_name: str, attribute: str) -> str:
+    """
+    Reads a block queue attribute of a device, returning only the active
+    value for attributes listing the alternatives, e.g. the I/O scheduler
+    """
+    with open(f"/sys/block/{device_name}/queue/{attribute}") as file:
+        value = file.read().strip()
+
+    active = re.search(r"\[(.+?)]", value)
+    return active.group(1) if active else value
+
+
+def write_queue_setting(device_name: str, attribute: str, value: str) -> None:
+    """
+    Writes a block queue attribute of a device
+    """
+    with open(f"/sys/block/{device_name}/queue/{attribute}", "w") as file:
+        file.write(value)
+
+
+class BlockQueueTuner:
+    """
+    Applies the block queue settings requested by the StorageClass at stage
+    time and restores the kernel defaults at unstage, so that they don't leak
+    to the next volume attached to the same bus slot. The original values are
+    saved in the state directory to survive restarts of the node plugin.
+    """
+
+    def __init__(self, state_dir: str):
+        self._state_dir = Path(state_dir) / "block-queue"
+        self._lock = threading.Lock()
+        self._effective: dict[str, dict] = {}
+
+    def apply(self, volume_id: str, device_name: str, volume_context) -> dict:
+        """
+        Applies the block queue settings found in a volume context
+        :return: The effective values of the tuned attributes
+        :raises FailedPrecondition: If the kernel rejects a value
+        """
+        requested = {
+            attribute: volume_context[parameter]
+            for parameter, attribute in constant.BLOCK_QUEUE_PARAMETERS.items()
+            if parameter in volume_context
+        }
+
+        if not requested:
+            return {}
+
+        # A retried stage finds the original values saved on the same device,
+        # while a volume attached again since, maybe to another bus slot,
+        # has the ones of its new device saved instead
+        state_file = self._state_file(volume_id)
+        state = None
+        if state_file.exists():
+            with open(state_file) as file:
+                state = json.load(file)
+        if state is not None and state["device"] == device_name:
+            original = state["original"]
+        else:
+            if state is not None:
+                logger.info(f"Volume {volume_id} moved from {state['device']} to {device_name}, "
+                            f"saving the original block queue settings of {device_name}")
+            original = {
+                attribute: read_queue_setting(device_name, attribute)
+                for attribute in requested
+            }
+            self._state_dir.mkdir(parents=True, exist_ok=True)
+            with open(state_file, "w") as file:
+                json.dump({"device": device_name, "original": original}, file)
+
+        for attribute, value in requested.items():
+            try:
+                write_queue_setting(device_name, attribute, value)
+            except OSError as error:
+                error_message = f"Cannot set {attribute}={value} on {device_name} for volume {volume_id}: {error}"
+                logger.error(error_message)
+                raise FailedPrecondition(error_message) from error
+
+        effective = {
+            attribute: read_queue_setting(device_name, attribute)
+            for attribute in requested
+        }
+        logger.info(f"Volume {volume_id} block queue settings on {device_name}: {effective}")
+
+        with self._lock:
+            self._effective[volume_id] = effective
+
+        return effective
+
+    def restore(self, volume_id: str) -> None:
+        """
+        Restores the original block queue settings of a volume's device
+        """
+        with self._lock:
+            self._effective.pop(volume_id, None)
+
+        state_file = self._state_file(volume_id)
+        if not state_file.exists():
+            return
+
+        with open(state_file) as file:
+            state = json.load(file)
+
+        for attribute, value in state["original"].items():
+            try:
+                write_queue_setting(state["device"], attribute, value)
+            except OSError as error:
+                logger.warning(f"Cannot restore {attribute}={value} on {state['device']}: {error}")
+
+        logger.debug(f"Restored block queue settings of {state['device']}: {state['original']}")
+        os.unlink(state_file)
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the effective block queue settings of the tuned volumes
+        """
+        with self._lock:
+            effective = list(self._effective.items())
+
+        for volume_id, settings in effective:
+            for attribute, value in settings.items():
+                yield metrics.Sample("csi_volume_block_queue_setting",
+                                     {"volume_id": volume_id, "setting": attribute, "value": value},
+                                     1)
+
+    def _state_file(self, volume_id: str) -> Path:
+        return self._state_dir / f"{volume_id}.json"
@@ -0,0 +1,424 @@
+"""
+Node-local cache tier built with device-mapper in front of the staged volumes
+"""
+import json
+import logging
+import os
+import subprocess
+import threading
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from grpc_interceptor.exceptions import FailedPrecondition, Internal, ResourceExhausted
+
+import constant
+import deadlines
+import metrics
+
+logger = logging.getLogger("CacheTier")
+
+SECTOR_SIZE = 512
+CACHE_SLICE_ALIGNMENT = 2048
+DM_CACHE_BLOCK_SIZE = 128
+DM_CACHE_METADATA_MIN_SIZE = 8192
+DM_WRITECACHE_BLOCK_SIZE = 4096
+CACHE_DEVICE_NAME_PREFIX = "csi-cache-"
+CACHE_DRAIN_POLL_INTERVAL = 1
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters of the cache device of a volume
+    """
+
+    mode: str
+    size_bytes: int
+    used_bytes: int
+    dirty_bytes: int
+    read_hits: int
+    read_misses: int
+    write_hits: int
+    write_misses: int
+    error: str = ""
+
+
+def parse_cache_status(status: str) -> CacheStats:
+    """
+    Parses the status line of a dm-cache target, see the kernel's
+    Documentation/admin-guide/device-mapper/cache.rst
+    """
+    fields = status.split()
+    if fields[0] == "Fail":
+        return CacheStats(constant.CACHE_MODE_WRITEBACK, 0, 0, 0, 0, 0, 0, 0, error="cache target failed")
+
+    block_size = int(fields[2])
+    used_blocks, total_blocks = (int(value) for value in fields[3].split("/"))
+    features = fields[12:12 + int(fields[11])]
+    core_args_at = 12 + int(fields[11])
+    policy_args_at = core_args_at + 1 + int(fields[core_args_at]) + 1
+    metadata_mode_at = policy_args_at + 1 + int(fields[policy_args_at])
+
+    error = ""
+    if fields[metadata_mode_at] != "rw":
+        error = f"cache metadata is in {fields[metadata_mode_at]} mode"
+    elif fields[metadata_mode_at + 1] != "-":
+        error = "cache metadata needs to be checked"
+
+    block_bytes = block_size * SECTOR_SIZE
+    return CacheStats(
+        mode=constant.CACHE_MODE_WRITETHROUGH if "writethrough" in features else constant.CACHE_MODE_WRITEBACK,
+        size_bytes=total_blocks * block_bytes,
+        used_bytes=used_blocks * block_bytes,
+        dirty_bytes=int(fields[10]) * block_bytes,
+        read_hits=int(fields[4]),
+        read_misses=int(fields[5]),
+        write_hits=int(fields[6]),
+        write_misses=int(fields[7]),
+        error=error,
+    )
+
+
+def parse_writecache_status(status: str) -> CacheStats:
+    """
+    Parses the status line of a dm-writecache target, see the kernel's
+    Documentation/admin-guide/device-mapper/writecache.rst. Kernels before
+    5.15 report no hit counters, which are then zero.
+    """
+    fields = [int(value) for value in status.split()]
+    fields += [0] * (10 - len(fields))
+    errors, total_blocks, free_blocks = fields[0], fields[1], fields[2]
+    read_blocks, read_hits, write_blocks = fields[4], fields[5], fields[6]
+    write_hits = fields[7] + fields[8]
+
+    # Written back blocks return to the free list, so every used block is dirty
+    used_bytes = (total_blocks - free_blocks) * DM_WRITECACHE_BLOCK_SIZE
+    return CacheStats(
+        mode=constant.CACHE_MODE_WRITECACHE,
+        size_bytes=total_blocks * DM_WRITECACHE_BLOCK_SIZE,
+        used_bytes=used_bytes,
+        dirty_bytes=used_bytes,
+        read_hits=read_hits,
+        read_misses=read_blocks - read_hits,
+        write_hits=write_hits,
+        write_misses=write_blocks - write_hits,
+        error=f"cache device I/O error {errors}" if errors else "",
+    )
+
+
+def dmsetup(*args: str) -> str:
+    """
+    Runs dmsetup
+    :return: Its output
+    :raises Internal: If dmsetup fails
+    """
+    command = subprocess.run(["dmsetup", *args], encoding="utf-8", capture_output=True, check=False)
+    if command.returncode != 0:
+        error_message = f"dmsetup {' '.join(args)} failed: {command.stderr.strip()}"
+        logger.error(error_message)
+        raise Internal(error_message)
+    return command.stdout.strip()
+
+
+def get_device_sectors(device_path: str) -> int:
+    """
+    Returns the size of a block device in sectors
+    """
+    command = subprocess.run(["blockdev", "--getsz", device_path], encoding="utf-8", capture_output=True, check=False)
+    if command.returncode != 0:
+        error_message = f"Cannot read the size of {device_path}: {command.stderr.strip()}"
+        logger.error(error_message)
+        raise Internal(error_message)
+    return int(command.stdout)
+
+
+class CacheTier:
+    """
+    Puts a dm-cache or dm-writecache device in front of the volumes whose
+    StorageClass requests it. The cache of every volume is a slice of the
+    node's local cache device, mapped with dm-linear, and the file system is
+    mounted on top of the cache device. The slices are recorded in the state
+    directory, so that a volume staged again after a restart of the plugin
+    or of the node finds its cache, and its dirty blocks, where it left them.
+    """
+
+    def __init__(self, state_dir: str, cache_device: str = ""):
+        self._state_dir = Path(state_dir) / "cache-tier"
+        self._cache_device = cache_device
+        self._lock = threading.Lock()
+        self._failed: set[str] = set()
+
+    def setup(self, volume_id: str, origin_path: str, volume_context) -> str:
+        """
+        Builds the cache device of a volume, unless its StorageClass does not
+        request one or it already exists
+        :return: The path of the device to format and mount
+        :raises FailedPrecondition: If the node has no cache device
+        :raises ResourceExhausted: If the cache device is full
+        """
+        mode = volume_context.get("cache_mode", constant.CACHE_MODE_NONE)
+        if mode == constant.CACHE_MODE_NONE:
+            return origin_path
+
+        if not self._cache_device:
+            error_message = f"Volume {volume_id} requests a {mode} cache, but this node has no cache device"
+            logger.error(error_message)
+            raise FailedPrecondition(error_message)
+
+        with self._lock:
+            state = self._load(volume_id)
+            if state is None:
+                length = int(volume_context.get("cache_size_mib", constant.DEFAULT_CACHE_SIZE_MIB)) * 2048
+                state = {
+                    "mode": mode,
+                    "cache_device": self._cache_device,
+                    "offset": self._allocate(volume_id, length),
+                    "length": length,
+                    "initialized": False,
+                }
+            state["origin"] = origin_path
+            self._save(volume_id, state)
+
+        name = self._device_name(volume_id)
+        if Path(f"/dev/mapper/{name}").exists():
+            logger.debug(f"Cache device of volume {volume_id} already exists")
+            return f"/dev/mapper/{name}"
+
+        if not state["initialized"]:
+            # Both targets format a cache whose superblock is zeroed and
+            # refuse anything else, e.g. a slice left by a previous volume
+            with open(state["cache_device"], "r+b") as cache_device:
+                cache_device.seek(state["offset"] * SECTOR_SIZE)
+                cache_device.write(bytes(4096))
+                os.fsync(cache_device.fileno())
+
+        origin_sectors = get_device_sectors(origin_path)
+        if mode == constant.CACHE_MODE_WRITECACHE:
+            self._create_linear(f"{name}-data", state["cache_device"], state["offset"], state["length"])
+        else:
+            metadata_length = self._metadata_length(state["length"])
+            self._create_linear(f"{name}-meta", state["cache_device"], state["offset"], metadata_length)
+            self._create_linear(f"{name}-data", state["cache_device"], state["offset"] + metadata_length,
+                                state["length"] - metadata_length)
+        dmsetup("create", name, "--table", self._table(volume_id, state, origin_sectors))
+
+        if not state["initialized"]:
+            state["initialized"] = True
+            with self._lock:
+                self._save(volume_id, state)
+
+        logger.info(f"Volume {volume_id} is cached in {mode} mode by {state['length'] // 2048} MiB of "
+                    f"{state['cache_device']}")
+        return f"/dev/mapper/{name}"
+
+    def teardown(self, volume_id: str, deadline: deadlines.Deadline) -> None:
+        """
+        Writes the dirty blocks of a volume back to it and removes its cache
+        device, releasing its slice. The file system must be unmounted.
+        :raises DeadlineExceeded: If the dirty blocks are not written back in
+                                  time, the cache is left in place to be
+                                  drained by the retried call
+        :raises FailedPrecondition: If the cache failed, its dirty blocks
+                                    cannot be written back and it is left in
+                                    place until it is removed by hand
+        """
+        with self._lock:
+            state = self._load(volume_id)
+        if state is None:
+            return
+
+        name = self._device_name(volume_id)
+        if Path(f"/dev/mapper/{name}").exists():
+            stats = self.stats(volume_id)
+            if stats.dirty_bytes:
+                self._drain(volume_id, state, deadline)
+            if state["mode"] == constant.CACHE_MODE_WRITECACHE:
+                dmsetup("message", name, "0", "flush")
+
+            stats = self.stats(volume_id)
+            if stats.error:
+                error_message = (f"Cannot remove the cache of volume {volume_id}: {stats.error}, its dirty blocks "
+                                 f"cannot be written back. Remove it with 'dmsetup remove --force {name}' once "
+                                 f"the data left in the cache is given up or recovered.")
+                with self._lock:
+                    first_failure = volume_id not in self._failed
+                    self._failed.add(volume_id)
+                # The kubelet retries the unstage until the cache is removed
+                if first_failure:
+                    logger.error(error_message)
+                else:
+                    logger.debug(error_message)
+                raise FailedPrecondition(error_message)
+            if stats.dirty_bytes:
+                error_message = f"Cannot remove the cache of volume {volume_id}: {stats.dirty_bytes} dirty bytes left"
+                logger.error(error_message)
+                raise Internal(error_message)
+            dmsetup("remove", name)
+
+        for suffix in ("-data", "-meta"):
+            if Path(f"/dev/mapper/{name}{suffix}").exists():
+                dmsetup("remove", f"{name}{suffix}")
+
+        with self._lock:
+            os.unlink(self._state_file(volume_id))
+            self._failed.discard(volume_id)
+        logger.info(f"Removed the cache of volume {volume_id}")
+
+    def resize(self, volume_id: str) -> None:
+        """
+        Extends the cache device of a volume to the new size of its origin
+        """
+        with self._lock:
+            state = self._load(volume_id)
+        if state is None:
+            return
+
+        name = self._device_name(volume_id)
+        origin_sectors = get_device_sectors(state["origin"])
+        if get_device_sectors(f"/dev/mapper/{name}") == origin_sectors:
+            return
+
+        logger.info(f"Extending the cache device of volume {volume_id} to {origin_sectors} sectors")
+        self._reload(name, self._table(volume_id, state, origin_sectors))
+
+    def stats(self, volume_id: str) -> Optional[CacheStats]:
+        """
+        Returns the counters of the cache of a volume, None if it has none
+        """
+        with self._lock:
+            state = self._load(volume_id)
+        if state is None:
+            return None
+
+        status = dmsetup("status", self._device_name(volume_id)).split(None, 3)[3]
+        if state["mode"] == constant.CACHE_MODE_WRITECACHE:
+            return parse_writecache_status(status)
+        return parse_cache_status(status)
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the hit, miss and dirty counters of the cached volumes, and
+        whether their cache failed
+        """
+        if not self._state_dir.exists():
+            return
+
+        for state_file in sorted(self._state_dir.glob("*.json")):
+            volume_id = state_file.stem
+            if not Path(f"/dev/mapper/{self._device_name(volume_id)}").exists():
+                continue
+            try:
+                stats = self.stats(volume_id)
+            except Internal:
+                continue
+            if stats is None:
+                continue
+
+            labels = {"volume_id": volume_id, "mode": stats.mode}
+            yield metrics.Sample("csi_volume_cache_size_bytes", labels, stats.size_bytes)
+            yield metrics.Sample("csi_volume_cache_used_bytes", labels, stats.used_bytes)
+            yield metrics.Sample("csi_volume_cache_dirty_bytes", labels, stats.dirty_bytes)
+            yield metrics.Sample("csi_volume_cache_failed", labels, 1 if stats.error else 0)
+            for operation in ("read", "write"):
+                operation_labels = {**labels, "operation": operation}
+                yield metrics.Sample("csi_volume_cache_hits_total", operation_labels,
+                                     getattr(stats, f"{operation}_hits"), "counter")
+                yield metrics.Sample("csi_volume_cache_misses_total", operation_labels,
+                                     getattr(stats, f"{operation}_misses"), "counter")
+
+    def _drain(self, volume_id: str, state: dict, deadline: deadlines.Deadline) -> None:
+        name = self._device_name(volume_id)
+        logger.info(f"Writing back the dirty blocks of the cache of volume {volume_id}")
+        if state["mode"] == constant.CACHE_MODE_WRITECACHE:
+            dmsetup("message", name, "0", "cleaner")
+        else:
+            origin_sectors = get_device_sectors(state["origin"])
+            self._reload(name, self._table(volume_id, state, origin_sectors, policy="cleaner"))
+
+        while True:
+            stats = self.stats(volume_id)
+            if stats.error:
+                break
+            if not stats.dirty_bytes:
+                return
+            logger.debug(f"Cache of volume {volume_id} has {stats.dirty_bytes} dirty bytes left")
+            deadline.sleep(CACHE_DRAIN_POLL_INTERVAL, f"writing back the cache of volume {volume_id}")
+
+    def _table(self, volume_id: str, state: dict, origin_sectors: int, policy: str = "smq") -> str:
+        name = self._device_name(volume_id)
+        if state["mode"] == constant.CACHE_MODE_WRITECACHE:
+            return (f"0 {origin_sectors} writecache s {state['origin']} /dev/mapper/{name}-data "
+                    f"{DM_WRITECACHE_BLOCK_SIZE} 0")
+        return (f"0 {origin_sectors} cache /dev/mapper/{name}-meta /dev/mapper/{name}-data {state['origin']} "
+                f"{DM_CACHE_BLOCK_SIZE} 1 {state['mode']} {policy} 0")
+
+    def _allocate(self, volume_id: str, length: int) -> int:
+        """
+        Finds the first free aligned range of the cache device, the caller
+        holds the lock
+        """
+        used = sorted(
+            (state["offset"], state["offset"] + state["length"])
+            for state in self._states()
+            if state["cache_device"] == self._cache_device
+        )
+
+        offset = 0
+        for used_start, used_end in used:
+            if used_start - offset >= length:
+                break
+            offset = max(offset, -(-used_end // CACHE_SLICE_ALIGNMENT) * CACHE_SLICE_ALIGNMENT)
+
+        if offset + length > get_device_sectors(self._cache_device):
+            error_message = (f"Cache device {self._cache_device} has no room left for "
+                             f"{length // 2048} MiB of cache for volume {volume_id}")
+            logger.error(error_message)
+            raise ResourceExhausted(error_message)
+        return offset
+
+    def _states(self) -> Iterable[dict]:
+        if not self._state_dir.exists():
+            return
+        for state_file in self._state_dir.glob("*.json"):
+            with open(state_file) as file:
+                yield json.load(file)
+
+    def _load(self, volume_id: str) -> Optional[dict]:
+        state_file = self._state_file(volume_id)
+        if not state_file.exists():
+            return None
+        with open(state_file) as file:
+            return json.load(file)
+
+    def _save(self, volume_id: str, state: dict) -> None:
+        self._state_dir.mkdir(parents=True, exist_ok=True)
+        temporary_file = self._state_file(volume_id).with_suffix(".tmp")
+        with open(temporary_file, "w") as file:
+            json.dump(state, file)
+        os.replace(temporary_file, self._state_file(volume_id))
+
+    def _state_file(self, volume_id: str) -> Path:
+        return self._state_dir / f"{volume_id}.json"
+
+    @staticmethod
+    def _create_linear(name: str, device: str, offset: int, length: int) -> None:
+        if not Path(f"/dev/mapper/{name}").exists():
+            dmsetup("create", name, "--table", f"0 {length} linear {device} {offset}")
+
+    @staticmethod
+    def _reload(name: str, table: str) -> None:
+        dmsetup("reload", name, "--table", table)
+        dmsetup("suspend", name)
+        dmsetup("resume", name)
+
+    @staticmethod
+    def _device_name(volume_id: str) -> str:
+        return f"{CACHE_DEVICE_NAME_PREFIX}{volume_id}"
+
+    @staticmethod
+    def _metadata_length(length: int) -> int:
+        # 4 MiB plus 16 bytes per cache block, as advised by the kernel
+        metadata_length = DM_CACHE_METADATA_MIN_SIZE + 16 * (length // DM_CACHE_BLOCK_SIZE) // SECTOR_SIZE
+        return -(-metadata_length // CACHE_SLICE_ALIGNMENT) * CACHE_SLICE_ALIGNMENT
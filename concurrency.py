@@ -0,0 +1,109 @@
+"""
+Concurrency primitives shared by the driver services
+"""
+import logging
+import threading
+
+from concurrent import futures
+from contextlib import contextmanager
+from typing import Callable
+
+from grpc_interceptor.exceptions import Aborted, Cancelled, DeadlineExceeded, ResourceExhausted
+
+import deadlines
+
+logger = logging.getLogger("Concurrency")
+
+HEAVY_OPERATION_POLL_INTERVAL = 1
+
+
+class VolumeLocks:
+    """
+    Tracks the volume IDs which currently have an operation in flight.
+    A second operation for the same volume is rejected with ABORTED, as
+    required by the CSI spec, instead of being queued behind the first one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    @contextmanager
+    def acquire(self, volume_id: str, operation: str):
+        """
+        Holds the lock of a volume for the duration of the context
+        :param volume_id: The volume ID to lock
+        :param operation: Name of the operation, used in error messages
+        :raises Aborted: If another operation for the volume is in flight
+        """
+        with self._lock:
+            if volume_id in self._in_flight:
+                error_message = (f"Operation {self._in_flight[volume_id]} for volume {volume_id} "
+                                 f"is still in progress, aborting {operation}")
+                logger.warning(error_message)
+                raise Aborted(error_message)
+            self._in_flight[volume_id] = operation
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._in_flight[volume_id]
+
+
+class HeavyOperationPool:
+    """
+    Runs I/O-heavy operations (format, fsck, resize) on a separate, bounded pool.
+    The number of gRPC worker threads allowed to wait for the pool is limited
+    too, so cheap operations such as bind mounts always find a free worker.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="heavy-io"
+        )
+        self._admission = threading.BoundedSemaphore(max_pending)
+
+    def run(self,
+            description: str,
+            action: Callable,
+            *args,
+            deadline: deadlines.Deadline = None,
+            **kwargs):
+        """
+        Runs an action on the pool and waits for its result. An action still
+        queued when the call's deadline passes is dropped, while an action
+        already running is waited for, so that a volume is never left
+        half-formatted behind the volume lock.
+        :param description: Human-readable description of the action
+        :param action: The callable to run
+        :param deadline: Deadline of the gRPC call waiting for the action
+        :return: The value returned by the action
+        :raises ResourceExhausted: If too many heavy operations are already pending
+        """
+        deadline = deadline or deadlines.Deadline()
+        deadline.check(description)
+
+        if not self._admission.acquire(blocking=False):
+            error_message = f"Too many I/O-heavy operations pending, rejecting {description}"
+            logger.warning(error_message)
+            raise ResourceExhausted(error_message)
+
+        try:
+            logger.debug(f"Scheduling I/O-heavy operation: {description}")
+            future = self._executor.submit(action, *args, **kwargs)
+            while True:
+                try:
+                    return future.result(timeout=HEAVY_OPERATION_POLL_INTERVAL)
+                except futures.TimeoutError:
+                    pass
+
+                try:
+                    deadline.check(description)
+                except (DeadlineExceeded, Cancelled):
+                    if future.cancel():
+                        raise
+                    logger.warning(f"The caller of {description} is gone, letting the running operation finish")
+                    return future.result()
+        finally:
+            self._admission.release()
@@ -6,4 +6,71 @@ CSI_PLUGIN_NAME = "csi.opennebula.io"
 CSI_PLUGIN_VERSION = "0.0.20"
 MIN_VOLUME_SIZE = 1048576
 DEFAULT_VOLUME_SIZE = 1
+SUPPORTED_ACCESS_MODES = (1, 2, 3)  # SINGLE_NODE_WRITER, SINGLE_NODE_READER_ONLY, MULTI_NODE_READER_ONLY
 OPENNEBULA_INSTANCE_ID_REGEX = r"^[0-9]*$"
+NO_JOURNAL_REPLAY_MOUNT_OPTIONS = {
+    "ext3": "noload",
+    "ext4": "noload",
+    "xfs": "norecovery",
+}
+DISCARD_ONLINE = "online"
+DISCARD_SCHEDULED = "scheduled"
+DISCARD_MODES = (DISCARD_ONLINE, DISCARD_SCHEDULED)
+BLOCK_QUEUE_PARAMETERS = {
+    "read_ahead_kb": "read_ahead_kb",
+    "io_scheduler": "scheduler",
+    "nr_requests": "nr_requests",
+    "max_sectors_kb": "max_sectors_kb",
+}
+BLOCK_QUEUE_SCHEDULERS = ("none", "mq-deadline", "kyber", "bfq")
+DEFAULT_MAX_VOLUMES_PER_NODE = 20
+CSI_VOLUME_NAME_PREFIX = "pvc-"
+MAX_DISKS_PER_DEV_PREFIX = {
+    "hd": 4,
+    "sd": 26,
+    "vd": 26,
+}
+MAX_VOLUMES_USER_TEMPLATE_ATTRIBUTE = "CSI_MAX_VOLUMES_PER_NODE"
+EPHEMERAL_DISK_ATTRIBUTE = "CSI_EPHEMERAL_VOLUME"
+DEFAULT_EPHEMERAL_SIZE_MIB = 1024
+EPHEMERAL_DISK_FORMATS = ("raw", "qcow2")
+QUICK_FORMAT_OPTIONS = {
+    "ext3": ["-E", "lazy_itable_init=1,lazy_journal_init=1,nodiscard"],
+    "ext4": ["-E", "lazy_itable_init=1,lazy_journal_init=1,nodiscard"],
+    "xfs": ["-K"],
+}
+DISK_ATTACH_PARAMETERS = {
+    "disk_cache": ("CACHE", ("default", "none", "writethrough", "writeback", "directsync", "unsafe")),
+    "disk_io": ("IO", ("native", "threads", "io_uring")),
+    "disk_discard": ("DISCARD", ("ignore", "unmap")),
+    "disk_dev_prefix": ("DEV_PREFIX", ("vd", "sd", "hd")),
+    "disk_virtio_blk_queues": ("VIRTIO_BLK_QUEUES", None),
+    "disk_iothread": ("IOTHREAD", None),
+}
+DISK_THROTTLING_PARAMETERS = {
+    f"disk_{scope}_{unit}_sec{suffix.lower()}": f"{scope.upper()}_{unit.upper()}_SEC{suffix}"
+    for scope in ("total", "read", "write")
+    for unit in ("bytes", "iops")
+    for suffix in ("", "_MAX", "_MAX_LENGTH")
+}
+DISK_THROTTLING_IMAGE_ATTRIBUTE_PREFIX = "CSI_"
+IMAGE_STATE_READY = 1
+IMAGE_STATE_ERROR = 5
+IMAGE_READY_POLL_MIN_INTERVAL = 1
+IMAGE_READY_POLL_MAX_INTERVAL = 15
+IMPORT_URL_SCHEMES = ("http", "https")
+DELETED_IMAGE_NAME_PREFIX = "csi-deleted-"
+PLACEMENT_MOST_FREE = "most_free"
+PLACEMENT_FEWEST_IMAGES = "fewest_images"
+PLACEMENT_WEIGHTED_ROUND_ROBIN = "weighted_round_robin"
+PLACEMENT_POLICIES = (PLACEMENT_MOST_FREE, PLACEMENT_FEWEST_IMAGES, PLACEMENT_WEIGHTED_ROUND_ROBIN)
+DATASTORE_POOL_CACHE_TTL = 30
+TOPOLOGY_CLUSTER_KEY = "topology.csi.opennebula.io/cluster"
+TOPOLOGY_HOST_KEY = "topology.csi.opennebula.io/host"
+CACHE_MODE_NONE = "none"
+CACHE_MODE_WRITETHROUGH = "writethrough"
+CACHE_MODE_WRITEBACK = "writeback"
+CACHE_MODE_WRITECACHE = "writecache"
+CACHE_MODES = (CACHE_MODE_NONE, CACHE_MODE_WRITETHROUGH, CACHE_MODE_WRITEBACK, CACHE_MODE_WRITECACHE)
+CACHE_WRITE_BACK_MODES = (CACHE_MODE_WRITEBACK, CACHE_MODE_WRITECACHE)
+DEFAULT_CACHE_SIZE_MIB = 1024
@@ -0,0 +1,76 @@
+"""
+Exercises the server-side import of a dataset: serves a random file over HTTP,
+asks a running controller plugin to create a volume importing it, retrying
+the call like the external-provisioner does until the image is ready, checks
+its capacity and deletes it. The HTTP address must be reachable from the
+OpenNebula front-end.
+
+Usage: python contrib/image_import_http_test.py CSI_ENDPOINT HTTP_ADDRESS:PORT DATASTORE_ID [SIZE_MIB]
+"""
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import grpc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pb import csi_pb2  # noqa: E402  pylint: disable=wrong-import-position
+from pb import csi_pb2_grpc  # noqa: E402  pylint: disable=wrong-import-position
+
+CALL_TIMEOUT = 30
+
+
+def serve(directory: str, address: str, port: int) -> http.server.ThreadingHTTPServer:
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer((address, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_volume(stub: csi_pb2_grpc.ControllerStub, name: str, url: str, datastore_id: str) -> csi_pb2.Volume:
+    capability = csi_pb2.VolumeCapability()
+    capability.mount.fs_type = "ext4"
+    capability.access_mode.mode = csi_pb2.VolumeCapability.AccessMode.SINGLE_NODE_WRITER
+    request = csi_pb2.CreateVolumeRequest(name=name,
+                                          volume_capabilities=[capability],
+                                          parameters={"datastore_id": datastore_id, "import_url": url})
+
+    started = time.monotonic()
+    while True:
+        try:
+            return stub.CreateVolume(request, timeout=CALL_TIMEOUT).volume
+        except grpc.RpcError as error:
+            if error.code() != grpc.StatusCode.DEADLINE_EXCEEDED:
+                raise
+            print(f"  still importing after {time.monotonic() - started:.0f}s: {error.details()}")
+
+
+def main() -> None:
+    csi_endpoint, http_endpoint, datastore_id = sys.argv[1:4]
+    size_mib = int(sys.argv[4]) if len(sys.argv) > 4 else 64
+    address, port = http_endpoint.rsplit(":", 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "dataset.img"), "wb") as file:
+            file.write(os.urandom(size_mib * 1024 ** 2))
+        server = serve(directory, address, int(port))
+
+        stub = csi_pb2_grpc.ControllerStub(grpc.insecure_channel(csi_endpoint))
+        name = f"pvc-import-test-{uuid.uuid4()}"
+        try:
+            volume = create_volume(stub, name, f"http://{http_endpoint}/dataset.img", datastore_id)
+            print(f"  imported {size_mib} MiB into volume {volume.volume_id} ({volume.capacity_bytes} bytes)")
+            assert volume.capacity_bytes >= size_mib * 1024 ** 2, "the volume is smaller than the dataset"
+            stub.DeleteVolume(csi_pb2.DeleteVolumeRequest(volume_id=volume.volume_id), timeout=CALL_TIMEOUT)
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares the memory and CPU cost of decoding large synthetic OpenNebula pool
+documents with pool_decoder and with a full object tree (pyone if installed,
+ElementTree otherwise)
+
+Usage: python contrib/pool_decoder_benchmark.py [ENTRIES]
+"""
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pool_decoder  # noqa: E402  pylint: disable=wrong-import-position
+
+try:
+    from pyone import bindings
+except ImportError:
+    bindings = None
+
+
+def image_pool(entries: int) -> str:
+    images = "".join(
+        f"<IMAGE><ID>{i}</ID><UID>0</UID><GID>0</GID><UNAME>oneadmin</UNAME><GNAME>oneadmin</GNAME>"
+        f"<NAME>pvc-{i:08x}-3b4e-4d9a-9c1e-5f6a7b8c9d0e</NAME>"
+        f"<PERMISSIONS><OWNER_U>1</OWNER_U><OWNER_M>1</OWNER_M><OWNER_A>0</OWNER_A></PERMISSIONS>"
+        f"<TYPE>2</TYPE><DISK_TYPE>0</DISK_TYPE><PERSISTENT>1</PERSISTENT><REGTIME>1700000000</REGTIME>"
+        f"<SOURCE>/var/lib/one/datastores/100/{i:032x}</SOURCE><PATH></PATH><FORMAT>raw</FORMAT><FS></FS>"
+        f"<SIZE>{1024 * (i % 64 + 1)}</SIZE><STATE>{2 if i % 3 else 1}</STATE><RUNNING_VMS>{i % 3 and 1}</RUNNING_VMS>"
+        f"<CLONING_OPS>0</CLONING_OPS><CLONING_ID>-1</CLONING_ID><TARGET_SNAPSHOT>-1</TARGET_SNAPSHOT>"
+        f"<DATASTORE_ID>{100 + i % 4}</DATASTORE_ID><DATASTORE>ssd-{i % 4}</DATASTORE>"
+        f"<VMS>{f'<ID>{i % 500}</ID>' if i % 3 else ''}</VMS><CLONES></CLONES><APP_CLONES></APP_CLONES>"
+        f"<TEMPLATE><DEV_PREFIX><![CDATA[vd]]></DEV_PREFIX><DRIVER><![CDATA[raw]]></DRIVER></TEMPLATE>"
+        f"<SNAPSHOTS><ALLOW_ORPHANS>NO</ALLOW_ORPHANS><CURRENT_BASE>-1</CURRENT_BASE><NEXT_SNAPSHOT>0</NEXT_SNAPSHOT>"
+        f"</SNAPSHOTS></IMAGE>"
+        for i in range(entries)
+    )
+    return f"<IMAGE_POOL>{images}</IMAGE_POOL>"
+
+
+def vm_pool(entries: int) -> str:
+    vms = "".join(
+        f"<VM><ID>{i}</ID><UID>0</UID><GID>0</GID><UNAME>oneadmin</UNAME><GNAME>oneadmin</GNAME>"
+        f"<NAME>k8s-worker-{i}</NAME><LAST_POLL>0</LAST_POLL><STATE>3</STATE><LCM_STATE>3</LCM_STATE>"
+        f"<PREV_STATE>3</PREV_STATE><PREV_LCM_STATE>3</PREV_LCM_STATE><RESCHED>0</RESCHED>"
+        f"<STIME>1700000000</STIME><ETIME>0</ETIME><DEPLOY_ID>one-{i}</DEPLOY_ID>"
+        f"<TEMPLATE><CPU><![CDATA[2]]></CPU><MEMORY><![CDATA[4096]]></MEMORY>"
+        + "".join(
+            f"<DISK><DISK_ID><![CDATA[{d}]]></DISK_ID><IMAGE_ID><![CDATA[{i * 4 + d}]]></IMAGE_ID>"
+            f"<TARGET><![CDATA[vd{chr(ord('a') + d)}]]></TARGET><DATASTORE_ID><![CDATA[100]]></DATASTORE_ID>"
+            f"<SOURCE><![CDATA[/var/lib/one/datastores/100/{i * 4 + d:032x}]]></SOURCE><TYPE><![CDATA[FILE]]></TYPE>"
+            f"<CACHE><![CDATA[none]]></CACHE><DRIVER><![CDATA[raw]]></DRIVER></DISK>"
+            for d in range(4)
+        )
+        + f"<CONTEXT><NETWORK><![CDATA[YES]]></NETWORK><TARGET><![CDATA[hda]]></TARGET></CONTEXT>"
+        f"<NIC><IP><![CDATA[10.0.{i // 256 % 256}.{i % 256}]]></IP><MAC><![CDATA[02:00:0a:00:00:01]]></MAC></NIC>"
+        f"</TEMPLATE><USER_TEMPLATE><LABELS><![CDATA[k8s]]></LABELS></USER_TEMPLATE></VM>"
+        for i in range(entries)
+    )
+    return f"<VM_POOL>{vms}</VM_POOL>"
+
+
+def measure(description: str, decode, document: str) -> None:
+    # CPU time and peak memory are measured in separate runs, because
+    # tracemalloc slows down the allocations it traces
+    started = time.process_time()
+    decode(document)
+    elapsed = time.process_time() - started
+
+    tracemalloc.start()
+    result = decode(document)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"  {description:<20} {elapsed:8.3f} s CPU {peak / 1024 ** 2:10.1f} MiB peak")
+
+
+def main() -> None:
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    if bindings is not None:
+        full_tree = ("pyone", lambda document: bindings.parseString(document.encode("utf-8"), silence=True))
+    else:
+        full_tree = ("ElementTree", ElementTree.fromstring)
+
+    for pool, document, decode in (
+        ("imagepool", image_pool(entries), pool_decoder.decode_image_pool),
+        ("vmpool", vm_pool(entries), pool_decoder.decode_vm_pool),
+    ):
+        print(f"{pool}.info, {entries} entries, {len(document) / 1024 ** 2:.1f} MiB of XML")
+        measure(full_tree[0], full_tree[1], document)
+        measure("pool_decoder", lambda document: list(decode(document)), document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Ties the waits and retries of an operation to the deadline of its gRPC call
+"""
+import logging
+import threading
+
+from typing import Optional
+
+from grpc_interceptor.exceptions import Cancelled, DeadlineExceeded
+
+logger = logging.getLogger("Deadlines")
+
+
+class Deadline:
+    """
+    Wraps the gRPC context of a call. Operations check it between steps and
+    sleep through it, so that they stop as soon as the client is gone
+    instead of working on a request which has already been retried.
+    A None context never expires, which is used for internal operations.
+    """
+
+    def __init__(self, context=None):
+        self._context = context
+        self._done = threading.Event()
+        if context is not None:
+            context.add_callback(self._done.set)
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns the seconds left until the deadline, None if there is none
+        """
+        if self._context is None:
+            return None
+        return self._context.time_remaining()
+
+    def check(self, operation: str) -> None:
+        """
+        Stops the operation if the client is gone or the deadline has passed
+        :param operation: Description of the next step, used in error messages
+        :raises Cancelled: If the client cancelled the call
+        :raises DeadlineExceeded: If the deadline has passed
+        """
+        if self._context is None:
+            return
+
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            error_message = f"Deadline exceeded before {operation}"
+            logger.warning(error_message)
+            raise DeadlineExceeded(error_message)
+
+        if not self._context.is_active():
+            error_message = f"Call cancelled by the client before {operation}"
+            logger.warning(error_message)
+            raise Cancelled(error_message)
+
+    def sleep(self, seconds: float, operation: str) -> None:
+        """
+        Sleeps before retrying a step, waking up early if the call ends
+        :raises DeadlineExceeded: If the deadline would pass during the sleep
+        :raises Cancelled: If the client cancelled the call
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= seconds:
+            error_message = f"Not enough time left ({remaining:.1f}s) to wait {seconds}s and retry {operation}"
+            logger.warning(error_message)
+            raise DeadlineExceeded(error_message)
+
+        self._done.wait(seconds)
+        self.check(operation)
@@ -0,0 +1,278 @@
+"""
+Deferred detach of unpublished volumes, avoiding a hotplug cycle when a pod is
+restarted or rescheduled on the same node
+"""
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from grpc_interceptor.exceptions import Aborted
+
+import concurrency
+import journal
+import metrics
+
+logger = logging.getLogger("DeferredDetach")
+
+DEFERRED_DETACH_OPERATION = "deferred_detach"
+DEFERRED_DETACH_RETRY_INTERVAL = 30
+DEFERRED_DETACH_MIN_WAIT = 1
+
+
+@dataclass
+class _PendingDetach:
+    vm_id: int
+    due: float
+    entry_id: Optional[str] = None
+    key: Optional[str] = None
+
+
+class DeferredDetacher:
+    """
+    Keeps unpublished volumes attached for a grace period. A publish to the
+    same VM within the period takes the volume back as it is, a publish to
+    another VM or the end of the period performs the real detach. Pending
+    detaches are recorded in the operation journal, so they are resumed
+    after a restart, and handed over with their shard to another replica.
+    """
+
+    def __init__(self,
+                 volume_locks: concurrency.VolumeLocks,
+                 grace_period: float,
+                 detach: Callable[[int, int], None],
+                 operation_journal: Optional[journal.OperationJournal] = None,
+                 owns: Callable[[Optional[str]], bool] = lambda key: True):
+        self._volume_locks = volume_locks
+        self._grace_period = grace_period
+        self._detach = detach
+        self._journal = operation_journal
+        self._owns = owns
+        self._lock = threading.Lock()
+        self._pending: dict[int, _PendingDetach] = {}
+        self._reclaimed = 0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="deferred-detach", daemon=True)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether unpublished volumes are kept attached for a grace period
+        """
+        return self._grace_period > 0
+
+    def start(self) -> None:
+        """
+        Starts detaching the volumes whose grace period is over
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background detaches, the pending ones are resumed after
+        the next start
+        """
+        self._stop.set()
+        self._wakeup.set()
+
+    def defer(self, image_id: int, vm_id: int, key: Optional[str] = None) -> None:
+        """
+        Schedules the detach of an image at the end of the grace period.
+        The caller holds the volume lock of the image.
+        :param key: Shard key of the image, recorded in the journal
+        """
+        due = time.time() + self._grace_period
+        entry_id = None
+        if self._journal is not None:
+            entry_id = self._journal.begin(DEFERRED_DETACH_OPERATION,
+                                           key=key,
+                                           image_id=image_id,
+                                           vm_id=vm_id,
+                                           due=due)
+
+        with self._lock:
+            previous = self._pending.get(image_id)
+            self._pending[image_id] = _PendingDetach(vm_id=vm_id, due=due, entry_id=entry_id, key=key)
+
+        if previous is not None:
+            if previous.vm_id != vm_id:
+                # A read-only image shared by several VMs, only the last
+                # unpublished one is kept
+                logger.info(f"Detaching image ID {image_id} from VM ID {previous.vm_id} before its grace period "
+                            f"is over")
+                try:
+                    self._detach(previous.vm_id, image_id)
+                except Exception:
+                    with self._lock:
+                        self._pending[image_id] = previous
+                    self._complete(_PendingDetach(vm_id=vm_id, due=due, entry_id=entry_id, key=key))
+                    raise
+            self._complete(previous)
+
+        logger.info(f"Deferring the detach of image ID {image_id} from VM ID {vm_id} by {self._grace_period}s")
+        self._wakeup.set()
+
+    def restore(self, entry_id: str, image_id: int, vm_id: int, due: float, key: Optional[str] = None) -> None:
+        """
+        Reschedules a pending detach found in the journal on startup or
+        adopted from another replica
+        """
+        with self._lock:
+            self._pending[image_id] = _PendingDetach(vm_id=vm_id, due=due, entry_id=entry_id, key=key)
+        logger.info(f"Resuming the deferred detach of image ID {image_id} from VM ID {vm_id}")
+        self._wakeup.set()
+
+    def reclaim(self, image_id: int, vm_id: int) -> bool:
+        """
+        Cancels the pending detach of an image about to be published. The
+        caller holds the volume lock of the image.
+        :return: Whether the image is still attached to the VM, in which
+                 case there is nothing left to do to publish it
+        :rtype: bool
+        """
+        with self._lock:
+            pending = self._pending.get(image_id)
+            if pending is None or pending.vm_id != vm_id:
+                reclaimed = False
+            else:
+                del self._pending[image_id]
+                self._reclaimed += 1
+                reclaimed = True
+
+        if not reclaimed:
+            self.detach_now(image_id)
+            return False
+
+        logger.info(f"Image ID {image_id} is republished to VM ID {vm_id} within its grace period")
+        self._complete(pending)
+        return True
+
+    def detach_now(self, image_id: int) -> None:
+        """
+        Performs the pending detach of an image, if any, without waiting for
+        the end of its grace period. The caller holds the volume lock of the
+        image.
+        """
+        with self._lock:
+            pending = self._pending.pop(image_id, None)
+
+        if pending is None:
+            return
+
+        logger.info(f"Detaching image ID {image_id} from VM ID {pending.vm_id} before its grace period is over")
+        try:
+            self._detach(pending.vm_id, image_id)
+        except Exception:
+            with self._lock:
+                self._pending.setdefault(image_id, pending)
+            raise
+        self._complete(pending)
+
+    def flush_vm(self, vm_id: int) -> int:
+        """
+        Performs the pending detaches from a VM without waiting for the end
+        of their grace period, freeing the disk targets they hold for an
+        attach. The images with an operation in flight are left pending.
+        :return: The number of detached images
+        :rtype: int
+        """
+        with self._lock:
+            image_ids = [image_id for image_id, pending in self._pending.items()
+                         if pending.vm_id == vm_id and self._owns(pending.key)]
+
+        detached = 0
+        for image_id in image_ids:
+            try:
+                with self._volume_locks.acquire(str(image_id), "deferred detach"):
+                    self.detach_now(image_id)
+                    detached += 1
+            except Aborted:
+                logger.debug(f"Image ID {image_id} has an operation in flight, detaching it later")
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Detaching image ID {image_id} from VM ID {vm_id} failed: {error}")
+        return detached
+
+    def hand_off(self) -> list[str]:
+        """
+        Drops the pending detaches of the images whose shard is no longer
+        owned, the caller hands their journal entries over to the new owner
+        :return: The journal entries of the dropped detaches
+        :rtype: list[str]
+        """
+        with self._lock:
+            lost = [image_id for image_id, pending in self._pending.items() if not self._owns(pending.key)]
+            dropped = [self._pending.pop(image_id) for image_id in lost]
+
+        for image_id in lost:
+            logger.info(f"Handing the deferred detach of image ID {image_id} over with its shard")
+        return [pending.entry_id for pending in dropped if pending.entry_id is not None]
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the number of pending detaches and of republished volumes
+        """
+        with self._lock:
+            pending, reclaimed = len(self._pending), self._reclaimed
+        yield metrics.Sample("csi_deferred_detaches_pending", {}, pending)
+        yield metrics.Sample("csi_deferred_detaches_reclaimed_total", {}, reclaimed, "counter")
+
+    def run_once(self) -> None:
+        """
+        Detaches the images whose grace period is over
+        """
+        now = time.time()
+        with self._lock:
+            due = [image_id for image_id, pending in self._pending.items() if pending.due <= now]
+
+        for image_id in due:
+            if self._stop.is_set():
+                return
+
+            try:
+                with self._volume_locks.acquire(str(image_id), "deferred detach"):
+                    with self._lock:
+                        pending = self._pending.get(image_id)
+                        if pending is None or pending.due > now or not self._owns(pending.key):
+                            # The detach of a lost shard waits to be handed over
+                            continue
+                        del self._pending[image_id]
+
+                    try:
+                        logger.info(f"Grace period of image ID {image_id} is over, detaching it "
+                                    f"from VM ID {pending.vm_id}")
+                        self._detach(pending.vm_id, image_id)
+                    except Exception as error:  # pylint: disable=broad-except
+                        logger.error(f"Detaching image ID {image_id} from VM ID {pending.vm_id} failed, "
+                                     f"retrying in {DEFERRED_DETACH_RETRY_INTERVAL}s: {error}")
+                        pending.due = now + DEFERRED_DETACH_RETRY_INTERVAL
+                        with self._lock:
+                            self._pending.setdefault(image_id, pending)
+                        continue
+
+                    self._complete(pending)
+            except Aborted:
+                logger.debug(f"Image ID {image_id} has an operation in flight, detaching it later")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Processing the deferred detaches failed: {error}")
+
+            self._wakeup.clear()
+            with self._lock:
+                next_due = min((pending.due for pending in self._pending.values()), default=None)
+
+            if next_due is None:
+                self._wakeup.wait()
+            else:
+                # Due detaches of locked volumes are retried after a short pause
+                self._wakeup.wait(max(next_due - time.time(), DEFERRED_DETACH_MIN_WAIT))
+
+    def _complete(self, pending: _PendingDetach) -> None:
+        if pending.entry_id is not None:
+            self._journal.complete(pending.entry_id)
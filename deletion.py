@@ -0,0 +1,196 @@
+"""
+Asynchronous deletion of the images of deleted volumes
+"""
+import logging
+import threading
+import time
+
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+import pyone
+
+import constant
+import metrics
+import pool_decoder
+
+logger = logging.getLogger("Deletion")
+
+IMAGE_STATE_DELETE = 7
+DELETION_MAX_WORKERS = 16
+DELETION_POLL_INTERVAL = 1
+DELETION_BACKOFF_BASE = 5
+DELETION_BACKOFF_MAX = 300
+
+
+def is_tombstoned(image_name: str) -> bool:
+    """
+    Tells whether an image has been marked for deletion
+    """
+    return image_name.startswith(constant.DELETED_IMAGE_NAME_PREFIX)
+
+
+@dataclass
+class _PendingDeletion:
+    datastore_id: int
+    attempts: int = 0
+    due: float = 0.0
+    running: bool = False
+
+
+class DeletionPipeline:
+    """
+    DeleteVolume only marks the image for deletion by renaming it, which is
+    quick and idempotent, and hands it over to this pipeline. The images are
+    deleted in the background with a bounded number of deletions in flight
+    per datastore, backing off while VMs still use them. Since the mark is
+    kept by OpenNebula, the pending deletions are found again by scanning
+    the image pool after a restart.
+    """
+
+    def __init__(self,
+                 one_api,
+                 list_images: Callable[[], list[pool_decoder.ImageRecord]],
+                 owns_datastore: Callable[[int], bool],
+                 concurrency_per_datastore: int = 2,
+                 rescan_interval: float = 300):
+        self._one_api = one_api
+        self._list_images = list_images
+        self._owns_datastore = owns_datastore
+        self._concurrency_per_datastore = concurrency_per_datastore
+        self._rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._pending: dict[int, _PendingDeletion] = {}
+        self._running: dict[int, int] = {}
+        self._deleted = 0
+        self._retries = 0
+        self._executor = futures.ThreadPoolExecutor(max_workers=DELETION_MAX_WORKERS, thread_name_prefix="deletion")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="deletion", daemon=True)
+
+    def start(self) -> None:
+        """
+        Starts deleting the marked images, including the ones marked before
+        a restart
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops scheduling deletions, the marked images are picked up again
+        after the next start
+        """
+        self._stop.set()
+        self._wakeup.set()
+
+    def tombstone(self, image_id: int) -> None:
+        """
+        Marks an image for deletion and queues it
+        :raises pyone.OneNoExistsException: If the image does not exist
+        """
+        image = self._one_api.image.info(image_id)
+        if not is_tombstoned(image.get_NAME()):
+            logger.info(f"Marking image ID {image_id} ({image.get_NAME()}) for deletion")
+            self._one_api.image.rename(image_id, f"{constant.DELETED_IMAGE_NAME_PREFIX}{image.get_NAME()}")
+
+        with self._lock:
+            self._pending.setdefault(image_id, _PendingDeletion(datastore_id=int(image.get_DATASTORE_ID())))
+        self._wakeup.set()
+
+    def pending(self) -> list[dict]:
+        """
+        Returns the images waiting to be deleted
+        """
+        with self._lock:
+            return [
+                {"image_id": image_id, "datastore_id": pending.datastore_id, "attempts": pending.attempts}
+                for image_id, pending in self._pending.items()
+            ]
+
+    def rescan(self) -> None:
+        """
+        Queues the marked images found in the image pool
+        """
+        images = [
+            image for image in self._list_images()
+            if is_tombstoned(image.name) and image.state != IMAGE_STATE_DELETE
+        ]
+
+        with self._lock:
+            for image in images:
+                if image.id not in self._pending:
+                    logger.info(f"Found image ID {image.id} marked for deletion")
+                    self._pending[image.id] = _PendingDeletion(datastore_id=image.datastore_id)
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the pending deletions per datastore and the deletion counters
+        """
+        with self._lock:
+            pending_per_datastore = {}
+            for pending in self._pending.values():
+                pending_per_datastore[pending.datastore_id] = pending_per_datastore.get(pending.datastore_id, 0) + 1
+            deleted, retries = self._deleted, self._retries
+
+        for datastore_id, count in pending_per_datastore.items():
+            yield metrics.Sample("csi_volume_deletions_pending", {"datastore_id": str(datastore_id)}, count)
+        yield metrics.Sample("csi_volume_deletions_total", {}, deleted, "counter")
+        yield metrics.Sample("csi_volume_deletion_retries_total", {}, retries, "counter")
+
+    def _run(self) -> None:
+        next_rescan = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_rescan:
+                try:
+                    self.rescan()
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.error(f"Scanning the image pool for images marked for deletion failed: {error}")
+                next_rescan = time.monotonic() + self._rescan_interval
+
+            self._dispatch()
+            self._wakeup.wait(DELETION_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for image_id, pending in self._pending.items():
+                if (pending.running or pending.due > now
+                        or self._running.get(pending.datastore_id, 0) >= self._concurrency_per_datastore
+                        or not self._owns_datastore(pending.datastore_id)):
+                    continue
+
+                pending.running = True
+                self._running[pending.datastore_id] = self._running.get(pending.datastore_id, 0) + 1
+                self._executor.submit(self._delete, image_id, pending)
+
+    def _delete(self, image_id: int, pending: _PendingDeletion) -> None:
+        deleted = False
+        try:
+            logger.debug(f"Deleting image ID {image_id} from datastore ID {pending.datastore_id}")
+            self._one_api.image.delete(image_id)
+            deleted = True
+        except pyone.OneNoExistsException:
+            deleted = True
+        except pyone.OneActionException as error:
+            if "VMs using it" in str(error):
+                logger.info(f"Image ID {image_id} is still used by a VM, retrying its deletion later")
+            else:
+                logger.error(f"Deleting image ID {image_id} failed: {error}")
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error(f"Deleting image ID {image_id} failed: {error}")
+        finally:
+            with self._lock:
+                pending.running = False
+                self._running[pending.datastore_id] -= 1
+                if deleted:
+                    self._pending.pop(image_id, None)
+                    self._deleted += 1
+                else:
+                    pending.attempts += 1
+                    pending.due = time.monotonic() + min(DELETION_BACKOFF_BASE * 2 ** (pending.attempts - 1),
+                                                         DELETION_BACKOFF_MAX)
+                    self._retries += 1
+            self._wakeup.set()
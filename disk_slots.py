@@ -0,0 +1,87 @@
+"""
+Works out how many volumes can be attached to a VM from its template
+"""
+import logging
+import re
+
+import constant
+
+logger = logging.getLogger("DiskSlots")
+
+
+def get_vm_disks(vm_template: dict) -> list[dict]:
+    """
+    Returns the DISK entries of a VM template as a list, pyone returns a
+    single dictionary when the VM has only one disk
+    """
+    disks = vm_template.get("DISK", [])
+    if isinstance(disks, dict):
+        return [disks]
+    return list(disks)
+
+
+def get_dev_prefix(target: str) -> str:
+    """
+    Returns the device prefix of a disk target, e.g. vd for vdb
+    """
+    match = re.match(r"^([a-z]+?)[a-z]$", target)
+    return match.group(1) if match else target
+
+
+def count_free_disk_slots(vm: dict, dev_prefix: str = "") -> int:
+    """
+    Counts the disk targets still available for volumes on a VM
+    :param vm: The VM as returned by one_api.get_vm
+    :param dev_prefix: Device prefix of the volumes, defaults to the prefix
+                       of the VM's first disk
+    :return: The number of volumes which can be attached, at least 1 since
+             CSI reads 0 as no limit
+    :rtype: int
+    """
+    user_template = vm["USER_TEMPLATE"] or {}
+    if constant.MAX_VOLUMES_USER_TEMPLATE_ATTRIBUTE in user_template:
+        override = str(user_template[constant.MAX_VOLUMES_USER_TEMPLATE_ATTRIBUTE]).strip()
+        if override.isdigit() and int(override) > 0:
+            logger.info(f"VM {vm['ID']} overrides the volume limit to {override}")
+            return int(override)
+        logger.warning(f"Ignoring the invalid {constant.MAX_VOLUMES_USER_TEMPLATE_ATTRIBUTE} {override!r} "
+                       f"of VM {vm['ID']}, it must be a positive integer")
+
+    free_slots = _count_free_slots(vm, dev_prefix)
+    if free_slots < 1:
+        logger.warning(f"VM {vm['ID']} has no disk target left for volumes, advertising a limit of 1 "
+                       f"since 0 would mean no limit")
+        return 1
+    return free_slots
+
+
+def _count_free_slots(vm: dict, dev_prefix: str) -> int:
+    vm_template = vm["TEMPLATE"]
+    disks = get_vm_disks(vm_template)
+
+    if not dev_prefix:
+        if not disks:
+            logger.warning(f"VM {vm['ID']} has no disks to derive the device prefix from")
+            return constant.DEFAULT_MAX_VOLUMES_PER_NODE
+        dev_prefix = get_dev_prefix(disks[0]["TARGET"])
+
+    if dev_prefix not in constant.MAX_DISKS_PER_DEV_PREFIX:
+        logger.warning(f"Unknown device prefix {dev_prefix}, "
+                       f"using the default limit of {constant.DEFAULT_MAX_VOLUMES_PER_NODE} volumes")
+        return constant.DEFAULT_MAX_VOLUMES_PER_NODE
+
+    # The volatile disks of ephemeral volumes are not counted by Kubernetes
+    # against the limit, so they take targets away from the volumes
+    used_targets = [
+        disk["TARGET"] for disk in disks
+        if not disk.get("IMAGE", "").startswith(constant.CSI_VOLUME_NAME_PREFIX)
+    ]
+    if "CONTEXT" in vm_template and "TARGET" in vm_template["CONTEXT"]:
+        used_targets.append(vm_template["CONTEXT"]["TARGET"])
+
+    used_slots = len([target for target in used_targets if get_dev_prefix(target) == dev_prefix])
+    free_slots = max(constant.MAX_DISKS_PER_DEV_PREFIX[dev_prefix] - used_slots, 0)
+
+    logger.info(f"VM {vm['ID']} uses {used_slots} of the {constant.MAX_DISKS_PER_DEV_PREFIX[dev_prefix]} "
+                f"{dev_prefix} disk targets for the OS and ephemeral volumes, {free_slots} are left for volumes")
+    return free_slots
@@ -0,0 +1,203 @@
+"""
+Routing of the OpenNebula API calls between the frontends of an HA setup
+"""
+import logging
+import threading
+import xml.etree.ElementTree as ElementTree
+import xmlrpc.client
+
+from typing import Callable, Iterable, Optional
+
+import metrics
+import one_api
+
+logger = logging.getLogger("Endpoints")
+
+RAFT_STATE_SOLO = 0
+RAFT_STATE_LEADER = 3
+RAFT_STATE_NAMES = {0: "solo", 1: "candidate", 2: "follower", 3: "leader"}
+READ_ONLY_METHOD_SUFFIXES = (".info", ".infoextended", ".monitoring", ".raftstatus")
+HEALTH_CHECK_TIMEOUT = 5
+
+
+def is_read_only(method: str) -> bool:
+    """
+    Tells whether an OpenNebula method only reads state, so that it can be
+    served by a follower and retried after any connection error
+    """
+    return method.endswith(READ_ONLY_METHOD_SUFFIXES)
+
+
+class EndpointSet:
+    """
+    Tracks the Raft state of the OpenNebula frontends with periodic health
+    checks. Writes are sent to the leader and reads optionally spread over
+    the followers. A call failing with a connection error marks its endpoint
+    unhealthy and is retried on the next one: reads always, writes only when
+    the connection was refused, since the call has not reached oned then.
+    """
+
+    def __init__(self,
+                 endpoints: list[str],
+                 auth: str,
+                 health_interval: float = 10.0,
+                 read_from_followers: bool = False):
+        self.endpoints = endpoints
+        self._auth = auth
+        self._health_interval = health_interval
+        self._read_from_followers = read_from_followers
+        self._lock = threading.Lock()
+        self._states: dict[str, Optional[int]] = {endpoint: None for endpoint in endpoints}
+        self._leader: Optional[str] = endpoints[0] if len(endpoints) == 1 else None
+        self._active: Optional[str] = self._leader
+        self._next_reader = 0
+        self._failovers = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="endpoints", daemon=True)
+
+    def start(self) -> None:
+        """
+        Finds the leader and starts the periodic health checks, unless there
+        is a single endpoint
+        """
+        if len(self.endpoints) > 1:
+            self.check_health()
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the health checks
+        """
+        self._stop.set()
+
+    def leader(self) -> str:
+        """
+        Returns the endpoint receiving the writes
+        """
+        with self._lock:
+            leader = self._leader
+        if leader is None:
+            self.check_health()
+            with self._lock:
+                leader = self._leader or self.endpoints[0]
+        return leader
+
+    def reader(self) -> str:
+        """
+        Returns the endpoint receiving the next read
+        """
+        if not self._read_from_followers:
+            return self.leader()
+
+        with self._lock:
+            healthy = [endpoint for endpoint, state in self._states.items() if state is not None]
+            if healthy:
+                self._next_reader = (self._next_reader + 1) % len(healthy)
+                return healthy[self._next_reader]
+        return self.leader()
+
+    def route(self, send: Callable[[str], object], read_only: bool):
+        """
+        Sends a request to the right endpoint, failing over to the others
+        :param send: Callable sending the request to the endpoint it is given
+        :param read_only: Whether the request only reads state
+        :return: The value returned by send
+        """
+        last_error = None
+        for _ in self.endpoints:
+            endpoint = self.reader() if read_only else self.leader()
+            try:
+                return send(endpoint)
+            except (OSError, xmlrpc.client.ProtocolError) as error:
+                if not read_only and not isinstance(error, ConnectionRefusedError):
+                    raise
+                logger.warning(f"OpenNebula endpoint {endpoint} failed: {error}")
+                self._mark_unhealthy(endpoint)
+                last_error = error
+        raise last_error
+
+    def call(self, auth: str, method: str, *args):
+        """
+        Calls an OpenNebula XML-RPC method on the right endpoint, see
+        one_api.call
+        """
+        return self.route(lambda endpoint: one_api.call(endpoint, auth, method, *args), is_read_only(method))
+
+    def check_health(self) -> None:
+        """
+        Reads the Raft state of every endpoint and elects the leader. An
+        endpoint in the solo state (no HA) is a leader too.
+        """
+        states = {endpoint: self._raft_state(endpoint) for endpoint in self.endpoints}
+        leaders = [endpoint for endpoint, state in states.items() if state in (RAFT_STATE_LEADER, RAFT_STATE_SOLO)]
+        healthy = [endpoint for endpoint, state in states.items() if state is not None]
+
+        with self._lock:
+            self._states = states
+            leader = leaders[0] if leaders else (healthy[0] if healthy else None)
+            if leader is not None:
+                if leader != self._active:
+                    if self._active is not None:
+                        self._failovers += 1
+                    logger.info(f"OpenNebula endpoint {leader} is now the leader")
+                    self._active = leader
+                self._leader = leader
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the state of the endpoints, the active one and the number of
+        failovers
+        """
+        with self._lock:
+            states, leader, failovers = dict(self._states), self._active, self._failovers
+
+        for endpoint, state in states.items():
+            labels = {"endpoint": endpoint, "state": RAFT_STATE_NAMES.get(state, "unreachable")}
+            yield metrics.Sample("csi_one_api_endpoint_up", labels, int(state is not None or endpoint == leader))
+            yield metrics.Sample("csi_one_api_endpoint_active", {"endpoint": endpoint}, int(endpoint == leader))
+        yield metrics.Sample("csi_one_api_failovers_total", {}, failovers, "counter")
+
+    def _mark_unhealthy(self, endpoint: str) -> None:
+        with self._lock:
+            self._states[endpoint] = None
+            if endpoint == self._leader and len(self.endpoints) > 1:
+                self._leader = None
+
+    def _raft_state(self, endpoint: str) -> Optional[int]:
+        transport_class = _SafeTimeoutTransport if endpoint.startswith("https") else _TimeoutTransport
+        try:
+            proxy = xmlrpc.client.ServerProxy(endpoint, transport=transport_class(HEALTH_CHECK_TIMEOUT))
+            raft = ElementTree.fromstring(one_api.unwrap_response(proxy.one.zone.raftstatus(self._auth)))
+            return int(raft.findtext("STATE", str(RAFT_STATE_SOLO)))
+        except (OSError, ValueError, ElementTree.ParseError, xmlrpc.client.Error, one_api.OneApiError) as error:
+            logger.warning(f"Health check of OpenNebula endpoint {endpoint} failed: {error}")
+            return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._health_interval):
+            try:
+                self.check_health()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Checking the OpenNebula endpoints failed: {error}")
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout: float):
+        super().__init__()
+        self._timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self._timeout
+        return connection
+
+
+class _SafeTimeoutTransport(xmlrpc.client.SafeTransport):
+    def __init__(self, timeout: float):
+        super().__init__()
+        self._timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self._timeout
+        return connection
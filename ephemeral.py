@@ -0,0 +1,239 @@
+"""
+Ephemeral inline volumes backed by volatile disks hot-attached to the node's
+own VM
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+from contextlib import contextmanager
+from math import ceil
+from pathlib import Path
+from typing import Iterable, Optional
+
+from grpc_interceptor.exceptions import FailedPrecondition, Internal, ResourceExhausted
+
+import constant
+import deadlines
+import disk_slots
+import metrics
+import one_api
+
+logger = logging.getLogger("Ephemeral")
+
+EPHEMERAL_VOLUME_CONTEXT_KEY = "csi.storage.k8s.io/ephemeral"
+HOTPLUG_POLL_INTERVAL = 1
+VM_LCM_STATE_RUNNING = 3
+QUANTITY_SUFFIXES = {
+    "": 1,
+    "k": 1000, "M": 1000 ** 2, "G": 1000 ** 3, "T": 1000 ** 4, "P": 1000 ** 5,
+    "Ki": 1024, "Mi": 1024 ** 2, "Gi": 1024 ** 3, "Ti": 1024 ** 4, "Pi": 1024 ** 5,
+}
+
+
+def is_ephemeral(volume_context) -> bool:
+    """
+    Whether the kubelet publishes an inline volume of a pod spec
+    """
+    return volume_context.get(EPHEMERAL_VOLUME_CONTEXT_KEY) == "true"
+
+
+def parse_size_mib(quantity: str) -> int:
+    """
+    Converts a Kubernetes quantity, e.g. 10Gi, to MiB rounded up
+    :raises ValueError: If the quantity is malformed
+    """
+    match = re.fullmatch(r"(\d+)([A-Za-z]*)", quantity.strip())
+    if not match or match.group(2) not in QUANTITY_SUFFIXES:
+        raise ValueError(f"Invalid quantity {quantity}")
+    return max(ceil(int(match.group(1)) * QUANTITY_SUFFIXES[match.group(2)] / 1024 ** 2), 1)
+
+
+class EphemeralDisks:
+    """
+    Hot-attaches a volatile disk to the node's VM for every ephemeral inline
+    volume and detaches it, which makes OpenNebula discard it, when the volume
+    is unpublished. No image is allocated in a datastore. The hotplugs of the
+    VM are bounded, since OpenNebula processes them one at a time anyway and
+    rejects the ones arriving while the VM is in the HOTPLUG state. The disks
+    are recorded in the state directory before they are attached, so that a
+    disk attached right before a restart of the node plugin is found again.
+    """
+
+    def __init__(self,
+                 one_api_endpoint,
+                 one_api_auth: str,
+                 vm_id: int,
+                 state_dir: str,
+                 max_concurrent_hotplugs: int = 1,
+                 dev_prefix: str = ""):
+        self._one_api_endpoint = one_api_endpoint
+        self._one_api_auth = one_api_auth
+        self._vm_id = vm_id
+        self._state_dir = Path(state_dir) / "ephemeral"
+        self._dev_prefix = dev_prefix
+        self._hotplugs = threading.BoundedSemaphore(max_concurrent_hotplugs)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether the node plugin can reach OpenNebula to attach volatile disks
+        """
+        return bool(self._one_api_endpoint)
+
+    def attach(self, volume_id: str, size_mib: int, disk_format: str, deadline: deadlines.Deadline) -> str:
+        """
+        Attaches the volatile disk of an ephemeral volume, if it is not
+        attached yet. The caller holds the volume lock.
+        :return: The device path of the disk
+        :raises ResourceExhausted: If the hotplugs in flight did not let this
+                                   one run before the deadline
+        """
+        if not self.enabled:
+            error_message = (f"Ephemeral volume {volume_id} needs a volatile disk but the OpenNebula API "
+                             f"endpoint of the node plugin is not configured")
+            logger.error(error_message)
+            raise FailedPrecondition(error_message)
+
+        state = self._load(volume_id)
+        if state is None or state.get("target") is None:
+            if state is None:
+                self._save(volume_id, {"size_mib": size_mib, "format": disk_format})
+
+            with self._hotplug(f"attach of ephemeral volume {volume_id}", deadline):
+                disk = self._find_disk(volume_id)
+                if disk is None:
+                    logger.info(f"Attaching a {size_mib} MiB {disk_format} volatile disk to VM ID {self._vm_id} "
+                                f"for ephemeral volume {volume_id}")
+                    attributes = {
+                        "TYPE": "fs",
+                        "SIZE": size_mib,
+                        "FORMAT": disk_format,
+                        **({"DEV_PREFIX": self._dev_prefix} if self._dev_prefix else {}),
+                        constant.EPHEMERAL_DISK_ATTRIBUTE: volume_id,
+                    }
+                    self._call_vm_action("one.vm.attach",
+                                         "DISK = [ " + ", ".join(f'{name} = "{value}"'
+                                                                 for name, value in attributes.items()) + " ]",
+                                         deadline=deadline)
+                    disk = self._wait_hotplug(volume_id, attached=True, deadline=deadline)
+
+            state = {"size_mib": size_mib, "format": disk_format,
+                     "disk_id": int(disk["DISK_ID"]), "target": disk["TARGET"]}
+            self._save(volume_id, state)
+
+        device_path = f"/dev/{state['target']}"
+        while not Path(device_path).is_block_device():
+            logger.debug(f"Waiting for device {device_path} of ephemeral volume {volume_id} to appear")
+            deadline.sleep(HOTPLUG_POLL_INTERVAL, f"waiting for device {device_path}")
+        return device_path
+
+    def detach(self, volume_id: str, deadline: deadlines.Deadline) -> bool:
+        """
+        Detaches and discards the volatile disk of an ephemeral volume. The
+        caller holds the volume lock.
+        :return: Whether the volume was an ephemeral one
+        """
+        state = self._load(volume_id)
+        if state is None:
+            return False
+
+        with self._hotplug(f"detach of ephemeral volume {volume_id}", deadline):
+            disk = self._find_disk(volume_id)
+            if disk is not None:
+                logger.info(f"Detaching volatile disk {disk['DISK_ID']} of ephemeral volume {volume_id} "
+                            f"from VM ID {self._vm_id}")
+                self._call_vm_action("one.vm.detach", int(disk["DISK_ID"]), deadline=deadline)
+                self._wait_hotplug(volume_id, attached=False, deadline=deadline)
+
+        os.unlink(self._state_file(volume_id))
+        return True
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the number of ephemeral volumes and of hotplugs in flight
+        """
+        volumes = len(list(self._state_dir.glob("*.json"))) if self._state_dir.exists() else 0
+        with self._lock:
+            in_flight, rejected = self._in_flight, self._rejected
+        yield metrics.Sample("csi_ephemeral_volumes", {}, volumes)
+        yield metrics.Sample("csi_ephemeral_hotplugs_in_flight", {}, in_flight)
+        yield metrics.Sample("csi_ephemeral_hotplugs_rejected_total", {}, rejected, "counter")
+
+    @contextmanager
+    def _hotplug(self, description: str, deadline: deadlines.Deadline):
+        """
+        Holds a hotplug slot of the VM for the duration of the context
+        """
+        deadline.check(description)
+        if not self._hotplugs.acquire(timeout=deadline.remaining()):
+            with self._lock:
+                self._rejected += 1
+            error_message = f"Too many disk hotplugs in flight on VM ID {self._vm_id}, rejecting the {description}"
+            logger.warning(error_message)
+            raise ResourceExhausted(error_message)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._hotplugs.release()
+
+    def _call_vm_action(self, method: str, *args, deadline: deadlines.Deadline) -> None:
+        # Hotplugs of the controller on the same VM make OpenNebula reject
+        # ours until the VM is back to RUNNING
+        for i in range(1, 6):
+            try:
+                one_api.call(self._one_api_endpoint, self._one_api_auth, method, self._vm_id, *args)
+                return
+            except one_api.OneApiError as error:
+                if "wrong state" not in str(error) or i == 5:
+                    logger.error(f"{method} on VM ID {self._vm_id} failed: {error}")
+                    raise Internal(str(error))
+                deadline.sleep(i, f"calling {method}")
+
+    def _wait_hotplug(self, volume_id: str, attached: bool, deadline: deadlines.Deadline) -> Optional[dict]:
+        while True:
+            vm = one_api.get_vm(self._one_api_endpoint, self._one_api_auth, self._vm_id)
+            disk = self._volume_disk(vm, volume_id)
+            if vm["LCM_STATE"] == VM_LCM_STATE_RUNNING:
+                if (disk is not None) == attached:
+                    return disk
+                error_message = (f"VM ID {self._vm_id} is running again but the volatile disk of ephemeral "
+                                 f"volume {volume_id} is {'missing' if attached else 'still attached'}")
+                logger.error(error_message)
+                raise Internal(error_message)
+            deadline.sleep(HOTPLUG_POLL_INTERVAL, f"waiting for the hotplug of ephemeral volume {volume_id}")
+
+    def _find_disk(self, volume_id: str) -> Optional[dict]:
+        return self._volume_disk(one_api.get_vm(self._one_api_endpoint, self._one_api_auth, self._vm_id), volume_id)
+
+    @staticmethod
+    def _volume_disk(vm: dict, volume_id: str) -> Optional[dict]:
+        return next((disk for disk in disk_slots.get_vm_disks(vm["TEMPLATE"])
+                     if disk.get(constant.EPHEMERAL_DISK_ATTRIBUTE) == volume_id), None)
+
+    def _load(self, volume_id: str) -> Optional[dict]:
+        state_file = self._state_file(volume_id)
+        if not state_file.exists():
+            return None
+        with open(state_file) as file:
+            return json.load(file)
+
+    def _save(self, volume_id: str, state: dict) -> None:
+        self._state_dir.mkdir(parents=True, exist_ok=True)
+        temporary_file = self._state_file(volume_id).with_suffix(".tmp")
+        with open(temporary_file, "w") as file:
+            json.dump(state, file)
+        os.replace(temporary_file, self._state_file(volume_id))
+
+    def _state_file(self, volume_id: str) -> Path:
+        return self._state_dir / f"{volume_id}.json"
@@ -0,0 +1,38 @@
+"""
+pyone server routing its calls between the frontends of an HA setup. Kept
+apart from endpoints, so that a node-only process never loads pyone.
+"""
+from importlib import metadata
+
+import pyone
+
+import endpoints
+
+# pyone 7 turned OneServer into a factory of XML-RPC and gRPC servers
+SUPPORTED_PYONE_VERSIONS = ("6.",)
+
+
+class FailoverServer(pyone.OneServer):
+    """
+    pyone server sending every raw XML-RPC request through the EndpointSet to
+    the pyone server of the chosen endpoint. pyone still casts the parameters,
+    adds the session and parses the response; only _do_request, the hook
+    pyone's own OneServerTester overrides, is replaced, so the pyone version
+    is checked when the server is created.
+    """
+
+    def __init__(self, endpoint_set: endpoints.EndpointSet, session: str):
+        version = metadata.version("pyone")
+        if not version.startswith(SUPPORTED_PYONE_VERSIONS):
+            raise RuntimeError(f"pyone {version} is not supported, the OpenNebula failover needs pyone "
+                               f"{' or '.join(prefix + 'x' for prefix in SUPPORTED_PYONE_VERSIONS)}")
+
+        super().__init__(endpoint_set.endpoints[0], session)
+        self._endpoint_set = endpoint_set
+        self._servers = {endpoint: pyone.OneServer(endpoint, session) for endpoint in endpoint_set.endpoints}
+
+    def _do_request(self, method, params):
+        return self._endpoint_set.route(
+            lambda endpoint: self._servers[endpoint]._do_request(method, params),  # pylint: disable=protected-access
+            endpoints.is_read_only(method),
+        )
@@ -0,0 +1,95 @@
+"""
+Progress of the datasets imported into new volumes by OpenNebula
+"""
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import metrics
+
+logger = logging.getLogger("ImageImport")
+
+
+@dataclass
+class _Import:
+    source: str
+    started: float
+    state: int = -1
+
+
+class ImportTracker:
+    """
+    Follows the images which oned and the datastore drivers are filling from
+    a URL or a marketplace app. OpenNebula does not report how much data has
+    been copied, so the progress of an import is its image state and the time
+    spent so far. An import found again after a restart of the controller is
+    timed from then on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._imports: dict[int, _Import] = {}
+        self._completed = 0
+        self._failed = 0
+
+    def begin(self, image_id: int, source: str) -> None:
+        """
+        Starts following the import of an image, if it is not already
+        """
+        with self._lock:
+            if image_id in self._imports:
+                return
+            self._imports[image_id] = _Import(source=source, started=time.monotonic())
+        logger.info(f"Importing {source} into image ID {image_id}")
+
+    def progress(self, image_id: int, state: int) -> Optional[float]:
+        """
+        Records the last seen state of an image
+        :return: The time spent importing the image in seconds, None if the
+                 image is not being imported
+        """
+        with self._lock:
+            pending = self._imports.get(image_id)
+            if pending is None:
+                return None
+            pending.state = state
+            return time.monotonic() - pending.started
+
+    def end(self, image_id: int, succeeded: bool) -> None:
+        """
+        Stops following the import of an image once it is ready or failed
+        """
+        with self._lock:
+            pending = self._imports.pop(image_id, None)
+            if pending is None:
+                return
+            if succeeded:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+        elapsed = time.monotonic() - pending.started
+        if succeeded:
+            logger.info(f"Imported {pending.source} into image ID {image_id} in {elapsed:.0f}s")
+        else:
+            logger.error(f"Importing {pending.source} into image ID {image_id} failed after {elapsed:.0f}s")
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the time spent by every import in flight and the number of
+        finished imports
+        """
+        now = time.monotonic()
+        with self._lock:
+            imports = [(image_id, pending.state, now - pending.started) for image_id, pending in self._imports.items()]
+            completed, failed = self._completed, self._failed
+        yield metrics.Sample("csi_volume_imports_in_progress", {}, len(imports))
+        for image_id, state, elapsed in imports:
+            yield metrics.Sample("csi_volume_import_elapsed_seconds",
+                                 {"image_id": str(image_id), "state": str(state)},
+                                 round(elapsed, 1))
+        yield metrics.Sample("csi_volume_imports_total", {"result": "ready"}, completed, "counter")
+        yield metrics.Sample("csi_volume_imports_total", {"result": "error"}, failed, "counter")
@@ -0,0 +1,283 @@
+"""
+Append-only journal of the multi-step controller operations
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger("Journal")
+
+COMPACTION_THRESHOLD = 1024 * 1024
+JOURNAL_SUFFIX = ".log"
+LOCK_SUFFIX = ".lock"
+HANDOFF_PREFIX = "handoff-"
+
+
+class OperationJournal:
+    """
+    Records the intent of a multi-step operation before its first step and
+    its completion after the last one, so that the operations interrupted by
+    a crash can be finished or rolled back later. Appends from concurrent
+    operations are written and fsync'd in batches.
+
+    Every controller replica appends to its own journal in a directory shared
+    by the replicas, and holds a lock on it while running. An entry records
+    the shard key of its volume: the entries of a journal which nobody holds
+    any more are adopted by the replicas owning their shards, and a replica
+    losing a shard hands its entries over in a journal of their own, which
+    nobody holds either. The entries found on startup or adopted are
+    orphaned until a replica claims them to finish their operation.
+    """
+
+    def __init__(self, path: str):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = _lock(self._path, blocking=False)
+        if self._lock_file is None:
+            logger.warning(f"Journal {self._path} is locked, waiting for the replica adopting its entries")
+            self._lock_file = _lock(self._path, blocking=True)
+        self._pending = _load(self._path)
+        self._orphaned = set(self._pending)
+        _write_entries(self._path, self._pending.values())
+        self._file = open(self._path, "a")
+        self._condition = threading.Condition()
+        self._queue: list[str] = []
+        self._appended = 0
+        self._durable = 0
+        self._flushing = False
+
+    def close(self) -> None:
+        """
+        Closes the journal and releases its lock, after which its pending
+        entries can be adopted by another replica
+        """
+        with self._condition:
+            self._file.close()
+            self._lock_file.close()
+
+    def orphaned(self) -> list[dict]:
+        """
+        Returns the entries which were found on startup or adopted from
+        another journal and are not claimed by an operation in flight
+        """
+        with self._condition:
+            return [self._pending[entry_id] for entry_id in self._orphaned]
+
+    def claim(self, entry_id: str) -> bool:
+        """
+        Takes an orphaned entry for an operation finishing it
+        :return: Whether the entry was orphaned, False if it was claimed or
+                 completed in the meantime
+        :rtype: bool
+        """
+        with self._condition:
+            if entry_id not in self._orphaned:
+                return False
+            self._orphaned.discard(entry_id)
+            return True
+
+    def disown(self, entry_id: str) -> None:
+        """
+        Gives up an entry whose operation could not be finished, so that it
+        is retried later, possibly by another replica
+        """
+        with self._condition:
+            if entry_id in self._pending:
+                self._orphaned.add(entry_id)
+
+    def begin(self, operation: str, key: Optional[str] = None, **arguments) -> str:
+        """
+        Durably records the intent of an operation
+        :param operation: Name of the operation
+        :param key: Shard key of the volume of the operation
+        :param arguments: Everything needed to finish or roll it back
+        :return: The ID of the journal entry
+        :rtype: str
+        """
+        entry = {"id": uuid.uuid4().hex, "operation": operation, "key": key, "arguments": arguments}
+        with self._condition:
+            self._pending[entry["id"]] = entry
+        self._append({"begin": entry})
+        return entry["id"]
+
+    def complete(self, entry_id: str) -> None:
+        """
+        Durably records that an operation is finished or rolled back
+        """
+        self._append({"complete": entry_id})
+        with self._condition:
+            self._pending.pop(entry_id, None)
+            self._orphaned.discard(entry_id)
+            if (not self._pending and not self._queue and not self._flushing
+                    and self._file.tell() > COMPACTION_THRESHOLD):
+                self._file.truncate(0)
+                self._file.seek(0)
+
+    def hand_off(self, entry_ids: list[str]) -> None:
+        """
+        Moves pending entries to a new journal in the same directory, for
+        the replicas owning their shards to adopt. The entries are durably
+        written there before they are completed here.
+        """
+        with self._condition:
+            entries = [self._pending[entry_id] for entry_id in entry_ids if entry_id in self._pending]
+        if not entries:
+            return
+
+        path = self._path.parent / f"{HANDOFF_PREFIX}{uuid.uuid4().hex}{JOURNAL_SUFFIX}"
+        _write_entries(path, entries)
+        logger.info(f"Handed {len(entries)} pending operations over in journal {path}")
+        for entry in entries:
+            self.complete(entry["id"])
+
+    def adopt(self, owns: Callable[[Optional[str]], bool]) -> int:
+        """
+        Moves the entries of the owned shards from the journals in the same
+        directory which no running replica holds into this one. An entry is
+        durably recorded here before it is removed from the other journal.
+        :param owns: Tells whether this replica owns a shard key
+        :return: The number of adopted entries
+        :rtype: int
+        """
+        adopted = 0
+        for path in sorted(self._path.parent.glob(f"*{JOURNAL_SUFFIX}")):
+            if path == self._path:
+                continue
+
+            lock_file = _lock(path, blocking=False)
+            if lock_file is None:
+                continue
+
+            try:
+                entries = _load(path)
+                with self._condition:
+                    taken = [entry for entry in entries.values()
+                             if owns(entry.get("key")) and entry["id"] not in self._pending]
+                    duplicates = [entry_id for entry_id in entries if entry_id in self._pending]
+                    for entry in taken:
+                        self._pending[entry["id"]] = entry
+                try:
+                    for entry in taken:
+                        self._append({"begin": entry})
+                except Exception:
+                    # The other journal still has the entries, forget them
+                    # so that they are not taken for duplicates next time
+                    with self._condition:
+                        for entry in taken:
+                            self._pending.pop(entry["id"], None)
+                    raise
+                with self._condition:
+                    self._orphaned.update(entry["id"] for entry in taken)
+
+                for entry_id in [entry["id"] for entry in taken] + duplicates:
+                    del entries[entry_id]
+                if taken:
+                    logger.info(f"Adopted {len(taken)} pending operations from journal {path}")
+                adopted += len(taken)
+
+                if entries:
+                    _write_entries(path, entries.values())
+                else:
+                    logger.info(f"Removing journal {path}, it has no pending operations left")
+                    path.unlink()
+                    path.with_suffix(LOCK_SUFFIX).unlink()
+            finally:
+                lock_file.close()
+
+        return adopted
+
+    def _append(self, record: dict) -> None:
+        with self._condition:
+            self._queue.append(json.dumps(record) + "\n")
+            self._appended += 1
+            sequence = self._appended
+
+            while self._durable < sequence:
+                if self._flushing:
+                    self._condition.wait()
+                    continue
+
+                self._flushing = True
+                batch, self._queue = self._queue, []
+                batch_end = self._appended
+                written = False
+                self._condition.release()
+                try:
+                    self._file.write("".join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    written = True
+                finally:
+                    self._condition.acquire()
+                    self._flushing = False
+                    if written:
+                        self._durable = batch_end
+                    else:
+                        # Put the batch back in front of the later records, the
+                        # next flusher retries it and the waiters of this batch
+                        # either see it written or fail their own attempt
+                        self._queue = batch + self._queue
+                    self._condition.notify_all()
+
+
+def _lock(path: Path, blocking: bool):
+    """
+    Locks a journal through the lock file next to it
+    :return: The open lock file, None if the journal is locked and the call
+             is non-blocking
+    """
+    lock_path = path.with_suffix(LOCK_SUFFIX)
+    while True:
+        lock_file = open(lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_file.close()
+            return None
+
+        # The replica adopting the last entries of a journal removes its lock
+        # file, a lock taken on the removed file does not count
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+def _load(path: Path) -> dict:
+    pending = {}
+    if not path.exists():
+        return pending
+
+    with open(path) as journal_file:
+        for line in journal_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring a torn record at the end of {path}")
+                break
+
+            if "begin" in record:
+                pending[record["begin"]["id"]] = record["begin"]
+            else:
+                pending.pop(record["complete"], None)
+
+    logger.info(f"Journal {path} has {len(pending)} pending operations")
+    return pending
+
+
+def _write_entries(path: Path, entries) -> None:
+    temporary_path = path.with_suffix(".tmp")
+    with open(temporary_path, "w") as journal_file:
+        for entry in entries:
+            journal_file.write(json.dumps({"begin": entry}) + "\n")
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    os.replace(temporary_path, path)
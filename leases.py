@@ -0,0 +1,198 @@
+"""
+Lease backends used to coordinate several controller replicas
+"""
+import fcntl
+import json
+import logging
+import os
+import ssl
+import time
+import urllib.error
+import urllib.request
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger("Leases")
+
+
+class LeaseBackend:
+    """
+    Stores named, expiring leases. A lease is held by a single holder until
+    it is released or not renewed within its duration.
+    """
+
+    def try_acquire(self, name: str, holder: str, duration: float) -> bool:
+        """
+        Acquires or renews a lease
+        :param name: Name of the lease
+        :param holder: Identity of the replica acquiring the lease
+        :param duration: Seconds after which the lease expires unless renewed
+        :return: Whether the holder now owns the lease
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def release(self, name: str, holder: str) -> None:
+        """
+        Releases a lease if it is owned by the holder
+        """
+        raise NotImplementedError
+
+    def list(self) -> dict:
+        """
+        Returns all the leases
+        :return: A dictionary mapping lease names to dictionaries with
+                 the holder and the expiration time (epoch seconds)
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+
+class FileLeaseBackend(LeaseBackend):
+    """
+    Keeps the leases in a JSON file guarded by flock(2). Suitable for tests
+    and for replicas sharing a host or a file system.
+    """
+
+    def __init__(self, directory: str):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._state_path = self._directory / "leases.json"
+        self._lock_path = self._directory / "leases.lock"
+
+    def try_acquire(self, name: str, holder: str, duration: float) -> bool:
+        with self._locked() as leases:
+            lease = leases.get(name)
+            now = time.time()
+            if lease and lease["holder"] not in (holder, "") and lease["expires"] > now:
+                return False
+            leases[name] = {"holder": holder, "expires": now + duration}
+            return True
+
+    def release(self, name: str, holder: str) -> None:
+        with self._locked() as leases:
+            if name in leases and leases[name]["holder"] == holder:
+                del leases[name]
+
+    def list(self) -> dict:
+        with self._locked() as leases:
+            return dict(leases)
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._state_path) as state_file:
+                        leases = json.load(state_file)
+                except (OSError, ValueError):
+                    leases = {}
+
+                yield leases
+
+                temporary_path = self._state_path.with_suffix(".tmp")
+                with open(temporary_path, "w") as state_file:
+                    json.dump(leases, state_file)
+                os.replace(temporary_path, self._state_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class KubernetesLeaseBackend(LeaseBackend):
+    """
+    Keeps the leases as coordination.k8s.io/v1 Lease objects, using the
+    in-cluster service account credentials
+    """
+
+    API_SERVER = "https://kubernetes.default.svc"
+    SERVICE_ACCOUNT_PATH = "/var/run/secrets/kubernetes.io/serviceaccount"
+    LABEL = "csi.opennebula.io/controller-lease"
+
+    def __init__(self, namespace: str, prefix: str = "opennebula-csi"):
+        self._namespace = namespace
+        self._prefix = prefix
+        self._ssl_context = ssl.create_default_context(cafile=f"{self.SERVICE_ACCOUNT_PATH}/ca.crt")
+
+    def try_acquire(self, name: str, holder: str, duration: float) -> bool:
+        now = datetime.now(timezone.utc)
+        lease = self._request("GET", self._lease_path(name))
+
+        if lease is None:
+            return self._request("POST", self._collection_path(), {
+                "apiVersion": "coordination.k8s.io/v1",
+                "kind": "Lease",
+                "metadata": {"name": self._object_name(name), "labels": {self.LABEL: self._prefix}},
+                "spec": self._lease_spec(holder, duration, now),
+            }) is not None
+
+        current_holder = lease["spec"].get("holderIdentity", "")
+        if current_holder not in (holder, "") and self._lease_expires(lease) > now.timestamp():
+            return False
+
+        lease["spec"] = self._lease_spec(holder, duration, now)
+        return self._request("PUT", self._lease_path(name), lease) is not None
+
+    def release(self, name: str, holder: str) -> None:
+        lease = self._request("GET", self._lease_path(name))
+        if lease is not None and lease["spec"].get("holderIdentity") == holder:
+            lease["spec"]["holderIdentity"] = ""
+            self._request("PUT", self._lease_path(name), lease)
+
+    def list(self) -> dict:
+        leases = self._request("GET", f"{self._collection_path()}?labelSelector={self.LABEL}%3D{self._prefix}")
+        result = {}
+        for lease in (leases or {}).get("items", []):
+            name = lease["metadata"]["name"][len(self._prefix) + 1:]
+            result[name] = {
+                "holder": lease["spec"].get("holderIdentity", ""),
+                "expires": self._lease_expires(lease),
+            }
+        return result
+
+    def _object_name(self, name: str) -> str:
+        return f"{self._prefix}-{name}"
+
+    def _collection_path(self) -> str:
+        return f"/apis/coordination.k8s.io/v1/namespaces/{self._namespace}/leases"
+
+    def _lease_path(self, name: str) -> str:
+        return f"{self._collection_path()}/{self._object_name(name)}"
+
+    @staticmethod
+    def _lease_spec(holder: str, duration: float, now: datetime) -> dict:
+        return {
+            "holderIdentity": holder,
+            "leaseDurationSeconds": max(int(duration), 1),
+            "renewTime": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        }
+
+    @staticmethod
+    def _lease_expires(lease: dict) -> float:
+        renew_time = lease["spec"].get("renewTime")
+        if not renew_time:
+            return 0.0
+        renewed = datetime.strptime(renew_time, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+        return renewed.timestamp() + lease["spec"].get("leaseDurationSeconds", 0)
+
+    def _request(self, method: str, path: str, body: dict = None):
+        with open(f"{self.SERVICE_ACCOUNT_PATH}/token") as token_file:
+            token = token_file.read().strip()
+
+        request = urllib.request.Request(
+            f"{self.API_SERVER}{path}",
+            method=method,
+            data=json.dumps(body).encode("utf-8") if body is not None else None,
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+        )
+
+        try:
+            with urllib.request.urlopen(request, context=self._ssl_context, timeout=5) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as error:
+            if error.code in (404, 409):
+                # Missing lease or lost an optimistic concurrency race
+                return None
+            raise
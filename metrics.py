@@ -0,0 +1,102 @@
+"""
+Minimal Prometheus text exposition of the driver metrics
+"""
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, NamedTuple
+
+logger = logging.getLogger("Metrics")
+
+
+class Sample(NamedTuple):
+    """
+    A single metric value
+    """
+
+    name: str
+    labels: dict
+    value: float
+    kind: str = "gauge"
+
+
+_collectors: list[Callable[[], Iterable[Sample]]] = []
+_collectors_lock = threading.Lock()
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    """
+    Registers a callable returning the current samples of a component
+    :param collector: Callable returning an iterable of Sample objects
+    """
+    with _collectors_lock:
+        _collectors.append(collector)
+
+
+def escape_label_value(value) -> str:
+    """
+    Escapes a label value as the Prometheus text format requires
+    :param value: The label value, converted to a string
+    :return: The value with backslashes, double quotes and newlines escaped
+    :rtype: str
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    """
+    Renders all registered collectors in the Prometheus text format
+    :return: The metrics page
+    :rtype: str
+    """
+    with _collectors_lock:
+        collectors = list(_collectors)
+
+    families = {}
+    for collector in collectors:
+        try:
+            for sample in collector():
+                families.setdefault(sample.name, []).append(sample)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error(f"Metrics collector {collector} failed: {error}")
+
+    lines = []
+    for name, samples in sorted(families.items()):
+        lines.append(f"# TYPE {name} {samples[0].kind}")
+        for sample in samples:
+            labels = ",".join(
+                f'{key}="{escape_label_value(value)}"' for key, value in sorted(sample.labels.items())
+            )
+            lines.append(f"{name}{{{labels}}} {sample.value}" if labels else f"{name} {sample.value}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+def start_http_server(port: int) -> ThreadingHTTPServer:
+    """
+    Serves the metrics page at /metrics in a background thread
+    :param port: TCP port to listen on
+    :return: The running HTTP server
+    """
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
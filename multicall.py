@@ -0,0 +1,155 @@
+"""
+Batches independent OpenNebula calls into system.multicall requests
+"""
+import logging
+import threading
+import time
+import xmlrpc.client
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Iterable
+
+import endpoints
+import metrics
+import one_api
+
+logger = logging.getLogger("Multicall")
+
+MULTICALL_MAX_BATCH_SIZE = 32
+
+
+class CallGroup:
+    """
+    Independent calls issued together, sent in a single round trip when the
+    group is closed
+    """
+
+    def __init__(self):
+        self.calls: list[tuple[str, tuple, Future]] = []
+
+    def call(self, method: str, *args) -> Future:
+        """
+        Adds a call to the group
+        :return: A future resolved with the value of the call, or failed with
+                 its OneApiError, once the group is sent
+        :rtype: Future
+        """
+        future = Future()
+        self.calls.append((method, args, future))
+        return future
+
+
+class BatchingClient:
+    """
+    Sends OpenNebula calls through system.multicall, so that independent
+    calls cost a single HTTP round trip. Calls can be grouped explicitly,
+    or collected from concurrent callers during a short window: the first
+    caller of a window waits for the others and sends the whole batch.
+    """
+
+    def __init__(self,
+                 endpoint,
+                 auth: str,
+                 window: float = 0.0,
+                 max_batch_size: int = MULTICALL_MAX_BATCH_SIZE):
+        self._endpoint = endpoint
+        self._auth = auth
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, tuple, Future]] = []
+        self._calls = 0
+        self._round_trips = 0
+
+    def call(self, method: str, *args):
+        """
+        Calls an OpenNebula XML-RPC method, batched with the calls of other
+        threads issued within the window
+        :return: The value returned by OpenNebula on success
+        :raises one_api.OneApiError: If OpenNebula reports a failure
+        """
+        if self._window <= 0:
+            self._count(1)
+            return one_api.call(self._endpoint, self._auth, method, *args)
+
+        future = Future()
+        with self._lock:
+            self._pending.append((method, args, future))
+            first = len(self._pending) == 1
+            if len(self._pending) >= self._max_batch_size:
+                batch, self._pending = self._pending, []
+            else:
+                batch = None
+
+        if batch is None and first:
+            time.sleep(self._window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+
+        if batch:
+            self._send(batch)
+        return future.result()
+
+    @contextmanager
+    def group(self):
+        """
+        Collects the calls made through the yielded CallGroup and sends them
+        when the block exits. The results are read from the returned futures.
+        """
+        call_group = CallGroup()
+        yield call_group
+        for start in range(0, len(call_group.calls), self._max_batch_size):
+            self._send(call_group.calls[start:start + self._max_batch_size])
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the number of calls and of HTTP round trips they took
+        """
+        with self._lock:
+            calls, round_trips = self._calls, self._round_trips
+        yield metrics.Sample("csi_one_api_calls_total", {}, calls, "counter")
+        yield metrics.Sample("csi_one_api_round_trips_total", {}, round_trips, "counter")
+
+    def _send(self, batch: list[tuple[str, tuple, Future]]) -> None:
+        self._count(len(batch))
+
+        if len(batch) == 1:
+            method, args, future = batch[0]
+            try:
+                future.set_result(one_api.call(self._endpoint, self._auth, method, *args))
+            except Exception as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+            return
+
+        logger.debug(f"Sending {len(batch)} calls in a single multicall")
+
+        def send_multicall(endpoint: str):
+            multicall = xmlrpc.client.MultiCall(xmlrpc.client.ServerProxy(endpoint))
+            for method, args, _ in batch:
+                getattr(multicall, method)(self._auth, *args)
+            return multicall()
+
+        try:
+            if isinstance(self._endpoint, str):
+                results = send_multicall(self._endpoint)
+            else:
+                results = self._endpoint.route(send_multicall,
+                                               all(endpoints.is_read_only(method) for method, _, _ in batch))
+        except Exception as error:  # pylint: disable=broad-except
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+
+        for index, (method, _, future) in enumerate(batch):
+            try:
+                future.set_result(one_api.unwrap_response(results[index]))
+            except xmlrpc.client.Fault as fault:
+                future.set_exception(one_api.OneApiError(f"{method} failed: {fault.faultString}"))
+            except one_api.OneApiError as error:
+                future.set_exception(error)
+
+    def _count(self, calls: int) -> None:
+        with self._lock:
+            self._calls += calls
+            self._round_trips += 1
@@ -0,0 +1,92 @@
+"""
+Lightweight access to the OpenNebula XML-RPC API, for the components which
+only need a few calls and should not pay for importing pyone
+"""
+import logging
+import xml.etree.ElementTree as ElementTree
+import xmlrpc.client
+
+from typing import Union
+
+logger = logging.getLogger("OneApi")
+
+ONE_ERROR_NO_EXISTS = 0x0400
+
+
+class OneApiError(Exception):
+    """
+    Raised when OpenNebula reports a failed call
+    """
+
+
+class OneApiNoExistsError(OneApiError):
+    """
+    Raised when the object of a call does not exist
+    """
+
+
+def call(endpoint, auth: str, method: str, *args):
+    """
+    Calls an OpenNebula XML-RPC method
+    :param endpoint: URL of the OpenNebula XML-RPC API, or an
+                     endpoints.EndpointSet routing the call
+    :param auth: Session string in the user:password form
+    :param method: Name of the method, e.g. one.vm.info
+    :return: The value returned by OpenNebula on success
+    :raises OneApiError: If OpenNebula reports a failure
+    """
+    if not isinstance(endpoint, str):
+        return endpoint.call(auth, method, *args)
+
+    logger.debug(f"Calling {method} with arguments {args}")
+    return unwrap_response(getattr(xmlrpc.client.ServerProxy(endpoint), method)(auth, *args))
+
+
+def unwrap_response(response: list):
+    """
+    Returns the value of an OpenNebula response array
+    :raises OneApiNoExistsError: If the object of the call does not exist
+    :raises OneApiError: If OpenNebula reports another failure
+    """
+    if not response[0]:
+        if len(response) > 2 and response[2] == ONE_ERROR_NO_EXISTS:
+            raise OneApiNoExistsError(response[1])
+        raise OneApiError(response[1])
+    return response[1]
+
+
+def element_to_dict(element: ElementTree.Element) -> Union[dict, str]:
+    """
+    Converts an XML element to nested dictionaries the same way pyone renders
+    templates: repeated children become lists and leaves become strings
+    """
+    if len(element) == 0:
+        return element.text or ""
+
+    result = {}
+    for child in element:
+        value = element_to_dict(child)
+        if child.tag not in result:
+            result[child.tag] = value
+        elif isinstance(result[child.tag], list):
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
+    return result
+
+
+def get_vm(endpoint, auth: str, vm_id: int) -> dict:
+    """
+    Retrieves a VM with its template and user template as dictionaries, and
+    the host and cluster of its last placement (None if it was never placed)
+    """
+    vm = ElementTree.fromstring(call(endpoint, auth, "one.vm.info", vm_id))
+    history = vm.findall("HISTORY_RECORDS/HISTORY")
+    return {
+        "ID": int(vm.findtext("ID")),
+        "LCM_STATE": int(vm.findtext("LCM_STATE", "-1")),
+        "HOST_ID": int(history[-1].findtext("HID")) if history else None,
+        "CLUSTER_ID": int(history[-1].findtext("CID")) if history else None,
+        "TEMPLATE": element_to_dict(vm.find("TEMPLATE")),
+        "USER_TEMPLATE": element_to_dict(vm.find("USER_TEMPLATE")),
+    }
@@ -0,0 +1,128 @@
+"""
+Chooses the datastore of a new volume among the ones of its StorageClass
+"""
+import logging
+import threading
+import time
+
+from typing import Optional
+
+from grpc_interceptor.exceptions import ResourceExhausted
+
+import constant
+
+logger = logging.getLogger("Placement")
+
+DATASTORE_STATE_READY = 0
+
+
+class DatastorePlacer:
+    """
+    Places volumes on the datastores of a StorageClass following a policy:
+    most free space, fewest images or weighted round-robin. It works on a
+    cached view of the datastore pool, which is updated with every placement
+    so that a burst of volumes doesn't land on the same datastore.
+    """
+
+    def __init__(self, one_api, cache_ttl: float = constant.DATASTORE_POOL_CACHE_TTL):
+        self._one_api = one_api
+        self._cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._datastores: dict[int, dict] = {}
+        self._refreshed_at = 0.0
+        self._round_robin_state: dict[tuple, dict[int, int]] = {}
+
+    def choose(self,
+               datastore_ids: list[int],
+               policy: str,
+               weights: dict,
+               volume_size_mb: int,
+               cluster_ids: Optional[list[int]] = None) -> int:
+        """
+        Chooses the datastore of a new volume
+        :param datastore_ids: The datastores allowed by the StorageClass
+        :param policy: One of constant.PLACEMENT_POLICIES
+        :param weights: Weight of each datastore for weighted round-robin
+        :param volume_size_mb: Size of the new volume
+        :param cluster_ids: The clusters from which the volume must be
+                            accessible, by order of preference, any cluster
+                            if empty
+        :return: The ID of the chosen datastore
+        :raises ResourceExhausted: If no datastore is enabled and has enough
+                                   space in any of the clusters
+        """
+        with self._lock:
+            self._refresh_if_stale()
+
+            for cluster_id in cluster_ids or [None]:
+                candidates = [
+                    datastore_id for datastore_id in datastore_ids
+                    if datastore_id in self._datastores
+                    and self._datastores[datastore_id]["enabled"]
+                    and self._datastores[datastore_id]["free_mb"] >= volume_size_mb
+                    and (cluster_id is None or cluster_id in self._datastores[datastore_id]["clusters"])
+                ]
+                if candidates:
+                    break
+            else:
+                error_message = (f"None of the datastores {datastore_ids} is enabled "
+                                 f"and has {volume_size_mb} MB of free space")
+                if cluster_ids:
+                    error_message += f" in the clusters {cluster_ids}"
+                logger.error(error_message)
+                raise ResourceExhausted(error_message)
+
+            if policy == constant.PLACEMENT_MOST_FREE:
+                chosen = max(candidates, key=lambda datastore_id: self._datastores[datastore_id]["free_mb"])
+            elif policy == constant.PLACEMENT_FEWEST_IMAGES:
+                chosen = min(candidates, key=lambda datastore_id: self._datastores[datastore_id]["images"])
+            else:
+                chosen = self._next_round_robin(tuple(datastore_ids), candidates, weights)
+
+            self._datastores[chosen]["free_mb"] -= volume_size_mb
+            self._datastores[chosen]["images"] += 1
+
+        logger.debug(f"Placing a {volume_size_mb} MB volume on datastore {chosen} ({policy} among {candidates})")
+        return chosen
+
+    def clusters_of(self, datastore_id: int) -> list[int]:
+        """
+        Returns the clusters from which a datastore is accessible
+        """
+        with self._lock:
+            self._refresh_if_stale()
+            if datastore_id not in self._datastores:
+                return []
+            return sorted(self._datastores[datastore_id]["clusters"])
+
+    def _next_round_robin(self, datastore_ids: tuple, candidates: list[int], weights: dict) -> int:
+        # Smooth weighted round-robin: every candidate gains its weight, the
+        # one with the highest credit is chosen and pays back the total
+        datastore_credits = self._round_robin_state.setdefault(datastore_ids, {})
+        total_weight = 0
+        for datastore_id in candidates:
+            weight = weights.get(datastore_id, 1)
+            datastore_credits[datastore_id] = datastore_credits.get(datastore_id, 0) + weight
+            total_weight += weight
+
+        chosen = max(candidates, key=lambda datastore_id: datastore_credits[datastore_id])
+        datastore_credits[chosen] -= total_weight
+        return chosen
+
+    def _refresh_if_stale(self) -> None:
+        # The caller holds the lock
+        if time.monotonic() - self._refreshed_at > self._cache_ttl:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        logger.debug("Refreshing the datastore pool view")
+        self._datastores = {
+            int(datastore.get_ID()): {
+                "enabled": int(datastore.get_STATE()) == DATASTORE_STATE_READY,
+                "free_mb": int(datastore.get_FREE_MB()),
+                "images": len(datastore.get_IMAGES().get_ID()),
+                "clusters": set(datastore.get_CLUSTERS().get_ID()),
+            }
+            for datastore in self._one_api.datastorepool.info().DATASTORE
+        }
+        self._refreshed_at = time.monotonic()
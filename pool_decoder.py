@@ -0,0 +1,183 @@
+"""
+Streaming decoder of the large OpenNebula pool responses
+"""
+import logging
+import xml.etree.ElementTree as ElementTree
+
+from typing import Iterator, NamedTuple
+
+import one_api
+
+logger = logging.getLogger("PoolDecoder")
+
+FEED_CHUNK_SIZE = 64 * 1024
+
+
+class SnapshotRecord(NamedTuple):
+    """
+    A snapshot of an image or of a VM disk
+    """
+
+    id: int
+    name: str
+    date: int
+    size: int
+
+
+class ImageRecord(NamedTuple):
+    """
+    The fields of an image which the driver uses
+    """
+
+    id: int
+    name: str
+    size: int
+    state: int
+    type: int
+    persistent: bool
+    datastore_id: int
+    vms: tuple[int, ...]
+    snapshots: tuple[SnapshotRecord, ...] = ()
+    error: str = ""
+
+
+class DiskRecord(NamedTuple):
+    """
+    A disk of a VM
+    """
+
+    disk_id: int
+    image_id: int
+    target: str
+    snapshots: tuple[SnapshotRecord, ...] = ()
+    readonly: bool = False
+
+
+class VmRecord(NamedTuple):
+    """
+    The fields of a VM which the driver uses
+    """
+
+    id: int
+    name: str
+    state: int
+    lcm_state: int
+    disks: tuple[DiskRecord, ...]
+
+
+def decode_image_pool(document: str) -> Iterator[ImageRecord]:
+    """
+    Decodes an IMAGE_POOL document one image at a time
+    """
+    for image in _iterate_entries(document, "IMAGE"):
+        yield _image_record(image)
+
+
+def decode_image(document: str) -> ImageRecord:
+    """
+    Decodes the IMAGE document returned by one.image.info
+    """
+    return _image_record(ElementTree.fromstring(document))
+
+
+def decode_vm_pool(document: str) -> Iterator[VmRecord]:
+    """
+    Decodes a VM_POOL document one VM at a time
+    """
+    for vm in _iterate_entries(document, "VM"):
+        yield _vm_record(vm)
+
+
+def decode_vm(document: str) -> VmRecord:
+    """
+    Decodes the VM document returned by one.vm.info
+    """
+    return _vm_record(ElementTree.fromstring(document))
+
+
+def get_image_pool(endpoint, auth: str, pool_filter: int = -2, start: int = -1, end: int = -1) -> list[ImageRecord]:
+    """
+    Retrieves the images with one.imagepool.info as compact records
+    :raises one_api.OneApiError: If OpenNebula reports a failure
+    """
+    return list(decode_image_pool(one_api.call(endpoint, auth, "one.imagepool.info", pool_filter, start, end)))
+
+
+def get_vm_pool(endpoint,
+                auth: str,
+                pool_filter: int = -2,
+                start: int = -1,
+                end: int = -1,
+                state: int = -1) -> list[VmRecord]:
+    """
+    Retrieves the VMs with one.vmpool.info as compact records
+    :raises one_api.OneApiError: If OpenNebula reports a failure
+    """
+    return list(decode_vm_pool(one_api.call(endpoint, auth, "one.vmpool.info", pool_filter, start, end, state)))
+
+
+def _image_record(image: ElementTree.Element) -> ImageRecord:
+    return ImageRecord(id=int(image.findtext("ID", "-1")),
+                       name=image.findtext("NAME", ""),
+                       size=int(image.findtext("SIZE") or 0),
+                       state=int(image.findtext("STATE", "-1")),
+                       type=int(image.findtext("TYPE", "-1")),
+                       persistent=image.findtext("PERSISTENT") == "1",
+                       datastore_id=int(image.findtext("DATASTORE_ID", "-1")),
+                       vms=tuple(int(vm_id.text) for vm_id in image.iterfind("VMS/ID")),
+                       snapshots=_snapshot_records(image.find("SNAPSHOTS")),
+                       error=image.findtext("TEMPLATE/ERROR", ""))
+
+
+def _vm_record(vm: ElementTree.Element) -> VmRecord:
+    # The snapshots of the disks are kept apart from the disks, in one
+    # SNAPSHOTS element per disk
+    disk_snapshots = {
+        snapshots.findtext("DISK_ID"): _snapshot_records(snapshots)
+        for snapshots in vm.iterfind("SNAPSHOTS")
+    }
+    return VmRecord(id=int(vm.findtext("ID", "-1")),
+                    name=vm.findtext("NAME", ""),
+                    state=int(vm.findtext("STATE", "-1")),
+                    lcm_state=int(vm.findtext("LCM_STATE", "-1")),
+                    disks=tuple(DiskRecord(disk_id=int(disk.findtext("DISK_ID", "-1")),
+                                           image_id=int(disk.findtext("IMAGE_ID") or -1),
+                                           target=disk.findtext("TARGET", ""),
+                                           snapshots=disk_snapshots.get(disk.findtext("DISK_ID"), ()),
+                                           readonly=disk.findtext("READONLY", "NO").upper() == "YES")
+                                for disk in vm.iterfind("TEMPLATE/DISK")))
+
+
+def _snapshot_records(snapshots) -> tuple[SnapshotRecord, ...]:
+    if snapshots is None:
+        return ()
+    return tuple(SnapshotRecord(id=int(snapshot.findtext("ID", "-1")),
+                                name=snapshot.findtext("NAME", ""),
+                                date=int(snapshot.findtext("DATE") or 0),
+                                size=int(snapshot.findtext("SIZE") or 0))
+                 for snapshot in snapshots.iterfind("SNAPSHOT"))
+
+
+def _iterate_entries(document: str, tag: str) -> Iterator[ElementTree.Element]:
+    # Feeds the document to a pull parser in chunks and yields every entry
+    # (a child of the pool root) once it is complete. Each entry is dropped
+    # from the root after it has been decoded, so that only one entry is
+    # held in memory instead of the whole tree.
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = None
+    depth = 0
+    for offset in range(0, len(document), FEED_CHUNK_SIZE):
+        parser.feed(document[offset:offset + FEED_CHUNK_SIZE])
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:
+                if element.tag == tag:
+                    yield element
+                root.remove(element)
+    parser.close()
@@ -7,18 +7,36 @@ Main entrypoint of the driver, starts the gRPC server
 import argparse
 import logging
 import os
+import resource
+import socket
 from concurrent import futures
 from pathlib import Path
+from typing import Optional
 
 import grpc
 from grpc_interceptor import ExceptionToStatusInterceptor
 from pb import csi_pb2_grpc
 
+import endpoints
+import metrics
 import services
 
 logger = logging.getLogger("Main")
 
 
+def process_uptime() -> float:
+    """
+    Returns the seconds since the start of this process, the imports included
+    """
+    with open("/proc/self/stat") as stat_file:
+        # The fields following the command name, which may contain spaces,
+        # start with the third one, the start time is the 22nd
+        start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+    with open("/proc/uptime") as uptime_file:
+        uptime = float(uptime_file.read().split()[0])
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
 def getargs() -> argparse.Namespace:
     """Return ArgumentParser instance object"""
     parser = argparse.ArgumentParser(
@@ -34,7 +52,20 @@ def getargs() -> argparse.Namespace:
         "--one-api-endpoint",
         type=str,
         default=None,
-        help="OpenNebula RPC API endpoint",
+        help="OpenNebula RPC API endpoint, or a comma-separated list of the endpoints of an HA setup",
+    )
+
+    parser.add_argument(
+        "--one-api-health-interval",
+        type=float,
+        default=10,
+        help="Seconds between the health checks finding the leader among several OpenNebula endpoints",
+    )
+
+    parser.add_argument(
+        "--one-api-read-from-followers",
+        action="store_true",
+        help="Spread the read-only OpenNebula calls over all the healthy endpoints instead of the leader",
     )
 
     parser.add_argument(
@@ -65,6 +96,14 @@ def getargs() -> argparse.Namespace:
         help="Path to a file containing the OpenNebula VM ID of this Kubernetes node"
     )
 
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["controller", "node", "all"],
+        default="all",
+        help="Which CSI services this process serves",
+    )
+
     parser.add_argument("--log", type=str, default="WARNING", help="Log level")
 
     parser.add_argument(
@@ -74,9 +113,249 @@ def getargs() -> argparse.Namespace:
         help="Worker thread count for the gRPC server",
     )
 
+    parser.add_argument(
+        "--heavy-io-workers",
+        type=int,
+        default=2,
+        help="Number of concurrent I/O-heavy node operations (format, fsck, resize)",
+    )
+
+    parser.add_argument(
+        "--heavy-io-max-pending",
+        type=int,
+        default=6,
+        help="Maximum number of gRPC workers allowed to wait for an I/O-heavy node operation, "
+             "the rest are reserved for cheap operations such as bind mounts",
+    )
+
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=15,
+        help="Interval in seconds between two samples of the staged volumes statistics",
+    )
+
+    parser.add_argument(
+        "--trim-interval",
+        type=float,
+        default=86400,
+        help="Interval in seconds between two scheduled trims of the volumes staged with "
+             "discard: scheduled, 0 disables scheduled trim",
+    )
+
+    parser.add_argument(
+        "--trim-max-duration",
+        type=float,
+        default=600,
+        help="Time budget in seconds of a single scheduled trim run",
+    )
+
+    parser.add_argument(
+        "--trim-bandwidth",
+        type=int,
+        default=0,
+        help="Maximum number of MiB discarded per second by the scheduled trim, 0 means unlimited",
+    )
+
+    parser.add_argument(
+        "--state-dir",
+        type=str,
+        default="/var/lib/kubelet/plugins/csi.opennebula.io/state",
+        help="Directory where the node plugin keeps the state which must survive restarts",
+    )
+
+    parser.add_argument(
+        "--max-volumes-per-node",
+        type=int,
+        default=0,
+        help="Maximum number of volumes attached to this node, 0 derives it from the VM template",
+    )
+
+    parser.add_argument(
+        "--volume-dev-prefix",
+        type=str,
+        default="",
+        help="Device prefix (vd, sd or hd) of the volumes attached to this node, "
+             "defaults to the prefix of the VM's first disk",
+    )
+
+    parser.add_argument(
+        "--cache-device",
+        type=str,
+        default="",
+        help="Local block device sliced into the caches of the volumes whose StorageClass sets cache_mode, "
+             "empty disables the cache tier",
+    )
+
+    parser.add_argument(
+        "--max-concurrent-hotplugs",
+        type=int,
+        default=1,
+        help="Maximum number of volatile disks of ephemeral volumes attached or detached at the same time "
+             "on this node",
+    )
+
+    parser.add_argument(
+        "--controller-shards",
+        type=int,
+        default=0,
+        help="Number of shards the controller work is split into between active replicas, "
+             "0 runs a single controller owning everything",
+    )
+
+    parser.add_argument(
+        "--lease-backend",
+        type=str,
+        choices=["kubernetes", "file"],
+        default="kubernetes",
+        help="Where the controller replicas keep their shard leases",
+    )
+
+    parser.add_argument(
+        "--lease-dir",
+        type=str,
+        default="/var/lib/opennebula-csi/leases",
+        help="Directory holding the leases of the file lease backend",
+    )
+
+    parser.add_argument(
+        "--lease-namespace",
+        type=str,
+        default="kube-system",
+        help="Namespace holding the leases of the kubernetes lease backend",
+    )
+
+    parser.add_argument(
+        "--lease-duration",
+        type=float,
+        default=8,
+        help="Seconds after which the shards of a replica which stopped renewing are handed over",
+    )
+
+    parser.add_argument(
+        "--replica-id",
+        type=str,
+        default=socket.gethostname(),
+        help="Identity of this controller replica in the shard leases",
+    )
+
+    parser.add_argument(
+        "--journal-dir",
+        type=str,
+        default="/var/lib/opennebula-csi/journal",
+        help="Directory shared by the controller replicas, holding the journal of the multi-step operations "
+             "of each replica, named after --replica-id",
+    )
+
+    parser.add_argument(
+        "--deletion-concurrency",
+        type=int,
+        default=2,
+        help="Maximum number of images deleted at the same time on a datastore",
+    )
+
+    parser.add_argument(
+        "--detach-grace-period",
+        type=float,
+        default=0,
+        help="Seconds during which an unpublished volume stays attached, so that a republish to the same node "
+             "is immediate, 0 detaches right away",
+    )
+
+    parser.add_argument(
+        "--one-api-batch-window",
+        type=float,
+        default=0,
+        help="Milliseconds during which concurrent OpenNebula lookups are collected into a single "
+             "system.multicall request, 0 sends every call on its own",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Port serving Prometheus metrics at /metrics, 0 disables the endpoint",
+    )
+
     return parser.parse_args()
 
 
+def add_controller_service(args: argparse.Namespace,
+                           grpc_server: grpc.Server,
+                           my_vm_id: int,
+                           one_api_endpoint: endpoints.EndpointSet,
+                           one_api_auth: str) -> None:
+    """
+    Registers the Controller service, importing its dependencies on demand
+    """
+    # pylint: disable=import-outside-toplevel
+    import journal
+    import leases
+    import sharding
+
+    shard_coordinator = None
+    if args.controller_shards > 0:
+        if args.lease_backend == "file":
+            lease_backend = leases.FileLeaseBackend(args.lease_dir)
+        else:
+            lease_backend = leases.KubernetesLeaseBackend(args.lease_namespace)
+
+        shard_coordinator = sharding.ShardCoordinator(backend=lease_backend,
+                                                      holder=args.replica_id,
+                                                      shard_count=args.controller_shards,
+                                                      lease_duration=args.lease_duration,
+                                                      renew_interval=args.lease_duration / 4)
+        shard_coordinator.start()
+
+    csi_pb2_grpc.add_ControllerServicer_to_server(
+        services.ControllerServicer(
+            one_api_endpoint=one_api_endpoint,
+            one_api_auth=one_api_auth,
+            my_vm_id=my_vm_id,
+            shard_coordinator=shard_coordinator,
+            operation_journal=journal.OperationJournal(
+                str(Path(args.journal_dir) / f"{args.replica_id}{journal.JOURNAL_SUFFIX}")
+            ),
+            one_api_batch_window=args.one_api_batch_window / 1000,
+            detach_grace_period=args.detach_grace_period,
+            deletion_concurrency=args.deletion_concurrency,
+        ),
+        grpc_server,
+    )
+
+
+def add_node_service(args: argparse.Namespace,
+                     grpc_server: grpc.Server,
+                     my_vm_id: int,
+                     one_api_endpoint: Optional[str],
+                     one_api_auth: str) -> None:
+    """
+    Registers the Node service
+    """
+    if args.heavy_io_max_pending >= args.worker_threads:
+        logger.warning(f"--heavy-io-max-pending ({args.heavy_io_max_pending}) leaves no gRPC workers "
+                       f"for cheap operations, lowering it to {args.worker_threads - 1}")
+        args.heavy_io_max_pending = max(args.worker_threads - 1, 1)
+
+    csi_pb2_grpc.add_NodeServicer_to_server(
+        services.NodeServicer(my_vm_id=my_vm_id,
+                              heavy_io_workers=args.heavy_io_workers,
+                              heavy_io_max_pending=args.heavy_io_max_pending,
+                              stats_interval=args.stats_interval,
+                              trim_interval=args.trim_interval,
+                              trim_max_duration=args.trim_max_duration,
+                              trim_bandwidth=args.trim_bandwidth * 1024 ** 2,
+                              state_dir=args.state_dir,
+                              one_api_endpoint=one_api_endpoint,
+                              one_api_auth=one_api_auth,
+                              max_volumes_per_node=args.max_volumes_per_node,
+                              volume_dev_prefix=args.volume_dev_prefix,
+                              cache_device=args.cache_device,
+                              max_concurrent_hotplugs=args.max_concurrent_hotplugs),
+        grpc_server,
+    )
+
+
 def main() -> None:
     """
     Main function running the gRPC server
@@ -122,29 +401,48 @@ def main() -> None:
         interceptors=interceptors,
     )
 
-    identity_servicer = services.IdentityServicer()
+    identity_servicer = services.IdentityServicer(controller_service=args.mode != "node")
     identity_servicer.set_ready(True)
 
     csi_pb2_grpc.add_IdentityServicer_to_server(identity_servicer, grpc_server)
-    csi_pb2_grpc.add_ControllerServicer_to_server(
-        services.ControllerServicer(
-            one_api_endpoint=os.environ.get(
-                "ONE_API_ENDPOINT", args.one_api_endpoint
-            ),
-            one_api_auth=f"{os.environ.get('ONE_API_USERNAME', args.one_api_username)}:"
-                         f"{os.environ.get('ONE_API_PASSWORD', args.one_api_password)}",
-            my_vm_id=my_vm_id
-        ),
-        grpc_server,
-    )
-    csi_pb2_grpc.add_NodeServicer_to_server(
-        services.NodeServicer(my_vm_id=my_vm_id), grpc_server
-    )
+    one_api_endpoint = os.environ.get("ONE_API_ENDPOINT", args.one_api_endpoint)
+    one_api_auth = (f"{os.environ.get('ONE_API_USERNAME', args.one_api_username)}:"
+                    f"{os.environ.get('ONE_API_PASSWORD', args.one_api_password)}")
+
+    one_api_endpoints = [endpoint.strip() for endpoint in (one_api_endpoint or "").split(",") if endpoint.strip()]
+
+    if args.mode in ("controller", "all"):
+        endpoint_set = None
+        if one_api_endpoints:
+            endpoint_set = endpoints.EndpointSet(
+                one_api_endpoints,
+                one_api_auth,
+                health_interval=args.one_api_health_interval,
+                read_from_followers=args.one_api_read_from_followers,
+            )
+            endpoint_set.start()
+            metrics.register_collector(endpoint_set.metrics)
+        add_controller_service(args, grpc_server, my_vm_id, endpoint_set, one_api_auth)
+
+    if args.mode in ("node", "all"):
+        # The node plugin makes a few calls per volume, any frontend of an HA
+        # setup forwards them to the leader
+        if len(one_api_endpoints) > 1:
+            logger.info(f"The node plugin calls the OpenNebula endpoint {one_api_endpoints[0]} only")
+        add_node_service(args, grpc_server, my_vm_id, one_api_endpoints[0] if one_api_endpoints else None,
+                         one_api_auth)
+
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
 
     grpc_server.add_insecure_port(
         os.environ.get("CSI_ENDPOINT", args.csi_endpoint)
     )
     grpc_server.start()
+
+    logger.info(f"Started in {args.mode} mode in {process_uptime():.2f}s, "
+                f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
     grpc_server.wait_for_termination()
 
 
@@ -1,11 +1,18 @@
 """
-Contains all the services the driver must implement via gRPC
+Contains all the services the driver must implement via gRPC. The servicers
+are imported on first use, so that a node-only process never loads the
+controller dependencies such as pyone.
 """
+import importlib
 
-from . import identity
-from . import controller
-from . import node
+_SERVICERS = {
+    "IdentityServicer": "identity",
+    "ControllerServicer": "controller",
+    "NodeServicer": "node",
+}
 
-IdentityServicer = identity.IdentityServicer
-ControllerServicer = controller.ControllerServicer
-NodeServicer = node.NodeServicer
+
+def __getattr__(name):
+    if name not in _SERVICERS:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    return getattr(importlib.import_module(f".{_SERVICERS[name]}", __name__), name)
@@ -3,14 +3,18 @@ Implement the ControllerService of the CSI spec
 """
 import logging
 import re
+import threading
 
+from concurrent.futures import Future
+from contextlib import contextmanager
 from math import ceil
-from time import sleep
-from typing import Callable
+from typing import Callable, Optional, Union
+from urllib.parse import urlparse
 
 import pyone
 
 from grpc_interceptor.exceptions import (
+    Aborted,
     NotFound,
     Internal,
     InvalidArgument,
@@ -23,24 +27,94 @@ from grpc_interceptor.exceptions import (
 from pb import csi_pb2
 from pb import csi_pb2_grpc
 
+import concurrency
 import constant
+import deadlines
+import deferred_detach
+import deletion
+import endpoints
+import failover_server
+import image_import
+import journal
+import metrics
+import multicall
+import one_api
+import placement
+import pool_decoder
+import sharding
+import snapshots
 
 logger = logging.getLogger("ControllerService")
 
+OFFLINE_SNAPSHOT_OPERATION = "offline_snapshot"
+SNAPSHOT_RESTORE_OPERATION = "snapshot_restore"
+VM_ACTION_ATTEMPTS = 30
+JOURNAL_SYNC_INTERVAL = 60
+
 
 class ControllerServicer(csi_pb2_grpc.ControllerServicer):
     """
     Implement the ControllerService as a gRPC Servicer
     """
 
-    def __init__(self, one_api_endpoint: str, one_api_auth: str, my_vm_id: int):
+    def __init__(self,
+                 one_api_endpoint: Union[str, endpoints.EndpointSet],
+                 one_api_auth: str,
+                 my_vm_id: int,
+                 shard_coordinator: Optional[sharding.ShardCoordinator] = None,
+                 operation_journal: Optional[journal.OperationJournal] = None,
+                 one_api_batch_window: float = 0.0,
+                 detach_grace_period: float = 0.0,
+                 deletion_concurrency: int = 2):
         logger.debug(
             "Connection to StorPool API at %s with token %s",
             one_api_endpoint,
             one_api_auth,
         )
-        self._one_api = pyone.OneServer(one_api_endpoint, one_api_auth)
+        if isinstance(one_api_endpoint, str):
+            one_api_endpoint = endpoints.EndpointSet([one_api_endpoint], one_api_auth)
+        self._one_api = failover_server.FailoverServer(one_api_endpoint, one_api_auth)
+        self._one_api_endpoint = one_api_endpoint
+        self._one_api_auth = one_api_auth
+        self._batching_client = multicall.BatchingClient(one_api_endpoint, one_api_auth, window=one_api_batch_window)
+        metrics.register_collector(self._batching_client.metrics)
         self._my_vm_id = my_vm_id
+        self._shard_coordinator = shard_coordinator
+        self._journal = operation_journal
+        self._datastore_placer = placement.DatastorePlacer(self._one_api)
+        self._volume_locks = concurrency.VolumeLocks()
+        self._deferred_detacher = deferred_detach.DeferredDetacher(self._volume_locks,
+                                                                   detach_grace_period,
+                                                                   self._detach_deferred_image,
+                                                                   self._journal,
+                                                                   self._owns_key)
+        metrics.register_collector(self._deferred_detacher.metrics)
+
+        self._deletion_pipeline = deletion.DeletionPipeline(
+            self._one_api,
+            lambda: pool_decoder.get_image_pool(self._one_api_endpoint, self._one_api_auth),
+            self._owns_datastore,
+            concurrency_per_datastore=deletion_concurrency,
+        )
+        metrics.register_collector(self._deletion_pipeline.metrics)
+
+        self._snapshot_cache = snapshots.SnapshotCache()
+        metrics.register_collector(self._snapshot_cache.metrics)
+
+        self._image_imports = image_import.ImportTracker()
+        metrics.register_collector(self._image_imports.metrics)
+
+        self._journal_sync_lock = threading.Lock()
+        self._journal_sync_wakeup = threading.Event()
+        if self._shard_coordinator is not None:
+            self._shard_coordinator.add_listener(self._on_shards_changed)
+        if self._journal is not None:
+            # Retried periodically, the journal of a replaced pod which is
+            # still terminating is taken over once it is released
+            self.recover_pending_operations()
+            threading.Thread(target=self._run_journal_sync, name="journal-sync", daemon=True).start()
+        self._deferred_detacher.start()
+        self._deletion_pipeline.start()
 
     def ControllerGetCapabilities(self, request, context):
         response = csi_pb2.ControllerGetCapabilitiesResponse()
@@ -65,6 +139,21 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             publish_readonly_cap.RPC.EXPAND_VOLUME
         )
 
+        modify_volume_cap = response.capabilities.add()
+        modify_volume_cap.rpc.type = (
+            modify_volume_cap.RPC.MODIFY_VOLUME
+        )
+
+        create_delete_snapshot_cap = response.capabilities.add()
+        create_delete_snapshot_cap.rpc.type = (
+            create_delete_snapshot_cap.RPC.CREATE_DELETE_SNAPSHOT
+        )
+
+        list_snapshots_cap = response.capabilities.add()
+        list_snapshots_cap.rpc.type = (
+            list_snapshots_cap.RPC.LIST_SNAPSHOTS
+        )
+
         return response
 
     def CreateVolume(self, request, context):
@@ -74,48 +163,141 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         if not request.volume_capabilities:
             raise InvalidArgument("Missing volume capabilities")
 
-        datastore_id = 0
-
-        if request.parameters["datastore_id"] is None:
-            logger.warning("OpenNebula datastore ID was not explicitly specified, falling back to datastore ID 0")
-        else:
-            datastore_id = int(request.parameters["datastore_id"])
+        datastore_ids, placement_policy, datastore_weights = self._parse_placement_parameters(request.parameters)
 
+        deadline = deadlines.Deadline(context)
         volume_size = self._determine_volume_size(request.capacity_range)
+        volume_context = self._build_volume_context(request.parameters)
+        disk_throttling = {
+            **self._build_disk_throttling(request.parameters),
+            **self._build_disk_throttling(request.mutable_parameters, mutable=True),
+        }
+        self._check_disk_throttling(disk_throttling)
 
-        logger.info(f"Provisioning volume {request.name} (datastore id: {datastore_id}, size: {volume_size} MB)")
+        logger.info(f"Provisioning volume {request.name} (datastore ids: {datastore_ids}, size: {volume_size} MB)")
 
         for requested_capability in request.volume_capabilities:
             if requested_capability.WhichOneof("access_type") == "mount":
-                if (requested_capability.access_mode.mode
-                        != requested_capability.AccessMode.SINGLE_NODE_WRITER
-                        and requested_capability.access_mode.mode
-                        != requested_capability.AccessMode.SINGLE_NODE_READER_ONLY):
+                if requested_capability.access_mode.mode not in constant.SUPPORTED_ACCESS_MODES:
                     raise InvalidArgument(f"Requested unsupported access mode: {requested_capability.access_mode.mode}")
             else:
                 raise InvalidArgument("Requested unsupported block access mode")
 
+        shareable = any(
+            requested_capability.access_mode.mode == csi_pb2.VolumeCapability.AccessMode.MULTI_NODE_READER_ONLY
+            for requested_capability in request.volume_capabilities
+        )
+        image_attributes = {
+            **({"PERSISTENT_TYPE": "SHAREABLE"} if shareable else {}),
+            **self._render_image_disk_throttling(disk_throttling),
+        }
+
+        source_snapshot_id = None
+        if request.HasField("volume_content_source"):
+            if request.volume_content_source.WhichOneof("type") != "snapshot":
+                raise InvalidArgument("Only snapshots are supported as volume content source")
+            source_snapshot_id = request.volume_content_source.snapshot.snapshot_id
+
+        import_attributes, import_source = self._build_import_attributes(request.parameters)
+        if import_attributes and source_snapshot_id:
+            raise InvalidArgument("A volume cannot be both imported and restored from a snapshot")
+
+        cluster_ids = self._parse_topology_requirements(request.accessibility_requirements)
+
         try:
-            for image in self._one_api.imagepool.info(-2, -1, -1).IMAGE:
-                if image.get_NAME() == request.name:
-                    if image.get_SIZE() == volume_size:
-                        return self._build_create_volume_response(str(image.get_ID()), volume_size)
+            deadline.check(f"looking up image {request.name}")
+            for image in pool_decoder.get_image_pool(self._one_api_endpoint, self._one_api_auth):
+                if image.name == request.name and not deletion.is_tombstoned(image.name):
+                    self._check_shard(f"datastore/{image.datastore_id}")
+                    if source_snapshot_id or import_attributes:
+                        if import_attributes:
+                            self._image_imports.begin(image.id, import_source)
+                        volume_context["datastore_id"] = str(image.datastore_id)
+                        return self._build_create_volume_response(
+                            str(image.id),
+                            self._finish_image_copy(image.id, volume_size, deadline) * (1024 ** 2),
+                            volume_context,
+                            cluster_ids,
+                        )
+                    if image.size == volume_size:
+                        volume_context["datastore_id"] = str(image.datastore_id)
+                        return self._build_create_volume_response(str(image.id),
+                                                                  volume_size,
+                                                                  volume_context,
+                                                                  cluster_ids)
                     else:
-                        raise AlreadyExists(f"PVC {request.name} already exists as image {image.get_ID()} but its size "
-                                            f"({image.get_SIZE()} MB) differs from the requested ({volume_size} MB)")
+                        raise AlreadyExists(f"PVC {request.name} already exists as image {image.id} but its size "
+                                            f"({image.size} MB) differs from the requested ({volume_size} MB)")
+
+            if source_snapshot_id:
+                image_id, datastore_id = self._restore_snapshot(request.name,
+                                                                source_snapshot_id,
+                                                                datastore_ids,
+                                                                placement_policy,
+                                                                datastore_weights,
+                                                                volume_size,
+                                                                cluster_ids,
+                                                                deadline)
+                volume_context["datastore_id"] = str(datastore_id)
+                if image_attributes:
+                    self._one_api.image.update(image_id,
+                                               "\n".join(f"{name} = \"{value}\""
+                                                         for name, value in image_attributes.items()),
+                                               1)
+                return self._build_create_volume_response(
+                    str(image_id),
+                    self._finish_image_copy(image_id, volume_size, deadline) * (1024 ** 2),
+                    volume_context,
+                    cluster_ids,
+                )
+
+            datastore_id = self._place_volume(datastore_ids,
+                                              placement_policy,
+                                              datastore_weights,
+                                              volume_size,
+                                              cluster_ids)
+            volume_context["datastore_id"] = str(datastore_id)
+
+            if import_attributes:
+                deadline.check(f"allocating image {request.name}")
+                image_id = self._one_api.image.allocate(
+                    {"NAME": request.name,
+                     "TYPE": "DATABLOCK",
+                     "PERSISTENT": "YES",
+                     **import_attributes,
+                     **image_attributes},
+                    datastore_id)
+                self._image_imports.begin(image_id, import_source)
+                return self._build_create_volume_response(
+                    str(image_id),
+                    self._finish_image_copy(image_id, volume_size, deadline) * (1024 ** 2),
+                    volume_context,
+                    cluster_ids,
+                )
 
+            deadline.check(f"allocating image {request.name}")
             datablock_image_id = self._one_api.image.allocate(
                 {"NAME": request.name,
                  "TYPE": "DATABLOCK",
                  "PERSISTENT": "YES",
-                 "SIZE": volume_size},
+                 "SIZE": volume_size,
+                 **image_attributes},
                 datastore_id)
 
-            return self._build_create_volume_response(str(datablock_image_id), volume_size * (1024 ** 2))
+            return self._build_create_volume_response(str(datablock_image_id),
+                                                      volume_size * (1024 ** 2),
+                                                      volume_context,
+                                                      cluster_ids)
         except pyone.OneActionException as error:
             if "Not enough space in datastore" in str(error):
                 raise OutOfRange(str(error))
-        except pyone.OneException as error:
+            if "already taken" in str(error):
+                # Another replica allocated the image first, the retry finds
+                # it by name and is served by the owner of its datastore
+                raise Aborted(str(error))
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+        except (pyone.OneException, one_api.OneApiError) as error:
             logger.error(f"OpenNebula API error {str(error)}")
             raise Internal(str(error))
 
@@ -125,15 +307,22 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
 
         logger.info(f"Deleting volume {request.volume_id}")
 
+        deadline = deadlines.Deadline(context)
+
         try:
-            self._one_api.image.delete(int(request.volume_id))
-            logger.debug(f"Successfully deleted volume {request.volume_id}")
-        except pyone.OneNoExistsException:
+            self._check_volume_shard(int(request.volume_id))
+            with self._volume_locks.acquire(request.volume_id, "DeleteVolume"):
+                self._deferred_detacher.detach_now(int(request.volume_id))
+                if self._has_snapshots(int(request.volume_id)):
+                    error_message = f"Volume {request.volume_id} still has snapshots"
+                    logger.error(error_message)
+                    raise FailedPrecondition(error_message)
+                deadline.check(f"marking image {request.volume_id} for deletion")
+                self._deletion_pipeline.tombstone(int(request.volume_id))
+            logger.debug(f"Volume {request.volume_id} is queued for deletion")
+        except (pyone.OneNoExistsException, one_api.OneApiNoExistsError):
             logger.debug(f"Tried to delete an non-existing volume: {request.volume_id}")
-        except pyone.OneActionException as error:
-            if "VMs using it" in str(error):
-                raise FailedPrecondition(str(error))
-        except pyone.OneException as error:
+        except (pyone.OneException, one_api.OneApiError) as error:
             raise Internal(str(error))
 
         return csi_pb2.DeleteVolumeResponse()
@@ -148,8 +337,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             raise InvalidArgument("Missing volume capabilities")
 
         try:
-            image = self._one_api.image.info(int(request.volume_id))
-        except pyone.OneNoExistsException:
+            image = self._get_image(int(request.volume_id))
+        except one_api.OneApiNoExistsError:
             logger.error(
                 f"Cannot validate volume with image ID {request.volume_id} because it doesn't exist."
             )
@@ -157,11 +346,11 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                 f"OpenNebula image ID {request.volume_id} does not exist."
             )
 
-        if image.get_TYPE() != 2:
+        if image.type != 2:
             logger.info(f"Image ID {request.volume_id} is not of type DATABLOCK.")
             raise FailedPrecondition(f"OpenNebula image ID {request.volume_id} is not of type DATABLOCK")
 
-        if image.get_PERSISTENT() != 1:
+        if not image.persistent:
             logger.info(f"Image ID {request.volume_id} is not set as PERSISTENT.")
             raise FailedPrecondition(f"OpenNebula image ID {request.volume_id} is not set as persistent.")
 
@@ -170,12 +359,7 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             if requested_capability.WhichOneof("access_type") == "mount":
                 logger.debug("Volume %s is of type mount.", request.volume_id)
                 confirmed_capability.mount.SetInParent()
-                if (
-                        requested_capability.access_mode.mode
-                        == confirmed_capability.AccessMode.SINGLE_NODE_WRITER
-                        or requested_capability.access_mode.mode
-                        == confirmed_capability.AccessMode.SINGLE_NODE_READER_ONLY
-                ):
+                if requested_capability.access_mode.mode in constant.SUPPORTED_ACCESS_MODES:
                     confirmed_capability.access_mode.mode = (
                         requested_capability.access_mode.mode
                     )
@@ -195,23 +379,65 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
         if not request.HasField("volume_capability"):
             raise InvalidArgument("Missing volume capabilities")
 
+        multi_attach = (request.volume_capability.access_mode.mode
+                        == request.volume_capability.AccessMode.MULTI_NODE_READER_ONLY)
+        readonly = request.readonly or multi_attach
+
         logger.info(
-            f"Attaching image ID {request.volume_id} to VM ID {request.node_id} as readonly: {request.readonly}"
+            f"Attaching image ID {request.volume_id} to VM ID {request.node_id} as readonly: {readonly}"
         )
 
         if not re.match(constant.OPENNEBULA_INSTANCE_ID_REGEX, request.node_id):
             logger.error(f"Tried to attach the image to invalid node id: {request.node_id}")
             raise NotFound(f"Invalid OpenNebula VM ID {request.node_id}")
 
-        self._attach_image(vm_id=int(request.node_id),
-                           image_id=int(request.volume_id),
-                           wait_settle_vm_action=True)
+        try:
+            self._check_volume_shard(int(request.volume_id))
+        except one_api.OneApiNoExistsError:
+            error_message = f"Tried to publish image ID {request.volume_id} but it doesn't exist"
+            logger.error(error_message)
+            raise NotFound(error_message)
+        except one_api.OneApiError as error:
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+
+        deadline = deadlines.Deadline(context)
+        with self._volume_locks.acquire(request.volume_id, "ControllerPublishVolume"):
+            if not self._deferred_detacher.reclaim(int(request.volume_id), int(request.node_id)):
+                disk_attributes = {**self._get_disk_attributes(request.volume_context),
+                                   **self._get_image_disk_throttling(int(request.volume_id))}
+                if multi_attach:
+                    self._make_image_shareable(int(request.volume_id))
+                    disk_attributes["READONLY"] = "YES"
+
+                try:
+                    self._attach_image(vm_id=int(request.node_id),
+                                       image_id=int(request.volume_id),
+                                       disk_attributes=disk_attributes,
+                                       multi_attach=multi_attach,
+                                       wait_settle_vm_action=True,
+                                       deadline=deadline)
+                except Internal:
+                    # Kubernetes no longer counts the volumes waiting for their
+                    # deferred detach, but their disks still hold targets of
+                    # the VM, which may have none left for this one
+                    if not self._deferred_detacher.flush_vm(int(request.node_id)):
+                        raise
+                    logger.info(f"Retrying the attach of image ID {request.volume_id} to VM ID {request.node_id} "
+                                f"after its deferred detaches")
+                    self._attach_image(vm_id=int(request.node_id),
+                                       image_id=int(request.volume_id),
+                                       disk_attributes=disk_attributes,
+                                       multi_attach=multi_attach,
+                                       wait_settle_vm_action=True,
+                                       deadline=deadline)
+        deadline.check(f"looking up the target of image {request.volume_id}")
         attached_vm_template = self._one_api.vm.info(int(request.node_id)).get_TEMPLATE()
 
         for disk_attachment in attached_vm_template["DISK"]:
             if "IMAGE_ID" in disk_attachment and int(disk_attachment["IMAGE_ID"]) == int(request.volume_id):
                 return csi_pb2.ControllerPublishVolumeResponse(
-                    publish_context={"readonly": str(request.readonly),
+                    publish_context={"readonly": str(readonly),
                                      "node_target_path": f"/dev/{disk_attachment['TARGET']}"}
                 )
         else:
@@ -225,9 +451,25 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
 
         logger.info(f"Unpublishing image ID {request.volume_id}")
 
-        self._detach_image(vm_id=int(request.node_id),
-                           image_id=int(request.volume_id),
-                           wait_settle_vm_action=True)
+        try:
+            self._check_volume_shard(int(request.volume_id))
+        except one_api.OneApiNoExistsError:
+            logger.debug(f"Tried to unpublish a non-existing image ID {request.volume_id}")
+            return csi_pb2.ControllerUnpublishVolumeResponse()
+        except one_api.OneApiError as error:
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+
+        with self._volume_locks.acquire(request.volume_id, "ControllerUnpublishVolume"):
+            if self._deferred_detacher.enabled:
+                self._deferred_detacher.defer(int(request.volume_id),
+                                              int(request.node_id),
+                                              self._volume_shard_key(int(request.volume_id)))
+            else:
+                self._detach_image(vm_id=int(request.node_id),
+                                   image_id=int(request.volume_id),
+                                   wait_settle_vm_action=True,
+                                   deadline=deadlines.Deadline(context))
 
         return csi_pb2.ControllerUnpublishVolumeResponse()
 
@@ -246,60 +488,744 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
             raise InvalidArgument("Missing new volume capacity range")
 
         new_image_size = self._determine_volume_size(request.capacity_range)
+        deadline = deadlines.Deadline(context)
 
         expand_volume_response = csi_pb2.ControllerExpandVolumeResponse()
         expand_volume_response.capacity_bytes = new_image_size * (1024 ** 2)
         expand_volume_response.node_expansion_required = False
 
         try:
-            image = self._one_api.image.info(int(request.volume_id))
+            deadline.check(f"looking up image {request.volume_id}")
+            image = self._get_image(int(request.volume_id))
+            self._check_shard(f"datastore/{image.datastore_id}")
 
-            if image.get_SIZE() >= new_image_size:
+            if image.size >= new_image_size:
                 return expand_volume_response
 
-            if len(image.get_VMS().get_ID()):
+            if image.vms:
                 expand_volume_response.node_expansion_required = True
-                attached_vm_id = image.get_VMS().get_ID()[0]
+                attached_vm_id = image.vms[0]
                 logger.debug(f"Image ID {request.volume_id} is currently attached to VM ID {attached_vm_id}, "
                              f"will notify the Kubelet to resize the file system.")
                 logger.info(f"Expanding in an online manner image ID {request.volume_id} to {new_image_size} MB")
                 self._resize_image(attached_vm_id=int(attached_vm_id),
                                    image_id=int(request.volume_id),
                                    new_size_in_mb=new_image_size,
-                                   wait_settle_vm_action=True)
+                                   wait_settle_vm_action=True,
+                                   deadline=deadline)
             else:
-                logger.debug(f"Image ID {request.volume_id} is not currently attached, "
-                             f"attaching to self (VM ID {self._my_vm_id})")
-                self._attach_image(vm_id=self._my_vm_id,
-                                   image_id=int(request.volume_id),
-                                   wait_settle_vm_action=True)
-                logger.info(f"Expanding in an offline manner image ID {request.volume_id} to {new_image_size} MB")
-                self._resize_image(attached_vm_id=self._my_vm_id,
-                                   image_id=int(request.volume_id),
-                                   new_size_in_mb=new_image_size,
-                                   wait_settle_vm_action=True)
-                logger.debug(f"Detaching image ID {request.volume_id} from self (VM ID {self._my_vm_id})")
-                self._detach_image(vm_id=self._my_vm_id,
-                                   image_id=int(request.volume_id),
-                                   wait_settle_vm_action=True)
+                self._expand_offline(int(request.volume_id), new_image_size, deadline)
 
-        except pyone.OneNoExistsException as error:
-            if "Error getting image" in str(error):
-                error_message = f"Tried to resize image ID {request.volume_id} but it doesn't exist"
-                logger.error(error_message)
-                raise NotFound(error_message)
+        except one_api.OneApiNoExistsError:
+            error_message = f"Tried to resize image ID {request.volume_id} but it doesn't exist"
+            logger.error(error_message)
+            raise NotFound(error_message)
 
         return expand_volume_response
 
+    def ControllerModifyVolume(self, request, context):
+        """
+        Changes the disk throttling of a volume. The values are stored in the
+        image template, so that they are applied at the next publish, and
+        updated live on the disks of the VMs the image is attached to.
+        """
+        if not request.volume_id:
+            raise InvalidArgument("Missing volume ID")
+
+        if not request.mutable_parameters:
+            raise InvalidArgument("Missing mutable parameters")
+
+        disk_throttling = self._build_disk_throttling(request.mutable_parameters, mutable=True)
+        deadline = deadlines.Deadline(context)
+        image_id = int(request.volume_id)
+
+        try:
+            deadline.check(f"looking up image {image_id}")
+            image = self._get_image(image_id)
+            self._check_shard(f"datastore/{image.datastore_id}")
+            self._check_disk_throttling({**self._get_image_disk_throttling(image_id), **disk_throttling})
+
+            logger.info(f"Setting the disk throttling of image ID {image_id} to {disk_throttling}")
+            deadline.check(f"updating image {image_id}")
+            self._one_api.image.update(image_id,
+                                       "\n".join(f"{name} = \"{value}\"" for name, value in
+                                                 self._render_image_disk_throttling(disk_throttling).items()),
+                                       1)
+
+            for attached_vm_id in image.vms:
+                logger.debug(f"Updating the disk throttling of image ID {image_id} live on VM ID {attached_vm_id}")
+                self._update_disk(attached_vm_id=attached_vm_id,
+                                  image_id=image_id,
+                                  disk_attributes=disk_throttling,
+                                  wait_settle_vm_action=True,
+                                  deadline=deadline)
+        except (pyone.OneNoExistsException, one_api.OneApiNoExistsError):
+            error_message = f"Tried to modify image ID {image_id} but it doesn't exist"
+            logger.error(error_message)
+            raise NotFound(error_message)
+        except (pyone.OneException, one_api.OneApiError) as error:
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+
+        return csi_pb2.ControllerModifyVolumeResponse()
+
+    def CreateSnapshot(self, request, context):
+        """
+        Takes a disk snapshot of a volume. A volume attached to a VM is
+        snapshotted live through that VM, a detached one is attached to the
+        controller's VM for the time of the snapshot.
+        """
+        if not request.source_volume_id:
+            raise InvalidArgument("Missing source volume ID")
+
+        if not request.name:
+            raise InvalidArgument("Missing snapshot name")
+
+        cached = self._snapshot_cache.find(request.name)
+        if cached is not None:
+            if cached.source_volume_id != request.source_volume_id:
+                raise AlreadyExists(f"Snapshot {request.name} already exists for volume {cached.source_volume_id}")
+            return csi_pb2.CreateSnapshotResponse(snapshot=self._build_snapshot(cached))
+
+        deadline = deadlines.Deadline(context)
+        image_id = int(request.source_volume_id)
+
+        try:
+            deadline.check(f"looking up image {image_id}")
+            image = self._get_image(image_id)
+            self._check_shard(f"datastore/{image.datastore_id}")
+
+            with self._volume_locks.acquire(request.source_volume_id, "CreateSnapshot"):
+                image = self._get_image(image_id)
+                state = next((state for state in self._get_snapshots(image) if state.name == request.name), None)
+                if state is None:
+                    state = self._create_snapshot(image, request.name, deadline)
+        except one_api.OneApiNoExistsError:
+            error_message = f"Tried to snapshot image ID {image_id} but it doesn't exist"
+            logger.error(error_message)
+            raise NotFound(error_message)
+        except (pyone.OneException, one_api.OneApiError) as error:
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+
+        return csi_pb2.CreateSnapshotResponse(snapshot=self._build_snapshot(state))
+
+    def DeleteSnapshot(self, request, context):
+        if not request.snapshot_id:
+            raise InvalidArgument("Missing snapshot ID")
+
+        logger.info(f"Deleting snapshot {request.snapshot_id}")
+
+        try:
+            image_id, snapshot_id = snapshots.parse_snapshot_id(request.snapshot_id)
+        except ValueError:
+            logger.debug(f"Tried to delete a snapshot with an unknown ID format: {request.snapshot_id}")
+            return csi_pb2.DeleteSnapshotResponse()
+
+        deadline = deadlines.Deadline(context)
+
+        try:
+            image = self._get_image(image_id)
+            self._check_shard(f"datastore/{image.datastore_id}")
+
+            with self._volume_locks.acquire(str(image_id), "DeleteSnapshot"):
+                image = self._get_image(image_id)
+                deadline.check(f"deleting snapshot {request.snapshot_id}")
+                if image.vms:
+                    disk = self._find_disk(self._get_vm(image.vms[0]), image_id)
+                    if snapshot_id in (snapshot.id for snapshot in disk.snapshots):
+                        self._execute_vm_action(self._one_api.vm.disksnapshotdelete,
+                                                image.vms[0],
+                                                disk.disk_id,
+                                                snapshot_id,
+                                                wait_settle_vm_state=True,
+                                                deadline=deadline)
+                elif snapshot_id in (snapshot.id for snapshot in image.snapshots):
+                    self._one_api.image.snapshotdelete(image_id, snapshot_id)
+        except (pyone.OneNoExistsException, one_api.OneApiNoExistsError):
+            logger.debug(f"Tried to delete a snapshot of a non-existing image: {request.snapshot_id}")
+        except pyone.OneActionException as error:
+            if "children" in str(error):
+                error_message = f"Snapshot {request.snapshot_id} has dependent snapshots"
+                logger.error(error_message)
+                raise FailedPrecondition(error_message)
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+        except (pyone.OneException, one_api.OneApiError) as error:
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+
+        self._snapshot_cache.forget(request.snapshot_id)
+        return csi_pb2.DeleteSnapshotResponse()
+
+    def ListSnapshots(self, request, context):
+        deadline = deadlines.Deadline(context)
+        deadline.check("listing snapshots")
+
+        try:
+            if request.snapshot_id:
+                cached = self._snapshot_cache.get(request.snapshot_id)
+                if cached is not None:
+                    states = [cached]
+                else:
+                    try:
+                        image_id, _ = snapshots.parse_snapshot_id(request.snapshot_id)
+                        states = [state for state in self._get_snapshots(self._get_image(image_id))
+                                  if state.snapshot_id == request.snapshot_id]
+                    except (ValueError, one_api.OneApiNoExistsError):
+                        states = []
+                if request.source_volume_id:
+                    states = [state for state in states if state.source_volume_id == request.source_volume_id]
+            elif request.source_volume_id:
+                try:
+                    states = self._get_snapshots(self._get_image(int(request.source_volume_id)))
+                except (ValueError, one_api.OneApiNoExistsError):
+                    states = []
+            else:
+                states = self._list_all_snapshots()
+        except (pyone.OneException, one_api.OneApiError) as error:
+            logger.error(f"OpenNebula API error {str(error)}")
+            raise Internal(str(error))
+
+        states.sort(key=lambda state: snapshots.parse_snapshot_id(state.snapshot_id))
+
+        start = 0
+        if request.starting_token:
+            if not request.starting_token.isdigit() or int(request.starting_token) > len(states):
+                raise Aborted(f"Invalid starting token {request.starting_token}")
+            start = int(request.starting_token)
+        end = start + request.max_entries if request.max_entries > 0 else len(states)
+
+        response = csi_pb2.ListSnapshotsResponse()
+        for state in states[start:end]:
+            response.entries.add().snapshot.CopyFrom(self._build_snapshot(state))
+        if end < len(states):
+            response.next_token = str(end)
+
+        return response
+
+    def recover_pending_operations(self) -> None:
+        """
+        Finishes or rolls back the multi-step operations interrupted by a
+        restart, using only the pending journal entries. The journals left
+        by the replicas which are gone are taken over, and only the
+        operations on the volumes of the owned shards are recovered, the
+        pending work of the other shards is handed over to their owners.
+        """
+        with self._journal_sync_lock:
+            self._recover_pending_operations()
+
+    def _recover_pending_operations(self) -> None:
+        handed_off = self._deferred_detacher.hand_off()
+        handed_off += [entry["id"] for entry in self._journal.orphaned()
+                       if not self._owns_key(entry.get("key")) and self._journal.claim(entry["id"])]
+        self._journal.hand_off(handed_off)
+
+        self._journal.adopt(self._owns_key)
+
+        pending = []
+        for entry in self._journal.orphaned():
+            if not self._owns_key(entry.get("key")) or not self._journal.claim(entry["id"]):
+                continue
+            if entry["operation"] == deferred_detach.DEFERRED_DETACH_OPERATION:
+                self._deferred_detacher.restore(entry["id"], key=entry.get("key"), **entry["arguments"])
+            else:
+                pending.append(entry)
+
+        # The images of all the pending operations are looked up in a
+        # single round trip
+        with self._batching_client.group() as call_group:
+            images = {
+                entry["id"]: call_group.call("one.image.info", entry["arguments"]["image_id"])
+                for entry in pending
+            }
+
+        for entry in pending:
+            logger.info(f"Recovering interrupted operation {entry['operation']} {entry['arguments']}")
+            try:
+                self._recover_operation(entry["id"], entry["operation"], image=images[entry["id"]],
+                                        **entry["arguments"])
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Recovering operation {entry['id']} failed, will retry later: {error}")
+                self._journal.disown(entry["id"])
+
+    def _on_shards_changed(self) -> None:
+        # Called from the lease renewal thread, the journal is synced apart.
+        # The cached snapshots of a shard handed back may have changed since.
+        self._snapshot_cache.clear()
+        self._journal_sync_wakeup.set()
+
+    def _run_journal_sync(self) -> None:
+        while True:
+            self._journal_sync_wakeup.wait(JOURNAL_SYNC_INTERVAL)
+            self._journal_sync_wakeup.clear()
+            try:
+                self.recover_pending_operations()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Syncing the operation journal with the owned shards failed: {error}")
+
+    def _begin_operation(self, operation: str, **arguments) -> Optional[str]:
+        if self._journal is None:
+            return None
+        return self._journal.begin(operation, key=self._volume_shard_key(arguments["image_id"]), **arguments)
+
+    def _complete_operation(self, entry_id: Optional[str]) -> None:
+        if entry_id is not None:
+            self._journal.complete(entry_id)
+
+    def _disown_operation(self, entry_id: Optional[str]) -> None:
+        if entry_id is not None:
+            self._journal.disown(entry_id)
+
+    def _recover_operation(self,
+                           entry_id: Optional[str],
+                           operation: str,
+                           image: Optional[Future] = None,
+                           **arguments) -> None:
+        recovery_handlers = {
+            "offline_expand": self._recover_offline_expand,
+            OFFLINE_SNAPSHOT_OPERATION: self._recover_self_attach,
+            SNAPSHOT_RESTORE_OPERATION: self._recover_self_attach,
+        }
+        recovery_handlers[operation](image=image, **arguments)
+        self._complete_operation(entry_id)
+
+    def _recover_offline_expand(self,
+                                image_id: int,
+                                vm_id: int,
+                                new_size_in_mb: int,
+                                image: Optional[Future] = None) -> None:
+        try:
+            if image is None:
+                image = self._get_image(image_id)
+            else:
+                image = pool_decoder.decode_image(image.result())
+        except one_api.OneApiNoExistsError:
+            logger.info(f"Image ID {image_id} no longer exists, nothing to recover")
+            return
+
+        if vm_id not in image.vms:
+            return
+
+        if image.size < new_size_in_mb:
+            logger.info(f"Finishing the offline expansion of image ID {image_id} to {new_size_in_mb} MB")
+            self._resize_image(attached_vm_id=vm_id,
+                               image_id=image_id,
+                               new_size_in_mb=new_size_in_mb,
+                               wait_settle_vm_action=True)
+
+        logger.info(f"Detaching image ID {image_id} left attached to VM ID {vm_id}")
+        self._detach_image(vm_id=vm_id, image_id=image_id, wait_settle_vm_action=True)
+
+    def _recover_self_attach(self,
+                             image_id: int,
+                             vm_id: int,
+                             image: Optional[Future] = None) -> None:
+        try:
+            if image is None:
+                image = self._get_image(image_id)
+            else:
+                image = pool_decoder.decode_image(image.result())
+        except one_api.OneApiNoExistsError:
+            logger.info(f"Image ID {image_id} no longer exists, nothing to recover")
+            return
+
+        if vm_id in image.vms:
+            logger.info(f"Detaching image ID {image_id} left attached to VM ID {vm_id}")
+            self._detach_image(vm_id=vm_id, image_id=image_id, wait_settle_vm_action=True)
+
+    @contextmanager
+    def _attached_to_self(self, image_id: int, operation: str, deadline: deadlines.Deadline):
+        """
+        Attaches a detached image to the controller's own VM for the time of
+        the block. The operation is journaled, so that an image left attached
+        by a crash is detached on the next start.
+        """
+        entry_id = self._begin_operation(operation, image_id=image_id, vm_id=self._my_vm_id)
+        try:
+            logger.debug(f"Image ID {image_id} is not currently attached, attaching to self (VM ID {self._my_vm_id})")
+            self._attach_image(vm_id=self._my_vm_id,
+                               image_id=image_id,
+                               wait_settle_vm_action=True,
+                               deadline=deadline)
+            yield self._my_vm_id
+            logger.debug(f"Detaching image ID {image_id} from self (VM ID {self._my_vm_id})")
+            self._detach_image(vm_id=self._my_vm_id,
+                               image_id=image_id,
+                               wait_settle_vm_action=True,
+                               deadline=deadline)
+        except Exception:
+            logger.error(f"Operation {operation} on image ID {image_id} failed, "
+                         f"making sure it is detached from self (VM ID {self._my_vm_id})")
+            try:
+                self._recover_operation(entry_id, operation, image_id=image_id, vm_id=self._my_vm_id)
+            except Exception as recovery_error:  # pylint: disable=broad-except
+                logger.error(f"Detaching image ID {image_id} from self failed, "
+                             f"it will be retried later: {recovery_error}")
+                self._disown_operation(entry_id)
+            raise
+        self._complete_operation(entry_id)
+
+    def _expand_offline(self, image_id: int, new_size_in_mb: int, deadline: deadlines.Deadline) -> None:
+        entry_id = self._begin_operation("offline_expand",
+                                         image_id=image_id,
+                                         vm_id=self._my_vm_id,
+                                         new_size_in_mb=new_size_in_mb)
+        try:
+            logger.debug(f"Image ID {image_id} is not currently attached, "
+                         f"attaching to self (VM ID {self._my_vm_id})")
+            self._attach_image(vm_id=self._my_vm_id,
+                               image_id=image_id,
+                               wait_settle_vm_action=True,
+                               deadline=deadline)
+            logger.info(f"Expanding in an offline manner image ID {image_id} to {new_size_in_mb} MB")
+            self._resize_image(attached_vm_id=self._my_vm_id,
+                               image_id=image_id,
+                               new_size_in_mb=new_size_in_mb,
+                               wait_settle_vm_action=True,
+                               deadline=deadline)
+            logger.debug(f"Detaching image ID {image_id} from self (VM ID {self._my_vm_id})")
+            self._detach_image(vm_id=self._my_vm_id,
+                               image_id=image_id,
+                               wait_settle_vm_action=True,
+                               deadline=deadline)
+        except Exception:
+            logger.error(f"Offline expansion of image ID {image_id} failed, "
+                         f"making sure it is detached from self (VM ID {self._my_vm_id})")
+            try:
+                self._recover_operation(entry_id,
+                                        "offline_expand",
+                                        image_id=image_id,
+                                        vm_id=self._my_vm_id,
+                                        new_size_in_mb=new_size_in_mb)
+            except Exception as recovery_error:  # pylint: disable=broad-except
+                logger.error(f"Rolling back the offline expansion of image ID {image_id} failed, "
+                             f"it will be retried later: {recovery_error}")
+                self._disown_operation(entry_id)
+            raise
+        self._complete_operation(entry_id)
+
+    def _create_snapshot(self,
+                         image: pool_decoder.ImageRecord,
+                         name: str,
+                         deadline: deadlines.Deadline) -> snapshots.SnapshotState:
+        if image.vms:
+            logger.info(f"Taking live snapshot {name} of image ID {image.id} on VM ID {image.vms[0]}")
+            disk = self._find_disk(self._get_vm(image.vms[0]), image.id)
+            self._execute_vm_action(self._one_api.vm.disksnapshotcreate,
+                                    image.vms[0],
+                                    disk.disk_id,
+                                    name,
+                                    wait_settle_vm_state=True,
+                                    deadline=deadline)
+        else:
+            with self._attached_to_self(image.id, OFFLINE_SNAPSHOT_OPERATION, deadline):
+                logger.info(f"Taking snapshot {name} of image ID {image.id} on self (VM ID {self._my_vm_id})")
+                disk = self._find_disk(self._get_vm(self._my_vm_id), image.id)
+                self._execute_vm_action(self._one_api.vm.disksnapshotcreate,
+                                        self._my_vm_id,
+                                        disk.disk_id,
+                                        name,
+                                        wait_settle_vm_state=True,
+                                        deadline=deadline)
+
+        for state in self._get_snapshots(self._get_image(image.id)):
+            if state.name == name:
+                return state
+
+        error_message = f"OpenNebula took snapshot {name} of image ID {image.id}, but does not list it"
+        logger.error(error_message)
+        raise Internal(error_message)
+
+    def _get_snapshots(self,
+                       image: pool_decoder.ImageRecord,
+                       vm: Optional[pool_decoder.VmRecord] = None) -> list[snapshots.SnapshotState]:
+        """
+        Returns the snapshots of an image and caches them. They are kept by
+        the disk of the VM using the image, and move to the image when the
+        disk is detached.
+        """
+        if image.vms:
+            vm = vm or self._get_vm(image.vms[0])
+            try:
+                records = self._find_disk(vm, image.id).snapshots
+            except NotFound:
+                records = ()
+            in_progress = None
+            if vm.lcm_state in snapshots.DISK_SNAPSHOT_LCM_STATES:
+                # Only the last snapshot may still be in progress
+                in_progress = max((record.id for record in records), default=None)
+        else:
+            records, in_progress = image.snapshots, None
+
+        return [
+            self._snapshot_cache.put(snapshots.SnapshotState(
+                snapshot_id=snapshots.build_snapshot_id(image.id, record.id),
+                source_volume_id=str(image.id),
+                name=record.name,
+                size_bytes=(record.size or image.size) * (1024 ** 2),
+                creation_time=record.date,
+                ready=record.id != in_progress,
+            ))
+            for record in records
+        ]
+
+    def _list_all_snapshots(self) -> list[snapshots.SnapshotState]:
+        images = [
+            image for image in pool_decoder.get_image_pool(self._one_api_endpoint, self._one_api_auth)
+            if image.name.startswith(constant.CSI_VOLUME_NAME_PREFIX) and not deletion.is_tombstoned(image.name)
+        ]
+
+        # The VMs keeping the snapshots of the attached images are looked up
+        # in a single round trip
+        with self._batching_client.group() as call_group:
+            vms = {image.id: call_group.call("one.vm.info", image.vms[0]) for image in images if image.vms}
+
+        states = []
+        for image in images:
+            if image.id in vms:
+                try:
+                    states.extend(self._get_snapshots(image, pool_decoder.decode_vm(vms[image.id].result())))
+                except one_api.OneApiNoExistsError:
+                    logger.debug(f"VM ID {image.vms[0]} using image ID {image.id} no longer exists")
+            else:
+                states.extend(self._get_snapshots(image))
+        return states
+
+    def _place_volume(self,
+                      datastore_ids: list[int],
+                      placement_policy: str,
+                      datastore_weights: dict,
+                      volume_size: int,
+                      cluster_ids: list[int]) -> int:
+        """
+        Chooses the datastore of a new volume among the allowed ones
+        :raises Aborted: If none of the datastores is owned by this replica
+        :raises ResourceExhausted: If none of the datastores can take the
+                                   volume in the required clusters
+        """
+        # Every later operation on the volume is sharded by its datastore,
+        # so only the datastores of this replica's shards are candidates
+        owned_datastore_ids = [datastore_id for datastore_id in datastore_ids
+                               if self._owns_datastore(datastore_id)]
+        if not owned_datastore_ids:
+            error_message = f"None of the datastores {datastore_ids} is owned by this controller replica"
+            logger.debug(error_message)
+            raise Aborted(error_message)
+
+        if len(owned_datastore_ids) == 1 and not cluster_ids:
+            return owned_datastore_ids[0]
+        return self._datastore_placer.choose(owned_datastore_ids,
+                                             placement_policy,
+                                             datastore_weights,
+                                             volume_size,
+                                             cluster_ids)
+
+    def _restore_snapshot(self,
+                          name: str,
+                          csi_snapshot_id: str,
+                          datastore_ids: list[int],
+                          placement_policy: str,
+                          datastore_weights: dict,
+                          volume_size: int,
+                          cluster_ids: list[int],
+                          deadline: deadlines.Deadline) -> tuple[int, int]:
+        """
+        Saves a snapshot as a new image with disk-saveas, which copies it on
+        the datastore side. disk-saveas keeps the copy in the datastore of the
+        snapshot, which is placed like a new volume would be, as the only
+        candidate.
+        :return: The ID of the new image and of its datastore
+        :raises InvalidArgument: If the datastore of the snapshot is not
+                                 allowed by the StorageClass
+        :raises ResourceExhausted: If the datastore of the snapshot is not
+                                   accessible from the required clusters or
+                                   lacks space
+        """
+        try:
+            image_id, snapshot_id = snapshots.parse_snapshot_id(csi_snapshot_id)
+            image = self._get_image(image_id)
+        except (ValueError, one_api.OneApiNoExistsError):
+            error_message = f"Snapshot {csi_snapshot_id} does not exist"
+            logger.error(error_message)
+            raise NotFound(error_message)
+
+        self._check_shard(f"datastore/{image.datastore_id}")
+
+        if image.datastore_id not in datastore_ids:
+            error_message = (f"Snapshot {csi_snapshot_id} is kept in datastore {image.datastore_id}, "
+                             f"which is not one of the datastores {datastore_ids} of the StorageClass")
+            logger.error(error_message)
+            raise InvalidArgument(error_message)
+
+        self._place_volume([image.datastore_id], placement_policy, datastore_weights, volume_size, cluster_ids)
+
+        with self._volume_locks.acquire(str(image_id), "restore of a snapshot"):
+            image = self._get_image(image_id)
+            if image.vms:
+                new_image_id = self._save_disk_snapshot(image.vms[0], image_id, snapshot_id, name, deadline)
+                return new_image_id, image.datastore_id
+
+            with self._attached_to_self(image_id, SNAPSHOT_RESTORE_OPERATION, deadline):
+                new_image_id = self._save_disk_snapshot(self._my_vm_id, image_id, snapshot_id, name, deadline)
+            return new_image_id, image.datastore_id
+
+    def _has_snapshots(self, image_id: int) -> bool:
+        """
+        Tells whether a volume has snapshots, including the ones kept by the
+        disk of the VM using it
+        :raises one_api.OneApiNoExistsError: If the image does not exist
+        """
+        image = self._get_image(image_id)
+        try:
+            return bool(self._get_snapshots(image))
+        except one_api.OneApiNoExistsError:
+            logger.debug(f"VM ID {image.vms[0]} using image ID {image_id} no longer exists")
+            return bool(image.snapshots)
+
+    def _save_disk_snapshot(self,
+                            vm_id: int,
+                            image_id: int,
+                            snapshot_id: int,
+                            name: str,
+                            deadline: deadlines.Deadline) -> int:
+        disk = self._find_disk(self._get_vm(vm_id), image_id)
+        if snapshot_id not in (snapshot.id for snapshot in disk.snapshots):
+            error_message = f"Snapshot {snapshots.build_snapshot_id(image_id, snapshot_id)} does not exist"
+            logger.error(error_message)
+            raise NotFound(error_message)
+
+        logger.info(f"Saving snapshot {snapshot_id} of image ID {image_id} as image {name}")
+        return self._execute_vm_action(self._one_api.vm.disksaveas,
+                                       vm_id,
+                                       disk.disk_id,
+                                       name,
+                                       "",
+                                       snapshot_id,
+                                       wait_settle_vm_state=True,
+                                       deadline=deadline)
+
+    def _finish_image_copy(self, image_id: int, volume_size: int, deadline: deadlines.Deadline) -> int:
+        """
+        Waits for the copy of a restored snapshot or of an imported dataset
+        and turns it into a volume of at least the requested size
+        :return: The size of the volume in MB
+        """
+        try:
+            image = self._wait_image_ready(image_id, deadline)
+        except Internal:
+            # The next call starts over, the failed copy is deleted in the
+            # background
+            self._deletion_pipeline.tombstone(image_id)
+            raise
+
+        if not image.persistent:
+            self._one_api.image.persistent(image_id, True)
+
+        if image.size < volume_size:
+            self._expand_offline(image_id, volume_size, deadline)
+            return volume_size
+        return image.size
+
+    def _wait_image_ready(self, image_id: int, deadline: deadlines.Deadline) -> pool_decoder.ImageRecord:
+        delay = constant.IMAGE_READY_POLL_MIN_INTERVAL
+        while True:
+            image = self._get_image(image_id)
+            elapsed = self._image_imports.progress(image_id, image.state)
+            if image.state == constant.IMAGE_STATE_READY:
+                self._image_imports.end(image_id, succeeded=True)
+                return image
+            if image.state == constant.IMAGE_STATE_ERROR:
+                self._image_imports.end(image_id, succeeded=False)
+                error_message = f"Image ID {image_id} is in the ERROR state: {image.error}"
+                logger.error(error_message)
+                raise Internal(error_message)
+
+            if elapsed is not None:
+                logger.info(f"Image ID {image_id} is still being imported after {elapsed:.0f}s "
+                            f"(state {image.state}), checking again in {delay}s")
+            else:
+                logger.debug(f"Image ID {image_id} is in state {image.state}, checking again in {delay}s")
+            deadline.sleep(delay, f"waiting for image {image_id} to be ready")
+            delay = min(delay * 2, constant.IMAGE_READY_POLL_MAX_INTERVAL)
+
+    def _get_vm(self, vm_id: int) -> pool_decoder.VmRecord:
+        """
+        Looks up a VM through the batching client
+        :raises one_api.OneApiNoExistsError: If the VM does not exist
+        """
+        return pool_decoder.decode_vm(self._batching_client.call("one.vm.info", vm_id))
+
+    @staticmethod
+    def _find_disk(vm: pool_decoder.VmRecord, image_id: int) -> pool_decoder.DiskRecord:
+        for disk in vm.disks:
+            if disk.image_id == image_id:
+                return disk
+
+        error_message = f"Image ID {image_id} is not attached to VM ID {vm.id}"
+        logger.error(error_message)
+        raise NotFound(error_message)
+
+    def _detach_deferred_image(self, vm_id: int, image_id: int) -> None:
+        try:
+            self._detach_image(vm_id=vm_id, image_id=image_id, wait_settle_vm_action=True)
+        except NotFound:
+            logger.info(f"Image ID {image_id} is no longer attached to VM ID {vm_id}")
+
+    def _check_shard(self, key: str) -> None:
+        if self._shard_coordinator is not None:
+            self._shard_coordinator.check(key)
+
+    def _check_volume_shard(self, image_id: int) -> None:
+        """
+        Rejects a request for a volume owned by another replica. A volume is
+        sharded by its datastore in every operation, from its creation on.
+        """
+        if self._shard_coordinator is not None:
+            self._check_shard(self._volume_shard_key(image_id))
+
+    def _volume_shard_key(self, image_id: int) -> str:
+        return f"datastore/{self._get_image(image_id).datastore_id}"
+
+    def _owns_datastore(self, datastore_id: int) -> bool:
+        return self._owns_key(f"datastore/{datastore_id}")
+
+    def _owns_key(self, key: Optional[str]) -> bool:
+        # Entries journaled before the shard keys were recorded belong to
+        # whoever finds them
+        return self._shard_coordinator is None or key is None or self._shard_coordinator.owns(key)
+
+    def _get_image(self, image_id: int) -> pool_decoder.ImageRecord:
+        """
+        Looks up an image through the batching client, so that the lookups
+        of concurrent requests share a round trip
+        :raises one_api.OneApiNoExistsError: If the image does not exist
+        """
+        return pool_decoder.decode_image(self._batching_client.call("one.image.info", image_id))
+
     def _attach_image(self,
                       vm_id: int,
                       image_id: int,
-                      wait_settle_vm_action: bool = False):
+                      disk_attributes: dict = None,
+                      multi_attach: bool = False,
+                      wait_settle_vm_action: bool = False,
+                      deadline: deadlines.Deadline = None):
+        """
+        Attaches an image to a VM
+        :param multi_attach: Whether the image is shareable and may be
+                             attached to other VMs, in which case OpenNebula
+                             would attach it twice to the same VM on a retry
+        """
+        if multi_attach and vm_id in self._get_image(image_id).vms:
+            logger.debug(f"Image ID {image_id} is already attached to VM ID {vm_id}")
+            return
+
         try:
             self._execute_vm_action(self._one_api.vm.attach,
                                     vm_id,
-                                    f"DISK=[IMAGE_ID = \"{image_id}\"]",
-                                    wait_settle_vm_state=wait_settle_vm_action)
+                                    self._render_disk_template(image_id, disk_attributes or {}),
+                                    wait_settle_vm_state=wait_settle_vm_action,
+                                    deadline=deadline)
         except pyone.OneNoExistsException as error:
             if "Error getting virtual machine" in str(error):
                 error_message = f"Could not find VM ID {vm_id} in OpenNebula while attaching image {image_id}"
@@ -311,12 +1237,17 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                 raise NotFound(error_message)
         except pyone.OneActionException as error:
             if "already in use" in str(error):
-                image = self._one_api.image.info(int(image_id))
-                attached_vm_id = image.get_VMS().get_ID()[0]
-                if int(attached_vm_id) != vm_id:
-                    error_message = f"Image ID {image_id} is already attached to VM ID {attached_vm_id}"
+                attached_vm_ids = self._get_image(image_id).vms
+                if vm_id not in attached_vm_ids:
+                    error_message = (f"Image ID {image_id} is already attached to VM ID "
+                                     f"{', '.join(str(attached_vm_id) for attached_vm_id in attached_vm_ids)}")
+                    if multi_attach:
+                        error_message += ", and OpenNebula does not share it"
                     logger.error(error_message)
                     raise FailedPrecondition(error_message)
+            else:
+                logger.error(f"Attaching image ID {image_id} to VM ID {vm_id} failed: {error}")
+                raise Internal(str(error))
         except pyone.OneException as error:
             logger.error(f"OpenNebula API returned the following error: {str(error)}")
             raise Internal(str(error))
@@ -324,7 +1255,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
     def _detach_image(self,
                       vm_id: int,
                       image_id: int,
-                      wait_settle_vm_action: bool = False) -> None:
+                      wait_settle_vm_action: bool = False,
+                      deadline: deadlines.Deadline = None) -> None:
         try:
             vm_template = self._one_api.vm.info(vm_id).get_TEMPLATE()
 
@@ -338,7 +1270,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                         self._execute_vm_action(self._one_api.vm.detach,
                                                 vm_id,
                                                 int(disk_attachment["DISK_ID"]),
-                                                wait_settle_vm_state=wait_settle_vm_action)
+                                                wait_settle_vm_state=wait_settle_vm_action,
+                                                deadline=deadline)
                         return
 
         except pyone.OneNoExistsException as error:
@@ -350,7 +1283,8 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                       attached_vm_id: int,
                       image_id: int,
                       new_size_in_mb: int,
-                      wait_settle_vm_action: bool = False) -> None:
+                      wait_settle_vm_action: bool = False,
+                      deadline: deadlines.Deadline = None) -> None:
         attached_vm_template = self._one_api.vm.info(int(attached_vm_id)).get_TEMPLATE()
 
         for disk_attachment in attached_vm_template["DISK"]:
@@ -359,33 +1293,322 @@ class ControllerServicer(csi_pb2_grpc.ControllerServicer):
                                         attached_vm_id,
                                         int(disk_attachment["DISK_ID"]),
                                         str(new_size_in_mb),
-                                        wait_settle_vm_state=wait_settle_vm_action)
+                                        wait_settle_vm_state=wait_settle_vm_action,
+                                        deadline=deadline)
                 return
 
+    def _update_disk(self,
+                     attached_vm_id: int,
+                     image_id: int,
+                     disk_attributes: dict,
+                     wait_settle_vm_action: bool = False,
+                     deadline: deadlines.Deadline = None) -> None:
+        attached_vm_template = self._one_api.vm.info(int(attached_vm_id)).get_TEMPLATE()
+        disks = attached_vm_template.get("DISK", [])
+
+        for disk_attachment in disks if isinstance(disks, list) else [disks]:
+            if "IMAGE_ID" in disk_attachment and int(disk_attachment["IMAGE_ID"]) == image_id:
+                self._execute_vm_action(self._one_api.vm.diskupdate,
+                                        attached_vm_id,
+                                        int(disk_attachment["DISK_ID"]),
+                                        "DISK=[" + ", ".join(f"{name} = \"{value}\""
+                                                             for name, value in disk_attributes.items()) + "]",
+                                        1,
+                                        wait_settle_vm_state=wait_settle_vm_action,
+                                        deadline=deadline)
+                return
+
+    def _make_image_shareable(self, image_id: int) -> None:
+        """
+        Lets OpenNebula attach a persistent image to several VMs at once, for
+        the images allocated before they were published to several nodes
+        :raises FailedPrecondition: If a VM still has the image attached
+                                    read-write, the readers would see the
+                                    writes of a file system mounted elsewhere
+        """
+        for attached_vm_id in self._get_image(image_id).vms:
+            try:
+                vm = self._get_vm(attached_vm_id)
+            except one_api.OneApiNoExistsError:
+                continue
+            if any(disk.image_id == image_id and not disk.readonly for disk in vm.disks):
+                error_message = (f"Image ID {image_id} is attached read-write to VM ID {attached_vm_id}, "
+                                 f"it cannot be published read-only to several nodes until it is detached")
+                logger.error(error_message)
+                raise FailedPrecondition(error_message)
+
+        image_template = self._one_api.image.info(image_id).get_TEMPLATE()
+        if image_template.get("PERSISTENT_TYPE") != "SHAREABLE":
+            logger.info(f"Making image ID {image_id} shareable")
+            self._one_api.image.update(image_id, 'PERSISTENT_TYPE = "SHAREABLE"', 1)
+
+    def _get_image_disk_throttling(self, image_id: int) -> dict:
+        """
+        Returns the disk throttling attributes stored in the template of an
+        image by CreateVolume and ControllerModifyVolume
+        """
+        try:
+            image_template = self._one_api.image.info(image_id).get_TEMPLATE()
+        except pyone.OneNoExistsException:
+            error_message = f"Image ID {image_id} does not exist in OpenNebula"
+            logger.error(error_message)
+            raise NotFound(error_message)
+
+        prefix = constant.DISK_THROTTLING_IMAGE_ATTRIBUTE_PREFIX
+        return {
+            name[len(prefix):]: value
+            for name, value in image_template.items()
+            if name.startswith(prefix) and name[len(prefix):] in constant.DISK_THROTTLING_PARAMETERS.values()
+        }
+
     @staticmethod
     def _execute_vm_action(api_action: Callable,
                            *api_args,
-                           wait_settle_vm_state: bool = False) -> None:
-        for i in range(1, 30 if wait_settle_vm_state else 1):
+                           wait_settle_vm_state: bool = False,
+                           deadline: deadlines.Deadline = None):
+        deadline = deadline or deadlines.Deadline()
+        attempts = VM_ACTION_ATTEMPTS if wait_settle_vm_state else 1
+        for i in range(1, attempts + 1):
+            deadline.check(f"calling {api_action}")
             try:
                 logger.debug(f"Calling {api_action} with arguments {api_args}")
-                api_action(*api_args)
-                return
+                return api_action(*api_args)
             except pyone.OneActionException as error:
-                if "wrong state" in str(error):
-                    sleep(i)
-                else:
+                if "wrong state" not in str(error):
                     raise
+                if i == attempts:
+                    error_message = f"{api_action} failed after {attempts} attempt(s), the VM is busy: {error}"
+                    logger.error(error_message)
+                    raise Aborted(error_message)
+                deadline.sleep(i, f"calling {api_action}")
 
     @staticmethod
-    def _build_create_volume_response(volume_id: str, capacity_bytes: int):
+    def _build_snapshot(state: snapshots.SnapshotState):
+        snapshot = csi_pb2.Snapshot(size_bytes=state.size_bytes,
+                                    snapshot_id=state.snapshot_id,
+                                    source_volume_id=state.source_volume_id,
+                                    ready_to_use=state.ready)
+        snapshot.creation_time.seconds = state.creation_time
+        return snapshot
+
+    def _build_create_volume_response(self,
+                                      volume_id: str,
+                                      capacity_bytes: int,
+                                      volume_context: dict,
+                                      cluster_ids: Optional[list[int]] = None):
         response = csi_pb2.CreateVolumeResponse()
 
         response.volume.volume_id = volume_id
         response.volume.capacity_bytes = capacity_bytes
+        response.volume.volume_context.update(volume_context)
+
+        # Without requirements the nodes report no topology, so a topology
+        # returned anyway would make the volume unusable on all of them
+        if cluster_ids:
+            for cluster_id in self._datastore_placer.clusters_of(int(volume_context["datastore_id"])):
+                response.volume.accessible_topology.add().segments[constant.TOPOLOGY_CLUSTER_KEY] = str(cluster_id)
 
         return response
 
+    @staticmethod
+    def _parse_topology_requirements(accessibility_requirements) -> list[int]:
+        """
+        Returns the OpenNebula clusters from which a new volume must be
+        accessible, the preferred ones first
+        """
+        cluster_ids = []
+        for topology in [*accessibility_requirements.preferred, *accessibility_requirements.requisite]:
+            cluster_id = topology.segments.get(constant.TOPOLOGY_CLUSTER_KEY)
+            if cluster_id is None:
+                continue
+            if not cluster_id.isdigit():
+                raise InvalidArgument(f"Invalid cluster ID {cluster_id} in the topology requirements")
+            if int(cluster_id) not in cluster_ids:
+                cluster_ids.append(int(cluster_id))
+        return cluster_ids
+
+    @staticmethod
+    def _parse_placement_parameters(parameters) -> tuple[list[int], str, dict]:
+        """
+        Returns the datastores a volume may be placed on, the placement policy
+        and the datastore weights used by weighted round-robin
+        """
+        try:
+            if "datastore_ids" in parameters:
+                datastore_ids = [int(datastore_id) for datastore_id in parameters["datastore_ids"].split(",")
+                                 if datastore_id.strip()]
+            elif "datastore_id" in parameters:
+                datastore_ids = [int(parameters["datastore_id"])]
+            else:
+                logger.warning("OpenNebula datastore ID was not explicitly specified, falling back to datastore ID 0")
+                datastore_ids = [0]
+
+            datastore_weights = {}
+            for datastore_weight in parameters.get("datastore_weights", "").split(","):
+                if datastore_weight.strip():
+                    datastore_id, weight = datastore_weight.split(":")
+                    datastore_weights[int(datastore_id)] = int(weight)
+        except ValueError as error:
+            raise InvalidArgument(f"Invalid datastore placement parameters: {error}")
+
+        if not datastore_ids:
+            raise InvalidArgument("StorageClass parameter datastore_ids is empty")
+
+        placement_policy = parameters.get("placement_policy", constant.PLACEMENT_MOST_FREE)
+        if placement_policy not in constant.PLACEMENT_POLICIES:
+            raise InvalidArgument(f"Unsupported placement policy {placement_policy}, "
+                                  f"expected one of: {', '.join(constant.PLACEMENT_POLICIES)}")
+
+        return datastore_ids, placement_policy, datastore_weights
+
+    @staticmethod
+    def _build_volume_context(parameters) -> dict:
+        """
+        Validates the StorageClass parameters consumed by the node plugin and
+        returns them as the volume context passed to NodeStageVolume
+        """
+        volume_context = {}
+
+        discard_mode = parameters.get("discard", constant.DISCARD_ONLINE)
+        if discard_mode not in constant.DISCARD_MODES:
+            raise InvalidArgument(f"Unsupported discard mode {discard_mode}, "
+                                  f"expected one of: {', '.join(constant.DISCARD_MODES)}")
+        volume_context["discard"] = discard_mode
+
+        for parameter in constant.BLOCK_QUEUE_PARAMETERS:
+            if parameter not in parameters:
+                continue
+
+            value = parameters[parameter]
+            if parameter == "io_scheduler":
+                if value not in constant.BLOCK_QUEUE_SCHEDULERS:
+                    raise InvalidArgument(f"Unsupported I/O scheduler {value}, "
+                                          f"expected one of: {', '.join(constant.BLOCK_QUEUE_SCHEDULERS)}")
+            elif not value.isdigit() or int(value) == 0:
+                raise InvalidArgument(f"StorageClass parameter {parameter} must be a positive integer, got {value}")
+            volume_context[parameter] = value
+
+        for parameter, (attribute, allowed_values) in constant.DISK_ATTACH_PARAMETERS.items():
+            if parameter not in parameters:
+                continue
+
+            value = parameters[parameter]
+            if allowed_values is not None:
+                if value not in allowed_values:
+                    raise InvalidArgument(f"Unsupported {parameter} {value}, "
+                                          f"expected one of: {', '.join(allowed_values)}")
+            elif not value.isdigit() and not (attribute == "VIRTIO_BLK_QUEUES" and value == "auto"):
+                raise InvalidArgument(f"StorageClass parameter {parameter} must be an integer, got {value}")
+            volume_context[parameter] = value
+
+        cache_mode = parameters.get("cache_mode", constant.CACHE_MODE_NONE)
+        if cache_mode not in constant.CACHE_MODES:
+            raise InvalidArgument(f"Unsupported cache mode {cache_mode}, "
+                                  f"expected one of: {', '.join(constant.CACHE_MODES)}")
+        if cache_mode in constant.CACHE_WRITE_BACK_MODES and parameters.get("cache_accept_data_loss") != "true":
+            raise InvalidArgument(f"Cache mode {cache_mode} loses the writes not yet written back to the volume "
+                                  f"when the node is lost, set cache_accept_data_loss: \"true\" to use it")
+        if cache_mode != constant.CACHE_MODE_NONE:
+            volume_context["cache_mode"] = cache_mode
+            cache_size = parameters.get("cache_size_mib", str(constant.DEFAULT_CACHE_SIZE_MIB))
+            if not cache_size.isdigit() or int(cache_size) == 0:
+                raise InvalidArgument(f"StorageClass parameter cache_size_mib must be a positive integer, "
+                                      f"got {cache_size}")
+            volume_context["cache_size_mib"] = cache_size
+
+        if (volume_context.get("disk_io") == "native"
+                and volume_context.get("disk_cache", "none") not in ("none", "directsync")):
+            raise InvalidArgument("disk_io: native requires disk_cache to be none or directsync")
+
+        return volume_context
+
+    @staticmethod
+    def _build_import_attributes(parameters) -> tuple[dict, str]:
+        """
+        Validates the StorageClass parameters importing a dataset into new
+        volumes and returns the image attributes making oned fetch it
+        :return: The image attributes and a description of the source, an
+                 empty dict if the volumes are created empty
+        """
+        import_url = parameters.get("import_url")
+        marketplace_app_id = parameters.get("import_marketplace_app_id")
+        if import_url and marketplace_app_id:
+            raise InvalidArgument("StorageClass parameters import_url and import_marketplace_app_id "
+                                  "are mutually exclusive")
+
+        if import_url:
+            # Plain paths would be read from the file system of the front-end
+            url = urlparse(import_url)
+            if url.scheme not in constant.IMPORT_URL_SCHEMES or not url.netloc:
+                raise InvalidArgument(f"Unsupported import URL {import_url}, "
+                                      f"expected one of the schemes: {', '.join(constant.IMPORT_URL_SCHEMES)}")
+            return {"PATH": import_url}, import_url
+
+        if marketplace_app_id:
+            if not marketplace_app_id.isdigit():
+                raise InvalidArgument(f"StorageClass parameter import_marketplace_app_id must be an integer, "
+                                      f"got {marketplace_app_id}")
+            return {"FROM_APP": marketplace_app_id}, f"marketplace app {marketplace_app_id}"
+
+        return {}, ""
+
+    @staticmethod
+    def _build_disk_throttling(parameters, mutable: bool = False) -> dict:
+        """
+        Validates the disk throttling parameters of a StorageClass or a
+        VolumeAttributesClass and returns them as DISK attributes
+        :param mutable: Whether the parameters are mutable parameters, which
+                        may only contain disk throttling parameters
+        """
+        disk_throttling = {}
+        for parameter, value in parameters.items():
+            if parameter not in constant.DISK_THROTTLING_PARAMETERS:
+                if mutable:
+                    raise InvalidArgument(f"Unsupported mutable parameter {parameter}, expected one of: "
+                                          f"{', '.join(constant.DISK_THROTTLING_PARAMETERS)}")
+                continue
+
+            if not value.isdigit():
+                raise InvalidArgument(f"Parameter {parameter} must be a non-negative integer, got {value}")
+            disk_throttling[constant.DISK_THROTTLING_PARAMETERS[parameter]] = value
+
+        return disk_throttling
+
+    @staticmethod
+    def _check_disk_throttling(disk_throttling: dict) -> None:
+        """
+        Rejects total limits combined with read or write limits of the same
+        kind, which QEMU does not accept
+        """
+        for kind in ("BYTES_SEC", "IOPS_SEC"):
+            if (int(disk_throttling.get(f"TOTAL_{kind}", 0))
+                    and (int(disk_throttling.get(f"READ_{kind}", 0)) or int(disk_throttling.get(f"WRITE_{kind}", 0)))):
+                raise InvalidArgument(f"TOTAL_{kind} cannot be combined with READ_{kind} or WRITE_{kind}, "
+                                      f"set the ones which are not wanted to 0")
+
+    @staticmethod
+    def _render_image_disk_throttling(disk_throttling: dict) -> dict:
+        return {
+            f"{constant.DISK_THROTTLING_IMAGE_ATTRIBUTE_PREFIX}{name}": value
+            for name, value in disk_throttling.items()
+        }
+
+    @staticmethod
+    def _get_disk_attributes(volume_context) -> dict:
+        """
+        Returns the DISK attributes requested by the StorageClass of a volume
+        """
+        return {
+            attribute: volume_context[parameter]
+            for parameter, (attribute, _) in constant.DISK_ATTACH_PARAMETERS.items()
+            if parameter in volume_context
+        }
+
+    @staticmethod
+    def _render_disk_template(image_id: int, disk_attributes: dict) -> str:
+        attributes = {"IMAGE_ID": image_id, **disk_attributes}
+        return "DISK=[" + ", ".join(f"{name} = \"{value}\"" for name, value in attributes.items()) + "]"
+
     @staticmethod
     def _determine_volume_size(capacity_range):
         logger.debug(f"Required bytes: {capacity_range.required_bytes}, limit bytes: {capacity_range.limit_bytes}")
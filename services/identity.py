@@ -16,8 +16,9 @@ class IdentityServicer(csi_pb2_grpc.IdentityServicer):
     Implements IndentityService from the CSI spec
     """
 
-    def __int__(self, ready: bool = False):
+    def __init__(self, ready: bool = False, controller_service: bool = True):
         self._ready = ready
+        self._controller_service = controller_service
 
     def set_ready(self, value: bool) -> None:
         """
@@ -36,9 +37,15 @@ class IdentityServicer(csi_pb2_grpc.IdentityServicer):
     def GetPluginCapabilities(self, request, context):
         response = csi_pb2.GetPluginCapabilitiesResponse()
 
-        controller_capability = response.capabilities.add()
-        controller_capability.service.type = (
-            controller_capability.Service.CONTROLLER_SERVICE
+        if self._controller_service:
+            controller_capability = response.capabilities.add()
+            controller_capability.service.type = (
+                controller_capability.Service.CONTROLLER_SERVICE
+            )
+
+        topology_capability = response.capabilities.add()
+        topology_capability.service.type = (
+            topology_capability.Service.VOLUME_ACCESSIBILITY_CONSTRAINTS
         )
 
         return response
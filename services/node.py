@@ -4,20 +4,35 @@ Bla-bla
 import distutils.util
 import logging
 import subprocess
-import os
+import xmlrpc.client
 
 from pathlib import Path
+from typing import Optional
 
 from grpc_interceptor.exceptions import (
     NotFound,
     Internal,
     AlreadyExists,
     InvalidArgument,
+    FailedPrecondition,
+    GrpcException,
+    Unavailable,
 )
 from pb import csi_pb2
 from pb import csi_pb2_grpc
 
+import block_queue
+import cache_tier
+import concurrency
+import constant
+import deadlines
+import disk_slots
+import ephemeral
+import metrics
+import one_api
+import trim
 import utils
+import volume_stats
 
 RESIZE_TOOL_MAP = {
     "ext4": "/sbin/resize2fs"
@@ -86,14 +101,22 @@ def image_get_mount_info(image_path: str) -> dict:
     ][0]
 
 
-def generate_mount_options(readonly: bool, mount_flags) -> str:
+def generate_mount_options(readonly: bool,
+                           mount_flags,
+                           online_discard: bool = True,
+                           file_system: str = None) -> str:
     """
     Generates mount options taking into account if the volume is read-only
+    and whether it should be mounted with online discard. Volumes shared
+    read-only between nodes are mounted without journal replay, which would
+    write to them, when the file system is given.
     """
-    mount_options = ["discard"]
+    mount_options = ["discard"] if online_discard else []
 
     if readonly:
         mount_options.append("ro")
+        if file_system in constant.NO_JOURNAL_REPLAY_MOUNT_OPTIONS:
+            mount_options.append(constant.NO_JOURNAL_REPLAY_MOUNT_OPTIONS[file_system])
     else:
         mount_options.append("rw")
 
@@ -110,14 +133,79 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
     Provides NodeService implementation
     """
 
-    def __init__(self, my_vm_id: int):
+    def __init__(self,
+                 my_vm_id: int,
+                 heavy_io_workers: int = 2,
+                 heavy_io_max_pending: int = 6,
+                 stats_interval: float = 15,
+                 trim_interval: float = 86400,
+                 trim_max_duration: float = 600,
+                 trim_bandwidth: int = 0,
+                 state_dir: str = "/var/lib/kubelet/plugins/csi.opennebula.io/state",
+                 one_api_endpoint: str = None,
+                 one_api_auth: str = None,
+                 max_volumes_per_node: int = 0,
+                 volume_dev_prefix: str = "",
+                 cache_device: str = "",
+                 max_concurrent_hotplugs: int = 1):
         self._node_id = my_vm_id
+        self._one_api_endpoint = one_api_endpoint
+        self._one_api_auth = one_api_auth
+        vm = self._get_own_vm(one_api_endpoint, one_api_auth)
+        self._max_volumes_per_node = max_volumes_per_node or self._determine_max_volumes_per_node(
+            vm, volume_dev_prefix
+        )
+        self._accessible_topology = self._determine_accessible_topology(vm)
+        self._volume_locks = concurrency.VolumeLocks()
+        self._heavy_io = concurrency.HeavyOperationPool(
+            max_workers=heavy_io_workers, max_pending=heavy_io_max_pending
+        )
+        self._volume_stats = volume_stats.VolumeStatsCollector(interval=stats_interval)
+        self._volume_stats.start()
+        metrics.register_collector(self._volume_stats.metrics)
+
+        self._trim_scheduler = trim.TrimScheduler(interval=trim_interval,
+                                                  max_duration=trim_max_duration,
+                                                  bandwidth=trim_bandwidth)
+        for volume in volume_stats.discover_staged_volumes():
+            if "discard" not in volume["options"] and "ro" not in volume["options"]:
+                self._trim_scheduler.track(volume["volume_id"], volume["staging_path"])
+        self._trim_scheduler.start()
+        metrics.register_collector(self._trim_scheduler.metrics)
+
+        self._block_queue = block_queue.BlockQueueTuner(state_dir=state_dir)
+        metrics.register_collector(self._block_queue.metrics)
+
+        self._cache_tier = cache_tier.CacheTier(state_dir=state_dir, cache_device=cache_device)
+        metrics.register_collector(self._cache_tier.metrics)
+
+        self._ephemeral_disks = ephemeral.EphemeralDisks(one_api_endpoint=one_api_endpoint,
+                                                         one_api_auth=one_api_auth,
+                                                         vm_id=my_vm_id,
+                                                         state_dir=state_dir,
+                                                         max_concurrent_hotplugs=max_concurrent_hotplugs,
+                                                         dev_prefix=volume_dev_prefix)
+        metrics.register_collector(self._ephemeral_disks.metrics)
 
     def NodeGetInfo(self, request, context):
-        return csi_pb2.NodeGetInfoResponse(
+        response = csi_pb2.NodeGetInfoResponse(
             node_id=str(self._node_id),
-            max_volumes_per_node=20,
+            max_volumes_per_node=self._max_volumes_per_node,
         )
+        # The controller advertises the topology capability, so a node without
+        # topology labels could not use the volumes provisioned for the others
+        if self._accessible_topology is None:
+            self._accessible_topology = self._determine_accessible_topology(
+                self._get_own_vm(self._one_api_endpoint, self._one_api_auth)
+            )
+        if self._accessible_topology is None:
+            error_message = (f"The placement of VM ID {self._node_id} is unknown, the node cannot be registered "
+                             f"without its topology")
+            logger.error(error_message)
+            raise Unavailable(error_message)
+
+        response.accessible_topology.CopyFrom(self._accessible_topology)
+        return response
 
     def NodeGetCapabilities(self, request, context):
         response = csi_pb2.NodeGetCapabilitiesResponse()
@@ -131,6 +219,9 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
         volume_stats_cap = response.capabilities.add()
         volume_stats_cap.rpc.type = volume_stats_cap.RPC.GET_VOLUME_STATS
 
+        volume_condition_cap = response.capabilities.add()
+        volume_condition_cap.rpc.type = volume_condition_cap.RPC.VOLUME_CONDITION
+
         return response
 
     def NodeStageVolume(self, request, context):
@@ -152,149 +243,199 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
             logger.error(f"Image target path {image_device_path} does not exist at VM ID {self._node_id}")
             raise NotFound(f"Could not locate image ID {request.volume_id} path at VM ID {self._node_id}")
 
-        if request.volume_capability.WhichOneof("access_type") == "mount":
-            logger.info(
-                "Staging mount volume: %s to path: %s",
-                request.volume_id,
-                request.staging_target_path,
-            )
+        deadline = deadlines.Deadline(context)
 
-            image_requested_fs = "ext4"
+        with self._volume_locks.acquire(request.volume_id, "NodeStageVolume"), \
+                self._trim_scheduler.pause(request.volume_id, deadline):
+            if request.volume_capability.WhichOneof("access_type") == "mount":
+                logger.info(
+                    "Staging mount volume: %s to path: %s",
+                    request.volume_id,
+                    request.staging_target_path,
+                )
 
-            if request.volume_capability.mount.fs_type:
-                image_requested_fs = request.volume_capability.mount.fs_type
-                logger.debug(f"CO specified file system: {image_requested_fs}")
+                image_requested_fs = "ext4"
 
-            logger.debug(f"CO specified readonly: {request.publish_context['readonly']}")
+                if request.volume_capability.mount.fs_type:
+                    image_requested_fs = request.volume_capability.mount.fs_type
+                    logger.debug(f"CO specified file system: {image_requested_fs}")
 
-            if request.volume_capability.mount.mount_flags:
-                logger.debug(f"CO specified the following mount options: {request.volume_capability.mount.mount_flags}")
+                logger.debug(f"CO specified readonly: {request.publish_context['readonly']}")
 
-            mount_options = generate_mount_options(
-                bool(
+                if request.volume_capability.mount.mount_flags:
+                    logger.debug(f"CO specified the following mount options: {request.volume_capability.mount.mount_flags}")
+
+                shared = (request.volume_capability.access_mode.mode
+                          == request.volume_capability.AccessMode.MULTI_NODE_READER_ONLY)
+                readonly = shared or bool(
                     distutils.util.strtobool(
                         request.publish_context["readonly"]
                     )
-                ),
-                request.volume_capability.mount.mount_flags,
-            )
+                )
 
-            if not image_is_mounted(image_device_path):
-                if not image_is_formatted(image_device_path):
+                discard_mode = request.volume_context.get("discard", constant.DISCARD_ONLINE)
+                logger.debug(f"Volume {request.volume_id} discard mode: {discard_mode}")
+
+                mount_options = generate_mount_options(
+                    readonly,
+                    request.volume_capability.mount.mount_flags,
+                    online_discard=discard_mode == constant.DISCARD_ONLINE,
+                    file_system=image_requested_fs if shared else None,
+                )
+
+                cache_mode = request.volume_context.get("cache_mode", constant.CACHE_MODE_NONE)
+                if shared and cache_mode != constant.CACHE_MODE_NONE:
+                    error_message = f"Volume {request.volume_id} is shared read-only between nodes and cannot be cached"
+                    logger.error(error_message)
+                    raise FailedPrecondition(error_message)
+
+                self._block_queue.apply(request.volume_id,
+                                        utils.get_block_device_name(image_device_path),
+                                        request.volume_context)
+
+                image_device_path = self._cache_tier.setup(request.volume_id,
+                                                           image_device_path,
+                                                           request.volume_context)
+
+                if not image_is_mounted(image_device_path):
+                    if shared and not image_is_formatted(image_device_path):
+                        error_message = (f"Volume {request.volume_id} is shared read-only between nodes "
+                                         f"but has no file system")
+                        logger.error(error_message)
+                        raise FailedPrecondition(error_message)
+                    elif shared:
+                        logger.debug(f"Volume {request.volume_id} is shared read-only, skipping fsck and resize")
+                    elif not image_is_formatted(image_device_path):
+                        logger.debug(
+                            """Volume %s is not formatted, formatting with %s""",
+                            request.volume_id,
+                            image_requested_fs,
+                        )
+                        format_command = self._heavy_io.run(
+                            f"format of volume {request.volume_id}",
+                            subprocess.run,
+                            [
+                                "mkfs." + image_requested_fs,
+                                image_device_path,
+                            ],
+                            stdout=subprocess.DEVNULL,
+                            encoding="utf-8",
+                            capture_output=False,
+                            check=False,
+                            deadline=deadline,
+                        )
+                        if format_command.returncode != 0:
+                            logger.error(
+                                """Failed to format volume %s with the following error: %s""",
+                                request.volume_id,
+                                format_command.stderr,
+                            )
+                            raise Internal(
+                                f"""StorPool volume {request.volume_id} format
+                                 failed with error: {format_command.stderr}"""
+                            )
+                    else:
+                        image_current_fs = image_get_fs(image_device_path)
+                        if image_requested_fs != image_current_fs:
+                            logger.error(
+                                """Volume %s is already formatted with %s""",
+                                request.volume_id,
+                                image_current_fs,
+                            )
+                            raise AlreadyExists(
+                                f"""StorPool volume {request.volume_id} is already formatted
+                                 with {image_current_fs} but CO tried to
+                                 stage it with {image_requested_fs}"""
+                            )
+                        else:
+                            fsck_command = self._heavy_io.run(
+                                f"fsck of volume {request.volume_id}",
+                                subprocess.run,
+                                [
+                                    "fsck",
+                                    "-T",
+                                    "-fp",
+                                    image_device_path,
+                                ],
+                                encoding="utf-8",
+                                capture_output=True,
+                                check=False,
+                                deadline=deadline,
+                            )
+
+                            if fsck_command.returncode != 0:
+                                error_message = f"Running fsck on {image_device_path} failed with code: {fsck_command.returncode}"
+                                logger.error(error_message)
+                                logger.error(f"Output: {fsck_command.stdout}")
+                                logger.error(f"Error: {fsck_command.stderr}")
+                                raise Internal(error_message)
+
+                            self._heavy_io.run(f"resize of volume {request.volume_id}",
+                                               self._extend_image,
+                                               image_device_path,
+                                               image_current_fs,
+                                               deadline=deadline)
+
+                    deadline.check(f"mounting volume {request.volume_id}")
                     logger.debug(
-                        """Volume %s is not formatted, formatting with %s""",
-                        request.volume_id,
-                        image_requested_fs,
+                        f"Volume {request.volume_id} is not mounted, mounting at {request.staging_target_path}"
                     )
-                    format_command = subprocess.run(
+
+                    mount_command = subprocess.run(
                         [
-                            "mkfs." + image_requested_fs,
+                            "mount",
+                            "-o",
+                            mount_options,
                             image_device_path,
+                            request.staging_target_path,
                         ],
-                        stdout=subprocess.DEVNULL,
                         encoding="utf-8",
-                        capture_output=False,
+                        capture_output=True,
                         check=False,
                     )
-                    if format_command.returncode != 0:
+
+                    if mount_command.returncode != 0:
                         logger.error(
-                            """Failed to format volume %s with the following error: %s""",
+                            """Failed to mount volume %s with the following error: %s""",
                             request.volume_id,
-                            format_command.stderr,
+                            mount_command.stderr,
                         )
                         raise Internal(
-                            f"""StorPool volume {request.volume_id} format
-                             failed with error: {format_command.stderr}"""
+                            f"""The following error occurred while
+                            mounting StorPool volume {request.volume_id}: {mount_command.stderr}"""
                         )
                 else:
-                    image_current_fs = image_get_fs(image_device_path)
-                    if image_requested_fs != image_current_fs:
+                    image_mount_info = image_get_mount_info(request.volume_id)
+
+                    if image_mount_info["target"] != request.staging_target_path:
                         logger.error(
-                            """Volume %s is already formatted with %s""",
+                            """Volume %s is already mounted at %s""",
                             request.volume_id,
-                            image_current_fs,
+                            request.staging_target_path,
                         )
                         raise AlreadyExists(
-                            f"""StorPool volume {request.volume_id} is already formatted
-                             with {image_current_fs} but CO tried to
-                             stage it with {image_requested_fs}"""
-                        )
-                    else:
-                        fsck_command = subprocess.run(
-                            [
-                                "fsck",
-                                "-T",
-                                "-fp",
-                                image_device_path,
-                            ],
-                            encoding="utf-8",
-                            capture_output=True,
-                            check=False,
+                            f"""StorPool volume {request.volume_id} is
+                             already mounted at {image_mount_info['target']}"""
                         )
 
-                        if fsck_command.returncode != 0:
-                            error_message = f"Running fsck on {image_device_path} failed with code: {fsck_command.returncode}"
-                            logger.error(error_message)
-                            logger.error(f"Output: {fsck_command.stdout}")
-                            logger.error(f"Error: {fsck_command.stderr}")
-                            raise Internal(error_message)
-
-                        self._extend_image(image_device_path, image_current_fs)
-
-                logger.debug(
-                    f"Volume {request.volume_id} is not mounted, mounting at {request.staging_target_path}"
-                )
-
-                mount_command = subprocess.run(
-                    [
-                        "mount",
-                        "-o",
-                        mount_options,
-                        image_device_path,
-                        request.staging_target_path,
-                    ],
-                    encoding="utf-8",
-                    capture_output=True,
-                    check=False,
-                )
-
-                if mount_command.returncode != 0:
-                    logger.error(
-                        """Failed to mount volume %s with the following error: %s""",
-                        request.volume_id,
-                        mount_command.stderr,
-                    )
-                    raise Internal(
-                        f"""The following error occurred while
-                        mounting StorPool volume {request.volume_id}: {mount_command.stderr}"""
-                    )
-            else:
-                image_mount_info = image_get_mount_info(request.volume_id)
+                    if (
+                        request.volume_capability.mount.mount_flags
+                        and image_mount_info["options"] != mount_options
+                    ):
+                        logger.error(
+                            """Volume %s is already mounted with %s""",
+                            request.volume_id,
+                            image_mount_info["options"],
+                        )
+                        raise AlreadyExists(
+                            f"""StorPool volume {request.volume_id} is
+                             already mounted with {image_mount_info['options']}"""
+                        )
 
-                if image_mount_info["target"] != request.staging_target_path:
-                    logger.error(
-                        """Volume %s is already mounted at %s""",
-                        request.volume_id,
-                        request.staging_target_path,
-                    )
-                    raise AlreadyExists(
-                        f"""StorPool volume {request.volume_id} is
-                         already mounted at {image_mount_info['target']}"""
-                    )
+                self._volume_stats.track(request.volume_id, request.staging_target_path, readonly)
 
-                if (
-                    request.volume_capability.mount.mount_flags
-                    and image_mount_info["options"] != mount_options
-                ):
-                    logger.error(
-                        """Volume %s is already mounted with %s""",
-                        request.volume_id,
-                        image_mount_info["options"],
-                    )
-                    raise AlreadyExists(
-                        f"""StorPool volume {request.volume_id} is
-                         already mounted with {image_mount_info['options']}"""
-                    )
+                if discard_mode == constant.DISCARD_SCHEDULED and not readonly:
+                    self._trim_scheduler.track(request.volume_id, request.staging_target_path)
 
         return csi_pb2.NodeStageVolumeResponse()
 
@@ -305,25 +446,35 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
         if not request.staging_target_path:
             raise InvalidArgument("Missing stating target path")
 
-        for mount in utils.get_mounted_devices():
-            if mount["target"] == request.staging_target_path:
-                logger.debug(f"Image ID {request.volume_id} is mounted, unmounting")
-                unmount_command = subprocess.run(
-                    ["umount", request.staging_target_path],
-                    encoding="utf-8",
-                    capture_output=True,
-                    check=False,
-                )
-                if unmount_command.returncode != 0:
-                    logger.error(
-                        """Failed to unmount volume %s with the following error: %s""",
-                        request.volume_id,
-                        unmount_command.stderr,
-                    )
-                    raise Internal(
-                        f"The following error occurred while unmounting "
-                        f"StorPool volume {request.volume_id}: {unmount_command.stderr}"
+        deadline = deadlines.Deadline(context)
+        deadline.check(f"unstaging volume {request.volume_id}")
+
+        with self._volume_locks.acquire(request.volume_id, "NodeUnstageVolume"), \
+                self._trim_scheduler.pause(request.volume_id, deadline):
+            for mount in utils.get_mounted_devices():
+                if mount["target"] == request.staging_target_path:
+                    logger.debug(f"Image ID {request.volume_id} is mounted, unmounting")
+                    unmount_command = subprocess.run(
+                        ["umount", request.staging_target_path],
+                        encoding="utf-8",
+                        capture_output=True,
+                        check=False,
                     )
+                    if unmount_command.returncode != 0:
+                        logger.error(
+                            """Failed to unmount volume %s with the following error: %s""",
+                            request.volume_id,
+                            unmount_command.stderr,
+                        )
+                        raise Internal(
+                            f"The following error occurred while unmounting "
+                            f"StorPool volume {request.volume_id}: {unmount_command.stderr}"
+                        )
+
+            self._cache_tier.teardown(request.volume_id, deadline)
+            self._volume_stats.untrack(request.volume_id)
+            self._trim_scheduler.untrack(request.volume_id)
+            self._block_queue.restore(request.volume_id)
 
         return csi_pb2.NodeUnstageVolumeRequest()
 
@@ -343,53 +494,62 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
             request.target_path,
         )
 
-        target_path = Path(request.target_path)
+        deadline = deadlines.Deadline(context)
+        deadline.check(f"publishing volume {request.volume_id}")
 
-        if not target_path.exists():
-            logger.debug(
-                "Target path %s doesn't exist, creating it.",
-                request.target_path,
-            )
-            target_path.mkdir(mode=755, parents=True, exist_ok=True)
+        with self._volume_locks.acquire(request.volume_id, "NodePublishVolume"):
+            target_path = Path(request.target_path)
 
-        if not target_path.is_mount():
-            logger.debug(
-                "Volume %s is not mounted, mounting it.", request.volume_id
-            )
-            mount_options = ["bind"]
+            if not target_path.exists():
+                logger.debug(
+                    "Target path %s doesn't exist, creating it.",
+                    request.target_path,
+                )
+                target_path.mkdir(mode=755, parents=True, exist_ok=True)
 
-            if request.readonly:
-                mount_options.append("ro")
-            else:
-                mount_options.append("rw")
+            if ephemeral.is_ephemeral(request.volume_context):
+                if not target_path.is_mount():
+                    self._publish_ephemeral_volume(request, deadline)
+            elif not target_path.is_mount():
+                logger.debug(
+                    "Volume %s is not mounted, mounting it.", request.volume_id
+                )
+                mount_options = ["bind"]
 
-            mount_options.extend(request.volume_capability.mount.mount_flags)
+                if (request.readonly
+                        or request.volume_capability.access_mode.mode
+                        == request.volume_capability.AccessMode.MULTI_NODE_READER_ONLY):
+                    mount_options.append("ro")
+                else:
+                    mount_options.append("rw")
 
-            mount_command = subprocess.run(
-                [
-                    "mount",
-                    "-o",
-                    ",".join(mount_options),
-                    request.staging_target_path,
-                    request.target_path,
-                ],
-                encoding="utf-8",
-                capture_output=False,
-                check=False,
-                stdout=subprocess.DEVNULL,
-            )
+                mount_options.extend(request.volume_capability.mount.mount_flags)
 
-            if mount_command.returncode != 0:
-                logger.error(
-                    "Binding volume %s failed with: %s",
-                    request.volume_id,
-                    mount_command.stderr,
-                )
-                raise Internal(
-                    f"""The following error occurred
-                     while binding StorPool volume {request.volume_id}: {mount_command.stderr}"""
+                mount_command = subprocess.run(
+                    [
+                        "mount",
+                        "-o",
+                        ",".join(mount_options),
+                        request.staging_target_path,
+                        request.target_path,
+                    ],
+                    encoding="utf-8",
+                    capture_output=False,
+                    check=False,
+                    stdout=subprocess.DEVNULL,
                 )
 
+                if mount_command.returncode != 0:
+                    logger.error(
+                        "Binding volume %s failed with: %s",
+                        request.volume_id,
+                        mount_command.stderr,
+                    )
+                    raise Internal(
+                        f"""The following error occurred
+                         while binding StorPool volume {request.volume_id}: {mount_command.stderr}"""
+                    )
+
         return csi_pb2.NodePublishVolumeResponse()
 
     def NodeUnpublishVolume(self, request, context):
@@ -407,53 +567,65 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
 
         target_path = Path(request.target_path)
 
-        if target_path.is_mount():
-            logger.debug(
-                "Volume %s is mounted, unmounting it", request.volume_id
-            )
-            unmount_command = subprocess.run(
-                ["umount", request.target_path],
-                encoding="utf-8",
-                capture_output=False,
-                check=False,
-                stdout=subprocess.DEVNULL,
-            )
+        deadline = deadlines.Deadline(context)
+        deadline.check(f"unpublishing volume {request.volume_id}")
 
-            if unmount_command.returncode != 0:
-                logger.error(
-                    "Unbinding volume %s failed with: %s",
-                    request.volume_id,
-                    unmount_command.stderr,
+        with self._volume_locks.acquire(request.volume_id, "NodeUnpublishVolume"):
+            if target_path.is_mount():
+                logger.debug(
+                    "Volume %s is mounted, unmounting it", request.volume_id
                 )
-                raise Internal(
-                    f"""The following error occurred while unbinding
-                     StorPool volume {request.volume_id}: {unmount_command.stderr}"""
+                unmount_command = subprocess.run(
+                    ["umount", request.target_path],
+                    encoding="utf-8",
+                    capture_output=False,
+                    check=False,
+                    stdout=subprocess.DEVNULL,
                 )
 
-        if target_path.is_dir():
-            logger.debug(
-                "Volume target path %s exists, removing it",
-                request.target_path,
-            )
-            remove_target_path_command = subprocess.run(
-                ["rmdir", request.target_path],
-                encoding="utf-8",
-                capture_output=False,
-                check=False,
-                stdout=subprocess.DEVNULL,
-            )
+                if unmount_command.returncode != 0:
+                    logger.error(
+                        "Unbinding volume %s failed with: %s",
+                        request.volume_id,
+                        unmount_command.stderr,
+                    )
+                    raise Internal(
+                        f"""The following error occurred while unbinding
+                         StorPool volume {request.volume_id}: {unmount_command.stderr}"""
+                    )
 
-            if remove_target_path_command.returncode != 0:
-                logger.error(
-                    """Failed to remove target path %s, error: %s""",
-                    request.volume_id,
-                    remove_target_path_command.stderr,
+            if target_path.is_dir():
+                logger.debug(
+                    "Volume target path %s exists, removing it",
+                    request.target_path,
                 )
-                raise Internal(
-                    f"The following error occurred while removing the target path {request.volume_id}: "
-                    f"{remove_target_path_command.stderr}"
+                remove_target_path_command = subprocess.run(
+                    ["rmdir", request.target_path],
+                    encoding="utf-8",
+                    capture_output=False,
+                    check=False,
+                    stdout=subprocess.DEVNULL,
                 )
 
+                if remove_target_path_command.returncode != 0:
+                    logger.error(
+                        """Failed to remove target path %s, error: %s""",
+                        request.volume_id,
+                        remove_target_path_command.stderr,
+                    )
+                    raise Internal(
+                        f"The following error occurred while removing the target path {request.volume_id}: "
+                        f"{remove_target_path_command.stderr}"
+                    )
+
+            try:
+                if self._ephemeral_disks.detach(request.volume_id, deadline):
+                    self._volume_stats.untrack(request.volume_id)
+            except (one_api.OneApiError, OSError, xmlrpc.client.Error) as error:
+                error_message = f"Detaching the volatile disk of ephemeral volume {request.volume_id} failed: {error}"
+                logger.error(error_message)
+                raise Internal(error_message)
+
         return csi_pb2.NodeUnpublishVolumeResponse()
 
     def NodeGetVolumeStats(self, request, context):
@@ -469,15 +641,22 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
             request.volume_path,
         )
 
-        volume_path = Path(request.volume_path)
+        volume_sample = self._volume_stats.get(request.volume_id)
 
-        if not volume_path.exists():
-            logger.error(
-                "Volume path %s does not exist", request.volume_path
-            )
-            raise NotFound(f"Volume path {request.volume_path} does not exist")
-        
-        if not volume_path.is_mount():
+        if volume_sample is None:
+            logger.debug(f"Volume {request.volume_id} is not tracked yet, sampling it synchronously")
+            volume_path = Path(request.staging_target_path or request.volume_path)
+
+            if not volume_path.exists():
+                logger.error(
+                    "Volume path %s does not exist", volume_path
+                )
+                raise NotFound(f"Volume path {volume_path} does not exist")
+
+            self._volume_stats.track(request.volume_id, str(volume_path))
+            volume_sample = self._volume_stats.sample_volume(request.volume_id)
+
+        if not volume_sample.mounted:
             logger.error(
                 f"Volume {request.volume_id} is not attached to node {self._node_id}"
             )
@@ -485,41 +664,50 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
 
         response = csi_pb2.NodeGetVolumeStatsResponse()
 
-        try:
-            stat = os.statvfs(request.volume_path)
-            
-            bytes_usage = response.usage.add()
-            bytes_usage.unit = csi_pb2.VolumeUsage.Unit.BYTES
-            
-            bytes_usage.total = stat.f_blocks * stat.f_frsize
-            bytes_usage.available = stat.f_bavail * stat.f_frsize
-            bytes_usage.used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
-            
-            inodes_usage = response.usage.add()
-            inodes_usage.unit = csi_pb2.VolumeUsage.Unit.INODES
-            
-            inodes_usage.total = stat.f_files
-            inodes_usage.available = stat.f_favail
-            inodes_usage.used = stat.f_files - stat.f_ffree
-            
-            logger.debug(
-                "Volume %s stats: bytes total=%d, available=%d, used=%d; inodes total=%d, available=%d, used=%d",
-                request.volume_id,
-                bytes_usage.total,
-                bytes_usage.available,
-                bytes_usage.used,
-                inodes_usage.total,
-                inodes_usage.available,
-                inodes_usage.used,
-            )
+        bytes_usage = response.usage.add()
+        bytes_usage.unit = csi_pb2.VolumeUsage.Unit.BYTES
+        bytes_usage.total = volume_sample.bytes_total
+        bytes_usage.available = volume_sample.bytes_available
+        bytes_usage.used = volume_sample.bytes_used
+
+        inodes_usage = response.usage.add()
+        inodes_usage.unit = csi_pb2.VolumeUsage.Unit.INODES
+        inodes_usage.total = volume_sample.inodes_total
+        inodes_usage.available = volume_sample.inodes_available
+        inodes_usage.used = volume_sample.inodes_used
+
+        response.volume_condition.abnormal = volume_sample.abnormal
+        response.volume_condition.message = volume_sample.message
+
+        cache_stats = self._cache_tier.stats(request.volume_id)
+        if cache_stats is not None:
+            if cache_stats.error:
+                response.volume_condition.abnormal = True
+                response.volume_condition.message = "; ".join(
+                    message for message in (volume_sample.message, cache_stats.error) if message
+                )
+            elif not volume_sample.abnormal:
+                response.volume_condition.message = (
+                    f"{cache_stats.mode} cache: {cache_stats.read_hits} read hits, "
+                    f"{cache_stats.read_misses} read misses, {cache_stats.write_hits} write hits, "
+                    f"{cache_stats.write_misses} write misses, {cache_stats.dirty_bytes} dirty bytes"
+                )
 
-        except Exception as e:
-            logger.error(
-                "Failed to get volume stats for %s: %s",
-                request.volume_id,
-                str(e),
-            )
-            raise Internal(f"Failed to get volume stats: {str(e)}")
+        logger.debug(
+            "Volume %s stats: bytes total=%d, available=%d, used=%d; inodes total=%d, available=%d, used=%d; "
+            "condition abnormal=%s (%s); io=%s; cache=%s",
+            request.volume_id,
+            bytes_usage.total,
+            bytes_usage.available,
+            bytes_usage.used,
+            inodes_usage.total,
+            inodes_usage.available,
+            inodes_usage.used,
+            response.volume_condition.abnormal,
+            response.volume_condition.message,
+            volume_sample.io,
+            cache_stats,
+        )
 
         return response
 
@@ -536,14 +724,144 @@ class NodeServicer(csi_pb2_grpc.NodeServicer):
 
         logger.info(f"Extending image {request.volume_id} file system")
 
-        for mount in utils.get_mounted_devices():
-            if mount["target"] == request.staging_target_path:
-                logger.debug(f"Detected device {mount['device']} file system: {mount['filesystem']}")
+        with self._volume_locks.acquire(request.volume_id, "NodeExpandVolume"):
+            for mount in utils.get_mounted_devices():
+                if mount["target"] == request.staging_target_path:
+                    logger.debug(f"Detected device {mount['device']} file system: {mount['filesystem']}")
+
+                    self._cache_tier.resize(request.volume_id)
+
+                    self._heavy_io.run(f"resize of volume {request.volume_id}",
+                                       self._extend_image,
+                                       mount["device"],
+                                       mount["filesystem"],
+                                       deadline=deadlines.Deadline(context))
+
+                    expand_volume_response = csi_pb2.NodeExpandVolumeResponse()
+                    return expand_volume_response
+
+    def _publish_ephemeral_volume(self, request, deadline: deadlines.Deadline) -> None:
+        """
+        Attaches a volatile disk for an ephemeral inline volume, formats it
+        and mounts it straight at the target path, there is no staging
+        """
+        try:
+            size_mib = ephemeral.parse_size_mib(request.volume_context.get("size",
+                                                                           f"{constant.DEFAULT_EPHEMERAL_SIZE_MIB}Mi"))
+        except ValueError as error:
+            raise InvalidArgument(f"Invalid size of ephemeral volume {request.volume_id}: {error}") from error
+
+        disk_format = request.volume_context.get("format", constant.EPHEMERAL_DISK_FORMATS[0])
+        if disk_format not in constant.EPHEMERAL_DISK_FORMATS:
+            raise InvalidArgument(f"Unsupported format {disk_format} of ephemeral volume {request.volume_id}, "
+                                  f"expected one of: {', '.join(constant.EPHEMERAL_DISK_FORMATS)}")
+
+        file_system = request.volume_capability.mount.fs_type or "ext4"
+
+        try:
+            image_device_path = self._ephemeral_disks.attach(request.volume_id, size_mib, disk_format, deadline)
+        except (one_api.OneApiError, OSError, xmlrpc.client.Error) as error:
+            error_message = f"Attaching a volatile disk for ephemeral volume {request.volume_id} failed: {error}"
+            logger.error(error_message)
+            raise Internal(error_message)
+
+        try:
+            self._mount_ephemeral_volume(request, image_device_path, file_system, deadline)
+        except Exception:
+            self._discard_ephemeral_disk(request.volume_id)
+            raise
 
-                self._extend_image(mount["device"], mount["filesystem"])
+        self._volume_stats.track(request.volume_id, request.target_path, request.readonly)
 
-                expand_volume_response = csi_pb2.NodeExpandVolumeResponse()
-                return expand_volume_response
+    def _mount_ephemeral_volume(self, request, image_device_path: str, file_system: str,
+                                deadline: deadlines.Deadline) -> None:
+        """
+        Formats the volatile disk of an ephemeral volume if needed and mounts
+        it at the target path
+        """
+        if not image_is_formatted(image_device_path):
+            logger.debug(f"Ephemeral volume {request.volume_id} is not formatted, formatting with {file_system}")
+            format_command = self._heavy_io.run(
+                f"format of ephemeral volume {request.volume_id}",
+                subprocess.run,
+                ["mkfs." + file_system, *constant.QUICK_FORMAT_OPTIONS.get(file_system, []), image_device_path],
+                encoding="utf-8",
+                capture_output=True,
+                check=False,
+                deadline=deadline,
+            )
+            if format_command.returncode != 0:
+                error_message = (f"Formatting ephemeral volume {request.volume_id} failed with: "
+                                 f"{format_command.stderr}")
+                logger.error(error_message)
+                raise Internal(error_message)
+
+        deadline.check(f"mounting ephemeral volume {request.volume_id}")
+        mount_command = subprocess.run(
+            [
+                "mount",
+                "-o",
+                generate_mount_options(request.readonly, request.volume_capability.mount.mount_flags),
+                image_device_path,
+                request.target_path,
+            ],
+            encoding="utf-8",
+            capture_output=True,
+            check=False,
+        )
+        if mount_command.returncode != 0:
+            error_message = f"Mounting ephemeral volume {request.volume_id} failed with: {mount_command.stderr}"
+            logger.error(error_message)
+            raise Internal(error_message)
+
+    def _discard_ephemeral_disk(self, volume_id: str) -> None:
+        """
+        Detaches the volatile disk of an ephemeral volume which could not be
+        published. The detach is not bound by the deadline of the failed call,
+        which may be what failed it. If it fails too, the disk stays recorded
+        and is detached by the unpublish of the volume.
+        """
+        try:
+            self._ephemeral_disks.detach(volume_id, deadlines.Deadline())
+        except (GrpcException, one_api.OneApiError, OSError, xmlrpc.client.Error) as error:
+            logger.error(f"Detaching the volatile disk of ephemeral volume {volume_id} after a failed publish "
+                         f"failed: {error}")
+
+    def _get_own_vm(self, one_api_endpoint: str, one_api_auth: str) -> Optional[dict]:
+        if not one_api_endpoint:
+            logger.warning("OpenNebula API endpoint is not configured, the node's VM cannot be inspected")
+            return None
+
+        try:
+            return one_api.get_vm(one_api_endpoint, one_api_auth, self._node_id)
+        except (one_api.OneApiError, OSError, xmlrpc.client.Error) as error:
+            logger.error(f"Cannot retrieve VM ID {self._node_id}: {error}")
+            return None
+
+    @staticmethod
+    def _determine_max_volumes_per_node(vm: Optional[dict], volume_dev_prefix: str) -> int:
+        if vm is None:
+            logger.warning(f"Using the default limit of {constant.DEFAULT_MAX_VOLUMES_PER_NODE} volumes per node")
+            return constant.DEFAULT_MAX_VOLUMES_PER_NODE
+
+        return disk_slots.count_free_disk_slots(vm, volume_dev_prefix)
+
+    def _determine_accessible_topology(self, vm: Optional[dict]) -> Optional[csi_pb2.Topology]:
+        """
+        Returns the OpenNebula cluster and host of the node's VM as topology
+        segments. Kubernetes labels the node with them when the node plugin
+        registers, so a VM migrated to another host keeps its old host label
+        until the node plugin restarts.
+        """
+        if vm is None or vm["CLUSTER_ID"] is None:
+            logger.warning(f"The placement of VM ID {self._node_id} is unknown")
+            return None
+
+        logger.info(f"VM ID {self._node_id} runs on host ID {vm['HOST_ID']} of cluster ID {vm['CLUSTER_ID']}")
+        return csi_pb2.Topology(segments={
+            constant.TOPOLOGY_CLUSTER_KEY: str(vm["CLUSTER_ID"]),
+            constant.TOPOLOGY_HOST_KEY: str(vm["HOST_ID"]),
+        })
 
     @staticmethod
     def _extend_image(image_device_path: str, image_fs: str):
@@ -0,0 +1,156 @@
+"""
+Splits the controller work between several active replicas through leases
+"""
+import logging
+import threading
+import time
+import zlib
+
+from math import ceil
+from typing import Callable
+
+from grpc_interceptor.exceptions import Aborted
+
+from leases import LeaseBackend
+
+logger = logging.getLogger("Sharding")
+
+MEMBER_LEASE_PREFIX = "member-"
+SHARD_LEASE_PREFIX = "shard-"
+
+
+class ShardCoordinator:
+    """
+    Hashes the shard keys (datastore or VM IDs) into a fixed number of shards
+    and keeps leases on a fair share of them. Every replica announces itself
+    with a member lease, so the shards of a replica which stops renewing are
+    picked up by the others once its leases expire.
+    """
+
+    def __init__(self,
+                 backend: LeaseBackend,
+                 holder: str,
+                 shard_count: int,
+                 lease_duration: float = 8.0,
+                 renew_interval: float = 2.0):
+        self._backend = backend
+        self._holder = holder
+        self._shard_count = shard_count
+        self._lease_duration = lease_duration
+        self._renew_interval = renew_interval
+        self._lock = threading.Lock()
+        self._owned: set[int] = set()
+        self._valid_until = 0.0
+        self._listeners: list[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sharding", daemon=True)
+
+    def start(self) -> None:
+        """
+        Acquires the initial shards and starts renewing them in the background
+        """
+        self.reconcile()
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops renewing and releases all the leases, handing the shards over
+        to the other replicas immediately
+        """
+        self._stop.set()
+        with self._lock:
+            owned, self._owned = self._owned, set()
+
+        for shard in owned:
+            self._backend.release(f"{SHARD_LEASE_PREFIX}{shard}", self._holder)
+        self._backend.release(f"{MEMBER_LEASE_PREFIX}{self._holder}", self._holder)
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Registers a callable invoked from the renewal thread whenever the set
+        of owned shards changes. It must return quickly, so as not to delay
+        the renewal of the leases.
+        """
+        self._listeners.append(listener)
+
+    def shard_of(self, key: str) -> int:
+        """
+        Returns the shard a key belongs to
+        """
+        return zlib.crc32(key.encode("utf-8")) % self._shard_count
+
+    def owns(self, key: str) -> bool:
+        """
+        Checks whether this replica currently holds the shard of a key
+        """
+        with self._lock:
+            return time.monotonic() < self._valid_until and self.shard_of(key) in self._owned
+
+    def check(self, key: str) -> None:
+        """
+        Rejects a request whose shard is owned by another replica
+        :raises Aborted: If this replica does not own the shard of the key
+        """
+        if not self.owns(key):
+            error_message = f"Shard {self.shard_of(key)} of {key} is not owned by controller replica {self._holder}"
+            logger.debug(error_message)
+            raise Aborted(error_message)
+
+    def reconcile(self) -> None:
+        """
+        Renews the member lease and the owned shards, then acquires free
+        shards or releases extra ones to converge on a fair share
+        """
+        started = time.monotonic()
+        self._backend.try_acquire(f"{MEMBER_LEASE_PREFIX}{self._holder}", self._holder, self._lease_duration)
+
+        leases = self._backend.list()
+        now = time.time()
+        members = {
+            lease["holder"] for name, lease in leases.items()
+            if name.startswith(MEMBER_LEASE_PREFIX) and lease["expires"] > now
+        } | {self._holder}
+        fair_share = ceil(self._shard_count / len(members))
+
+        with self._lock:
+            previously_owned = set(self._owned)
+
+        owned = set()
+        for shard in sorted(previously_owned):
+            name = f"{SHARD_LEASE_PREFIX}{shard}"
+            if len(owned) >= fair_share:
+                logger.info(f"Handing over shard {shard} to rebalance between {len(members)} replicas")
+                self._backend.release(name, self._holder)
+            elif self._backend.try_acquire(name, self._holder, self._lease_duration):
+                owned.add(shard)
+            else:
+                logger.warning(f"Lost the lease on shard {shard}")
+
+        for shard in range(self._shard_count):
+            if len(owned) >= fair_share:
+                break
+
+            name = f"{SHARD_LEASE_PREFIX}{shard}"
+            lease = leases.get(name)
+            if shard in owned or (lease and lease["holder"] and lease["expires"] > now):
+                continue
+
+            if self._backend.try_acquire(name, self._holder, self._lease_duration):
+                logger.info(f"Acquired shard {shard}")
+                owned.add(shard)
+
+        with self._lock:
+            changed = owned != self._owned
+            self._owned = owned
+            self._valid_until = started + self._lease_duration
+
+        if changed:
+            for listener in self._listeners:
+                listener()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._renew_interval):
+            try:
+                self.reconcile()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Renewing the shard leases failed: {error}")
@@ -0,0 +1,124 @@
+"""
+CSI snapshots backed by OpenNebula disk snapshots, and the cache of their state
+"""
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import metrics
+
+logger = logging.getLogger("Snapshots")
+
+SNAPSHOT_ID_SEPARATOR = ":"
+SNAPSHOT_POLL_INTERVAL = 5
+# DISK_SNAPSHOT_POWEROFF, DISK_SNAPSHOT_SUSPENDED and DISK_SNAPSHOT
+DISK_SNAPSHOT_LCM_STATES = (50, 53, 56)
+
+
+def build_snapshot_id(image_id: int, snapshot_id: int) -> str:
+    """
+    Returns the CSI snapshot ID of a snapshot of an image
+    """
+    return f"{image_id}{SNAPSHOT_ID_SEPARATOR}{snapshot_id}"
+
+
+def parse_snapshot_id(csi_snapshot_id: str) -> tuple[int, int]:
+    """
+    Returns the image ID and the OpenNebula snapshot ID of a CSI snapshot ID
+    :raises ValueError: If the ID was not built by build_snapshot_id
+    """
+    image_id, snapshot_id = csi_snapshot_id.split(SNAPSHOT_ID_SEPARATOR)
+    return int(image_id), int(snapshot_id)
+
+
+@dataclass
+class SnapshotState:
+    """
+    The last known state of a snapshot
+    """
+
+    snapshot_id: str
+    source_volume_id: str
+    name: str
+    size_bytes: int
+    creation_time: int
+    ready: bool
+    checked_at: float = 0.0
+
+
+class SnapshotCache:
+    """
+    Remembers the snapshots seen by the controller. A ready snapshot does
+    not change until it is deleted, so it is served from memory. The others
+    are looked up again at most once per poll interval, while the snapshot
+    sidecar calls CreateSnapshot repeatedly until they are ready.
+    """
+
+    def __init__(self, poll_interval: float = SNAPSHOT_POLL_INTERVAL):
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._snapshots: dict[str, SnapshotState] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, snapshot_id: str) -> Optional[SnapshotState]:
+        """
+        Returns the state of a snapshot, None if it must be looked up
+        """
+        with self._lock:
+            return self._fresh(self._snapshots.get(snapshot_id))
+
+    def find(self, name: str) -> Optional[SnapshotState]:
+        """
+        Returns the state of the snapshot with the given name, None if it
+        must be looked up
+        """
+        with self._lock:
+            return self._fresh(next((state for state in self._snapshots.values() if state.name == name), None))
+
+    def put(self, state: SnapshotState) -> SnapshotState:
+        """
+        Records the state of a snapshot which has just been looked up
+        """
+        state.checked_at = time.monotonic()
+        with self._lock:
+            self._snapshots[state.snapshot_id] = state
+        return state
+
+    def clear(self) -> None:
+        """
+        Drops all the snapshots, e.g. when another replica may have changed
+        them
+        """
+        with self._lock:
+            self._snapshots.clear()
+
+    def forget(self, snapshot_id: str) -> None:
+        """
+        Drops a deleted snapshot
+        """
+        with self._lock:
+            self._snapshots.pop(snapshot_id, None)
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the number of cached snapshots and the cache hit counters
+        """
+        with self._lock:
+            ready = sum(1 for state in self._snapshots.values() if state.ready)
+            pending, hits, misses = len(self._snapshots) - ready, self._hits, self._misses
+        yield metrics.Sample("csi_snapshots_cached", {"ready": "true"}, ready)
+        yield metrics.Sample("csi_snapshots_cached", {"ready": "false"}, pending)
+        yield metrics.Sample("csi_snapshot_cache_lookups_total", {"result": "hit"}, hits, "counter")
+        yield metrics.Sample("csi_snapshot_cache_lookups_total", {"result": "miss"}, misses, "counter")
+
+    def _fresh(self, state: Optional[SnapshotState]) -> Optional[SnapshotState]:
+        # The caller holds the lock
+        if state is not None and (state.ready or time.monotonic() - state.checked_at < self._poll_interval):
+            self._hits += 1
+            return state
+        self._misses += 1
+        return None
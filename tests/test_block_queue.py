@@ -0,0 +1,55 @@
+import pytest
+
+from grpc_interceptor.exceptions import FailedPrecondition
+
+import block_queue
+
+
+@pytest.fixture
+def sysfs(monkeypatch):
+    settings = {
+        "vdb": {"read_ahead_kb": "128", "scheduler": "none"},
+        "vdc": {"read_ahead_kb": "256", "scheduler": "mq-deadline"},
+    }
+
+    def write(device_name, attribute, value):
+        if value == "invalid":
+            raise OSError(22, "Invalid argument")
+        settings[device_name][attribute] = value
+
+    monkeypatch.setattr(block_queue, "read_queue_setting", lambda device, attribute: settings[device][attribute])
+    monkeypatch.setattr(block_queue, "write_queue_setting", write)
+    return settings
+
+
+def test_apply_and_restore(tmp_path, sysfs):
+    tuner = block_queue.BlockQueueTuner(state_dir=str(tmp_path))
+
+    effective = tuner.apply("vol-1", "vdb", {"read_ahead_kb": "4096", "disk_cache": "none"})
+    assert effective == {"read_ahead_kb": "4096"}
+
+    tuner.apply("vol-1", "vdb", {"read_ahead_kb": "4096"})
+    tuner.restore("vol-1")
+    assert sysfs["vdb"]["read_ahead_kb"] == "128"
+    assert not list(tmp_path.glob("block-queue/*.json"))
+
+
+def test_restore_targets_the_device_of_the_last_stage(tmp_path, sysfs):
+    tuner = block_queue.BlockQueueTuner(state_dir=str(tmp_path))
+    tuner.apply("vol-1", "vdb", {"read_ahead_kb": "4096"})
+
+    # Attached again to another slot without being unstaged on this node
+    tuner.apply("vol-1", "vdc", {"read_ahead_kb": "4096"})
+    sysfs["vdb"]["read_ahead_kb"] = "512"
+    tuner.restore("vol-1")
+
+    assert sysfs["vdc"]["read_ahead_kb"] == "256"
+    assert sysfs["vdb"]["read_ahead_kb"] == "512"
+
+
+def test_rejected_value_keeps_the_cause(tmp_path, sysfs):
+    tuner = block_queue.BlockQueueTuner(state_dir=str(tmp_path))
+
+    with pytest.raises(FailedPrecondition) as raised:
+        tuner.apply("vol-1", "vdb", {"io_scheduler": "invalid"})
+    assert isinstance(raised.value.__cause__, OSError)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import cache_tier
+import constant
+import deadlines
+
+DM_TARGETS = {
+    constant.CACHE_MODE_WRITETHROUGH: "cache",
+    constant.CACHE_MODE_WRITEBACK: "cache",
+    constant.CACHE_MODE_WRITECACHE: "writecache",
+}
+
+
+def test_parse_cache_status():
+    stats = cache_tier.parse_cache_status(
+        "8 27/1024 128 10/8192 100 20 30 40 0 5 0 1 writethrough 2 migration_threshold 2048 smq 0 rw -"
+    )
+
+    assert stats == cache_tier.CacheStats(mode=constant.CACHE_MODE_WRITETHROUGH,
+                                          size_bytes=8192 * 128 * cache_tier.SECTOR_SIZE,
+                                          used_bytes=10 * 128 * cache_tier.SECTOR_SIZE,
+                                          dirty_bytes=0,
+                                          read_hits=100,
+                                          read_misses=20,
+                                          write_hits=30,
+                                          write_misses=40)
+
+
+def test_parse_cache_status_with_dirty_blocks_and_policy_arguments():
+    stats = cache_tier.parse_cache_status(
+        "8 27/1024 128 10/8192 0 0 0 0 0 5 3 2 metadata2 writeback 2 migration_threshold 2048 "
+        "smq 2 random_threshold 4 rw -"
+    )
+
+    assert stats.mode == constant.CACHE_MODE_WRITEBACK
+    assert stats.dirty_bytes == 3 * 128 * cache_tier.SECTOR_SIZE
+    assert stats.error == ""
+
+
+@pytest.mark.parametrize("status, error", [
+    ("8 27/1024 128 10/8192 0 0 0 0 0 5 3 1 writeback 0 smq 0 ro -", "cache metadata is in ro mode"),
+    ("8 27/1024 128 10/8192 0 0 0 0 0 5 3 1 writeback 0 smq 0 rw needs_check",
+     "cache metadata needs to be checked"),
+    ("Fail", "cache target failed"),
+])
+def test_parse_cache_status_errors(status, error):
+    assert cache_tier.parse_cache_status(status).error == error
+
+
+def test_parse_writecache_status():
+    stats = cache_tier.parse_writecache_status("0 1000 900 0 50 20 70 10 5 0")
+
+    assert stats == cache_tier.CacheStats(mode=constant.CACHE_MODE_WRITECACHE,
+                                          size_bytes=1000 * cache_tier.DM_WRITECACHE_BLOCK_SIZE,
+                                          used_bytes=100 * cache_tier.DM_WRITECACHE_BLOCK_SIZE,
+                                          dirty_bytes=100 * cache_tier.DM_WRITECACHE_BLOCK_SIZE,
+                                          read_hits=20,
+                                          read_misses=30,
+                                          write_hits=15,
+                                          write_misses=55)
+
+
+def test_parse_writecache_status_of_older_kernels_and_errors():
+    stats = cache_tier.parse_writecache_status("0 1000 1000 0")
+    assert (stats.used_bytes, stats.read_hits, stats.write_misses, stats.error) == (0, 0, 0, "")
+
+    assert cache_tier.parse_writecache_status("2 1000 900 0").error == "cache device I/O error 2"
+
+
+def _run(*command):
+    return subprocess.run(command, encoding="utf-8", capture_output=True, check=True).stdout.strip()
+
+
+def _loop_device(path, size_mib):
+    with open(path, "wb") as file:
+        file.truncate(size_mib * 1024 ** 2)
+    return _run("losetup", "--find", "--show", str(path))
+
+
+def _dm_targets():
+    if os.geteuid() != 0 or not shutil.which("dmsetup") or not shutil.which("losetup"):
+        return set()
+    if shutil.which("modprobe"):
+        for module in ("dm-cache", "dm-writecache"):
+            subprocess.run(["modprobe", module], capture_output=True, check=False)
+    command = subprocess.run(["dmsetup", "targets"], encoding="utf-8", capture_output=True, check=False)
+    if command.returncode != 0:
+        return set()
+    return {line.split()[0] for line in command.stdout.splitlines() if line.strip()}
+
+
+@pytest.mark.parametrize("mode", sorted(DM_TARGETS))
+def test_cache_on_loop_devices(tmp_path, mode):
+    if DM_TARGETS[mode] not in _dm_targets():
+        pytest.skip(f"needs root, losetup and the dm-{DM_TARGETS[mode]} kernel module")
+
+    origin = _loop_device(tmp_path / "origin.img", 256)
+    cache = _loop_device(tmp_path / "cache.img", 128)
+    mount_point = tmp_path / "mnt"
+    mount_point.mkdir()
+    volume_id = f"test-{mode}"
+    tier = cache_tier.CacheTier(state_dir=str(tmp_path / "state"), cache_device=cache)
+
+    try:
+        device = tier.setup(volume_id, origin, {"cache_mode": mode, "cache_size_mib": "64"})
+        _run("mkfs.ext4", "-q", device)
+        _run("mount", device, str(mount_point))
+        data = os.urandom(16 * 1024 ** 2)
+        (mount_point / "data").write_bytes(data)
+        _run("sync")
+        assert tier.stats(volume_id).mode == mode
+        _run("umount", str(mount_point))
+
+        tier.teardown(volume_id, deadlines.Deadline())
+        assert not os.path.exists(f"/dev/mapper/{cache_tier.CACHE_DEVICE_NAME_PREFIX}{volume_id}")
+
+        _run("mount", "-o", "ro", origin, str(mount_point))
+        assert (mount_point / "data").read_bytes() == data
+    finally:
+        subprocess.run(["umount", str(mount_point)], capture_output=True, check=False)
+        for suffix in ("", "-data", "-meta"):
+            subprocess.run(["dmsetup", "remove", f"{cache_tier.CACHE_DEVICE_NAME_PREFIX}{volume_id}{suffix}"],
+                           capture_output=True, check=False)
+        _run("losetup", "--detach", origin)
+        _run("losetup", "--detach", cache)
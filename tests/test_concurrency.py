@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from grpc_interceptor.exceptions import Aborted, ResourceExhausted
+
+import concurrency
+
+
+def test_volume_lock_rejects_a_second_operation():
+    locks = concurrency.VolumeLocks()
+    with locks.acquire("vol-1", "stage"):
+        with pytest.raises(Aborted, match="stage"):
+            with locks.acquire("vol-1", "publish"):
+                pass
+        with locks.acquire("vol-2", "publish"):
+            pass
+
+
+def test_volume_lock_is_released_on_error():
+    locks = concurrency.VolumeLocks()
+    with pytest.raises(RuntimeError):
+        with locks.acquire("vol-1", "stage"):
+            raise RuntimeError("mount failed")
+    with locks.acquire("vol-1", "stage"):
+        pass
+
+
+def test_heavy_operation_pool_returns_the_result():
+    pool = concurrency.HeavyOperationPool(max_workers=1, max_pending=1)
+    assert pool.run("add", lambda a, b: a + b, 1, b=2) == 3
+
+
+def test_heavy_operation_pool_rejects_above_max_pending():
+    pool = concurrency.HeavyOperationPool(max_workers=1, max_pending=1)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    worker = threading.Thread(target=pool.run, args=("block", block))
+    worker.start()
+    started.wait()
+    try:
+        with pytest.raises(ResourceExhausted):
+            pool.run("second", lambda: None)
+    finally:
+        release.set()
+        worker.join()
+    assert pool.run("third", lambda: 3) == 3
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+from grpc_interceptor.exceptions import Cancelled, DeadlineExceeded
+
+import deadlines
+
+
+class _Context:
+    def __init__(self, timeout):
+        self.expires_at = time.monotonic() + timeout
+        self.active = True
+        self.callbacks = []
+
+    def time_remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def is_active(self):
+        return self.active
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+        return True
+
+    def cancel(self):
+        self.active = False
+        for callback in self.callbacks:
+            callback()
+
+
+def test_no_context_never_expires():
+    deadline = deadlines.Deadline()
+
+    assert deadline.remaining() is None
+    deadline.check("anything")
+    deadline.sleep(0, "anything")
+
+
+def test_check_fails_once_the_deadline_has_passed():
+    context = _Context(10)
+    deadline = deadlines.Deadline(context)
+    deadline.check("the first step")
+
+    context.expires_at = time.monotonic() - 1
+    with pytest.raises(DeadlineExceeded, match="the second step"):
+        deadline.check("the second step")
+
+
+def test_check_fails_once_the_client_is_gone():
+    context = _Context(10)
+    deadline = deadlines.Deadline(context)
+
+    context.cancel()
+    with pytest.raises(Cancelled):
+        deadline.check("the next step")
+
+
+def test_sleep_refuses_to_outlive_the_deadline():
+    deadline = deadlines.Deadline(_Context(0.5))
+
+    with pytest.raises(DeadlineExceeded):
+        deadline.sleep(1, "the retry")
+
+
+def test_sleep_wakes_up_when_the_client_is_gone():
+    context = _Context(30)
+    deadline = deadlines.Deadline(context)
+
+    started = time.monotonic()
+    timer = threading.Timer(0.05, context.cancel)
+    timer.start()
+    with pytest.raises(Cancelled):
+        deadline.sleep(10, "the retry")
+    assert time.monotonic() - started < 5
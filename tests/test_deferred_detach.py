@@ -0,0 +1,82 @@
+import time
+
+import concurrency
+import deferred_detach
+import journal
+
+
+class _Detacher:
+    def __init__(self):
+        self.detached = []
+
+    def __call__(self, vm_id, image_id):
+        self.detached.append((vm_id, image_id))
+
+
+def test_republish_to_the_same_vm_reclaims_the_volume():
+    detach = _Detacher()
+    detacher = deferred_detach.DeferredDetacher(concurrency.VolumeLocks(), 60, detach)
+
+    detacher.defer(1, 10)
+    assert detacher.reclaim(1, 10)
+    detacher.run_once()
+    assert detach.detached == []
+
+
+def test_publish_to_another_vm_detaches_first():
+    detach = _Detacher()
+    detacher = deferred_detach.DeferredDetacher(concurrency.VolumeLocks(), 60, detach)
+
+    detacher.defer(1, 10)
+    assert not detacher.reclaim(1, 11)
+    assert detach.detached == [(10, 1)]
+
+
+def test_flush_vm_detaches_the_pending_disks_of_the_vm():
+    detach = _Detacher()
+    volume_locks = concurrency.VolumeLocks()
+    detacher = deferred_detach.DeferredDetacher(volume_locks, 60, detach)
+
+    detacher.defer(1, 10)
+    detacher.defer(2, 10)
+    detacher.defer(3, 11)
+    with volume_locks.acquire("2", "ControllerPublishVolume"):
+        assert detacher.flush_vm(10) == 1
+
+    assert detach.detached == [(10, 1)]
+    assert detacher.flush_vm(10) == 1
+    assert detach.detached == [(10, 1), (10, 2)]
+    assert detacher.flush_vm(12) == 0
+
+
+def test_due_detaches_are_performed_and_journaled(tmp_path):
+    detach = _Detacher()
+    operations = journal.OperationJournal(str(tmp_path / "replica-a.log"))
+    detacher = deferred_detach.DeferredDetacher(concurrency.VolumeLocks(), 0.01, detach, operations)
+
+    detacher.defer(1, 10, "datastore/100")
+    assert operations._pending
+    time.sleep(0.02)
+    detacher.run_once()
+
+    assert detach.detached == [(10, 1)]
+    assert not operations._pending
+
+
+def test_detaches_of_lost_shards_are_handed_off(tmp_path):
+    detach = _Detacher()
+    owned = {"datastore/100"}
+    operations = journal.OperationJournal(str(tmp_path / "replica-a.log"))
+    detacher = deferred_detach.DeferredDetacher(concurrency.VolumeLocks(), 0.01, detach, operations,
+                                                owns=lambda key: key in owned)
+
+    detacher.defer(1, 10, "datastore/100")
+    detacher.defer(2, 10, "datastore/101")
+    lost_entry = next(entry_id for entry_id, entry in operations._pending.items() if entry["key"] == "datastore/101")
+    time.sleep(0.02)
+    detacher.run_once()
+    assert detach.detached == [(10, 1)]
+
+    assert detacher.hand_off() == [lost_entry]
+    detacher.run_once()
+    assert detach.detached == [(10, 1)]
@@ -0,0 +1,59 @@
+import constant
+import disk_slots
+
+
+def _vm(disks, user_template=None, context_target=None):
+    template = {"DISK": disks}
+    if context_target:
+        template["CONTEXT"] = {"TARGET": context_target}
+    return {"ID": 7, "USER_TEMPLATE": user_template, "TEMPLATE": template}
+
+
+def test_get_vm_disks_accepts_a_single_disk():
+    assert disk_slots.get_vm_disks({"DISK": {"TARGET": "vda"}}) == [{"TARGET": "vda"}]
+    assert disk_slots.get_vm_disks({}) == []
+
+
+def test_get_dev_prefix():
+    assert disk_slots.get_dev_prefix("vdb") == "vd"
+    assert disk_slots.get_dev_prefix("hda") == "hd"
+    assert disk_slots.get_dev_prefix("sdz") == "sd"
+
+
+def test_os_disks_and_context_use_slots():
+    vm = _vm([{"TARGET": "vda", "IMAGE": "ubuntu"}, {"TARGET": "vdb", "IMAGE": "data"}], context_target="hda")
+
+    assert disk_slots.count_free_disk_slots(vm) == 24
+    assert disk_slots.count_free_disk_slots(vm, "hd") == 3
+
+
+def test_attached_volumes_do_not_use_slots():
+    vm = _vm([{"TARGET": "vda", "IMAGE": "ubuntu"}, {"TARGET": "vdb", "IMAGE": f"{constant.CSI_VOLUME_NAME_PREFIX}1"}])
+
+    assert disk_slots.count_free_disk_slots(vm) == 25
+
+
+def test_ephemeral_volumes_use_slots():
+    vm = _vm([{"TARGET": "vda", "IMAGE": "ubuntu"}, {"TARGET": "vdb", constant.EPHEMERAL_DISK_ATTRIBUTE: "csi-1"}])
+
+    assert disk_slots.count_free_disk_slots(vm) == 24
+
+
+def test_unknown_prefix_uses_the_default():
+    assert disk_slots.count_free_disk_slots(_vm([{"TARGET": "xvda"}])) == constant.DEFAULT_MAX_VOLUMES_PER_NODE
+    assert disk_slots.count_free_disk_slots(_vm([])) == constant.DEFAULT_MAX_VOLUMES_PER_NODE
+
+
+def test_full_bus_advertises_one_volume():
+    vm = _vm([{"TARGET": f"hd{letter}", "IMAGE": "os"} for letter in "abcd"])
+
+    assert disk_slots.count_free_disk_slots(vm) == 1
+
+
+def test_user_template_override():
+    vm = _vm([{"TARGET": "vda"}], {constant.MAX_VOLUMES_USER_TEMPLATE_ATTRIBUTE: "4"})
+    assert disk_slots.count_free_disk_slots(vm) == 4
+
+    for invalid in ("0", "-1", "many"):
+        vm = _vm([{"TARGET": "vda"}], {constant.MAX_VOLUMES_USER_TEMPLATE_ATTRIBUTE: invalid})
+        assert disk_slots.count_free_disk_slots(vm) == 25
@@ -0,0 +1,78 @@
+import pytest
+
+import endpoints
+
+LEADER, FOLLOWER, SOLO = endpoints.RAFT_STATE_LEADER, 2, endpoints.RAFT_STATE_SOLO
+
+
+def _endpoint_set(states, read_from_followers=False):
+    endpoint_set = endpoints.EndpointSet(list(states), "user:password", read_from_followers=read_from_followers)
+    endpoint_set._raft_state = lambda endpoint: states[endpoint]
+    return endpoint_set
+
+
+def test_is_read_only():
+    assert endpoints.is_read_only("one.vm.info")
+    assert endpoints.is_read_only("one.zone.raftstatus")
+    assert not endpoints.is_read_only("one.vm.attach")
+
+
+def test_writes_go_to_the_leader_and_failovers_are_counted():
+    states = {"a": FOLLOWER, "b": LEADER, "c": FOLLOWER}
+    endpoint_set = _endpoint_set(states)
+
+    assert endpoint_set.leader() == "b"
+    states.update(b=None, c=LEADER)
+    endpoint_set.check_health()
+
+    assert endpoint_set.leader() == "c"
+    samples = {(sample.name, tuple(sorted(sample.labels.items()))): sample.value for sample in endpoint_set.metrics()}
+    assert samples[("csi_one_api_failovers_total", ())] == 1
+    assert samples[("csi_one_api_endpoint_active", (("endpoint", "c"),))] == 1
+    assert samples[("csi_one_api_endpoint_up", (("endpoint", "b"), ("state", "unreachable")))] == 0
+
+
+def test_a_solo_endpoint_is_a_leader():
+    assert _endpoint_set({"a": None, "b": SOLO}).leader() == "b"
+
+
+def test_reads_are_spread_over_the_healthy_endpoints():
+    endpoint_set = _endpoint_set({"a": LEADER, "b": FOLLOWER, "c": None}, read_from_followers=True)
+    endpoint_set.check_health()
+
+    assert {endpoint_set.reader() for _ in range(4)} == {"a", "b"}
+
+
+def test_reads_fail_over_on_any_connection_error():
+    endpoint_set = _endpoint_set({"a": LEADER, "b": FOLLOWER})
+    sent = []
+
+    def send(endpoint):
+        sent.append(endpoint)
+        if endpoint == "a":
+            raise ConnectionResetError("reset")
+        return endpoint
+
+    endpoint_set.check_health()
+    # The leader is looked up again once a is marked unhealthy
+    endpoint_set._raft_state = lambda endpoint: {"a": None, "b": LEADER}[endpoint]
+    assert endpoint_set.route(send, read_only=True) == "b"
+    assert sent == ["a", "b"]
+
+
+def test_writes_fail_over_only_when_the_connection_is_refused():
+    endpoint_set = _endpoint_set({"a": LEADER, "b": FOLLOWER})
+    endpoint_set.check_health()
+
+    def reset(endpoint):
+        raise ConnectionResetError("reset")
+    with pytest.raises(ConnectionResetError):
+        endpoint_set.route(reset, read_only=False)
+
+    endpoint_set._raft_state = lambda endpoint: {"a": None, "b": LEADER}[endpoint]
+
+    def refused(endpoint):
+        if endpoint == "a":
+            raise ConnectionRefusedError("refused")
+        return endpoint
+    assert endpoint_set.route(refused, read_only=False) == "b"
@@ -0,0 +1,27 @@
+import pytest
+
+import ephemeral
+
+
+def test_is_ephemeral():
+    assert ephemeral.is_ephemeral({ephemeral.EPHEMERAL_VOLUME_CONTEXT_KEY: "true"})
+    assert not ephemeral.is_ephemeral({ephemeral.EPHEMERAL_VOLUME_CONTEXT_KEY: "false"})
+    assert not ephemeral.is_ephemeral({})
+
+
+def test_parse_size_mib():
+    assert ephemeral.parse_size_mib("1Gi") == 1024
+    assert ephemeral.parse_size_mib(" 20Mi ") == 20
+    assert ephemeral.parse_size_mib("1G") == 954
+    assert ephemeral.parse_size_mib("1073741824") == 1024
+
+
+def test_parse_size_mib_rounds_up_to_one_mib():
+    assert ephemeral.parse_size_mib("1") == 1
+    assert ephemeral.parse_size_mib("1025Ki") == 2
+
+
+@pytest.mark.parametrize("quantity", ["", "Gi", "1.5Gi", "-1Gi", "1Xi", "1gi"])
+def test_parse_size_mib_rejects_malformed_quantities(quantity):
+    with pytest.raises(ValueError):
+        ephemeral.parse_size_mib(quantity)
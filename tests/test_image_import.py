@@ -0,0 +1,37 @@
+import image_import
+
+
+def _samples(tracker):
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value for sample in tracker.metrics()}
+
+
+def test_imports_are_followed_until_they_end():
+    tracker = image_import.ImportTracker()
+
+    tracker.begin(5, "https://example.com/disk.qcow2")
+    tracker.begin(6, "marketplace app 3")
+    assert tracker.progress(5, 4) >= 0
+    assert tracker.progress(7, 4) is None
+
+    samples = _samples(tracker)
+    assert samples[("csi_volume_imports_in_progress", ())] == 2
+    assert ("csi_volume_import_elapsed_seconds", (("image_id", "5"), ("state", "4"))) in samples
+
+    tracker.end(5, succeeded=True)
+    tracker.end(6, succeeded=False)
+    tracker.end(6, succeeded=False)
+
+    samples = _samples(tracker)
+    assert samples[("csi_volume_imports_in_progress", ())] == 0
+    assert samples[("csi_volume_imports_total", (("result", "ready"),))] == 1
+    assert samples[("csi_volume_imports_total", (("result", "error"),))] == 1
+
+
+def test_an_import_begun_twice_keeps_its_start():
+    tracker = image_import.ImportTracker()
+
+    tracker.begin(5, "https://example.com/disk.qcow2")
+    started = tracker._imports[5].started
+    tracker.begin(5, "https://example.com/disk.qcow2")
+
+    assert tracker._imports[5].started == started
@@ -0,0 +1,156 @@
+import json
+import threading
+
+import pytest
+
+import journal
+
+
+def _open(tmp_path, replica):
+    return journal.OperationJournal(str(tmp_path / f"{replica}{journal.JOURNAL_SUFFIX}"))
+
+
+def test_pending_entries_are_orphaned_after_a_restart(tmp_path):
+    operations = _open(tmp_path, "replica-a")
+    finished = operations.begin("offline_expand", key="datastore/100", image_id=1, vm_id=2, new_size_in_mb=10)
+    interrupted = operations.begin("offline_expand", key="datastore/100", image_id=3, vm_id=2, new_size_in_mb=10)
+    operations.complete(finished)
+    assert operations.orphaned() == []
+    operations.close()
+
+    operations = _open(tmp_path, "replica-a")
+    assert [entry["id"] for entry in operations.orphaned()] == [interrupted]
+    assert operations.orphaned()[0]["key"] == "datastore/100"
+    assert operations.orphaned()[0]["arguments"] == {"image_id": 3, "vm_id": 2, "new_size_in_mb": 10}
+
+
+def test_claim_and_disown(tmp_path):
+    operations = _open(tmp_path, "replica-a")
+    entry_id = operations.begin("offline_snapshot", image_id=1, vm_id=2)
+    operations.close()
+
+    operations = _open(tmp_path, "replica-a")
+    assert operations.claim(entry_id)
+    assert not operations.claim(entry_id)
+    assert operations.orphaned() == []
+
+    operations.disown(entry_id)
+    assert [entry["id"] for entry in operations.orphaned()] == [entry_id]
+
+    operations.complete(entry_id)
+    operations.disown(entry_id)
+    assert operations.orphaned() == []
+
+
+def test_torn_record_is_ignored(tmp_path):
+    operations = _open(tmp_path, "replica-a")
+    entry_id = operations.begin("offline_snapshot", image_id=1, vm_id=2)
+    operations.close()
+    with open(tmp_path / "replica-a.log", "a") as journal_file:
+        journal_file.write('{"complete": "')
+
+    operations = _open(tmp_path, "replica-a")
+    assert [entry["id"] for entry in operations.orphaned()] == [entry_id]
+
+
+def test_failed_fsync_keeps_the_batch(tmp_path, monkeypatch):
+    operations = _open(tmp_path, "replica-a")
+    real_fsync = journal.os.fsync
+    failures = iter([OSError(5, "Input/output error")])
+
+    def fsync(fd):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        real_fsync(fd)
+
+    monkeypatch.setattr(journal.os, "fsync", fsync)
+    with pytest.raises(OSError):
+        operations.begin("offline_snapshot", image_id=1, vm_id=2)
+    operations.begin("offline_snapshot", image_id=3, vm_id=2)
+
+    assert operations._durable == operations._appended
+    with open(tmp_path / "replica-a.log") as journal_file:
+        image_ids = {json.loads(line)["begin"]["arguments"]["image_id"] for line in journal_file}
+    assert image_ids == {1, 3}
+
+
+def test_concurrent_appends_are_all_durable(tmp_path):
+    operations = _open(tmp_path, "replica-a")
+    threads = [threading.Thread(target=operations.begin, args=("offline_snapshot",), kwargs={"image_id": i})
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    operations.close()
+
+    assert len(_open(tmp_path, "replica-a").orphaned()) == 20
+
+
+def test_a_running_replica_keeps_its_journal(tmp_path):
+    running = _open(tmp_path, "replica-b")
+    running.begin("offline_snapshot", key="datastore/100", image_id=1, vm_id=2)
+
+    assert journal._lock(tmp_path / "replica-b.log", blocking=False) is None
+    assert _open(tmp_path, "replica-a").adopt(lambda key: True) == 0
+
+
+def test_adopt_takes_the_owned_entries_of_a_stopped_replica(tmp_path):
+    stopped = _open(tmp_path, "replica-b")
+    owned = stopped.begin("offline_snapshot", key="datastore/100", image_id=1, vm_id=2)
+    foreign = stopped.begin("offline_snapshot", key="datastore/101", image_id=3, vm_id=2)
+    stopped.close()
+
+    operations = _open(tmp_path, "replica-a")
+    assert operations.adopt(lambda key: key == "datastore/100") == 1
+    assert [entry["id"] for entry in operations.orphaned()] == [owned]
+    operations.close()
+
+    assert [entry["id"] for entry in _open(tmp_path, "replica-a").orphaned()] == [owned]
+    assert list(journal._load(tmp_path / "replica-b.log")) == [foreign]
+
+
+def test_adopting_the_last_entries_removes_the_journal(tmp_path):
+    stopped = _open(tmp_path, "replica-b")
+    stopped.begin("offline_snapshot", key="datastore/100", image_id=1, vm_id=2)
+    stopped.close()
+
+    operations = _open(tmp_path, "replica-a")
+    assert operations.adopt(lambda key: True) == 1
+    assert not (tmp_path / "replica-b.log").exists()
+    assert not (tmp_path / "replica-b.lock").exists()
+
+
+def test_adopt_drops_entries_already_adopted(tmp_path):
+    stopped = _open(tmp_path, "replica-b")
+    stopped.begin("offline_snapshot", key="datastore/100", image_id=1, vm_id=2)
+    stopped.close()
+    leftover = (tmp_path / "replica-b.log").read_text()
+
+    operations = _open(tmp_path, "replica-a")
+    operations.adopt(lambda key: True)
+    # A crash between the two writes leaves the entry in both journals
+    (tmp_path / "replica-b.log").write_text(leftover)
+
+    assert operations.adopt(lambda key: True) == 0
+    assert len(operations.orphaned()) == 1
+    assert not (tmp_path / "replica-b.log").exists()
+
+
+def test_hand_off_moves_entries_to_a_journal_for_the_new_owner(tmp_path):
+    operations = _open(tmp_path, "replica-a")
+    lost = operations.begin("deferred_detach", key="datastore/101", image_id=1, vm_id=2, due=0)
+    kept = operations.begin("deferred_detach", key="datastore/100", image_id=3, vm_id=2, due=0)
+
+    operations.hand_off([lost, "unknown"])
+
+    assert set(operations._pending) == {kept}
+    handoffs = list(tmp_path.glob(f"{journal.HANDOFF_PREFIX}*{journal.JOURNAL_SUFFIX}"))
+    assert len(handoffs) == 1
+    assert list(journal._load(handoffs[0])) == [lost]
+
+    new_owner = _open(tmp_path, "replica-b")
+    assert new_owner.adopt(lambda key: key == "datastore/101") == 1
+    assert [entry["id"] for entry in new_owner.orphaned()] == [lost]
+    assert not handoffs[0].exists()
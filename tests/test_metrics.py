@@ -0,0 +1,22 @@
+import metrics
+
+
+def test_escape_label_value():
+    assert metrics.escape_label_value('a\\b "c"\nd') == 'a\\\\b \\"c\\"\\nd'
+    assert metrics.escape_label_value(42) == "42"
+
+
+def test_render_escapes_labels_and_groups_families():
+    samples = [
+        metrics.Sample("csi_test_total", {"message": 'bad "value"\n'}, 3, "counter"),
+        metrics.Sample("csi_test_total", {"message": "ok"}, 1, "counter"),
+        metrics.Sample("csi_test_up", {}, 1),
+    ]
+    metrics.register_collector(lambda: iter(samples))
+
+    page = metrics.render()
+
+    assert "# TYPE csi_test_total counter\n" in page
+    assert 'csi_test_total{message="bad \\"value\\"\\n"} 3\n' in page
+    assert 'csi_test_total{message="ok"} 1\n' in page
+    assert "# TYPE csi_test_up gauge\ncsi_test_up 1\n" in page
@@ -0,0 +1,87 @@
+import threading
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+import pytest
+
+import multicall
+import one_api
+
+
+@pytest.fixture
+def endpoint():
+    requests = []
+
+    class RequestHandler(SimpleXMLRPCRequestHandler):
+        def do_POST(self):
+            requests.append(self.path)
+            super().do_POST()
+
+    def fail(auth):
+        raise ValueError("broken")
+
+    server = SimpleXMLRPCServer(("127.0.0.1", 0), requestHandler=RequestHandler, logRequests=False)
+    server.register_multicall_functions()
+    server.register_function(lambda auth, image_id: [True, f"image {image_id}", 0], "one.image.info")
+    server.register_function(lambda auth, vm_id: [False, f"VM {vm_id} does not exist",
+                                                  one_api.ONE_ERROR_NO_EXISTS], "one.vm.info")
+    server.register_function(lambda auth: [False, "not authorized", 0x0100], "one.vmpool.info")
+    server.register_function(fail, "one.zone.raftstatus")
+
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/RPC2", requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_group_sends_one_round_trip_with_a_result_per_call(endpoint):
+    url, requests = endpoint
+    client = multicall.BatchingClient(url, "user:password")
+
+    with client.group() as call_group:
+        image = call_group.call("one.image.info", 5)
+        vm = call_group.call("one.vm.info", 7)
+        pool = call_group.call("one.vmpool.info")
+        raft = call_group.call("one.zone.raftstatus")
+
+    assert len(requests) == 1
+    assert image.result() == "image 5"
+    with pytest.raises(one_api.OneApiNoExistsError):
+        vm.result()
+    with pytest.raises(one_api.OneApiError, match="not authorized"):
+        pool.result()
+    with pytest.raises(one_api.OneApiError, match="one.zone.raftstatus failed"):
+        raft.result()
+
+
+def test_group_is_split_in_batches(endpoint):
+    url, requests = endpoint
+    client = multicall.BatchingClient(url, "user:password", max_batch_size=2)
+
+    with client.group() as call_group:
+        futures = [call_group.call("one.image.info", image_id) for image_id in range(5)]
+
+    assert [future.result() for future in futures] == [f"image {image_id}" for image_id in range(5)]
+    assert len(requests) == 3
+    assert dict((sample.name, sample.value) for sample in client.metrics()) == {
+        "csi_one_api_calls_total": 5,
+        "csi_one_api_round_trips_total": 3,
+    }
+
+
+def test_concurrent_calls_share_a_window(endpoint):
+    url, requests = endpoint
+    client = multicall.BatchingClient(url, "user:password", window=0.2)
+    results = {}
+
+    def call(image_id):
+        results[image_id] = client.call("one.image.info", image_id)
+
+    threads = [threading.Thread(target=call, args=(image_id,)) for image_id in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {image_id: f"image {image_id}" for image_id in range(4)}
+    assert len(requests) == 1
@@ -0,0 +1,68 @@
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+from grpc_interceptor.exceptions import ResourceExhausted
+
+import constant
+import placement
+
+
+def _datastore(datastore_id, free_mb=1000, images=0, clusters=(0,), state=placement.DATASTORE_STATE_READY):
+    return SimpleNamespace(
+        get_ID=lambda: datastore_id,
+        get_STATE=lambda: state,
+        get_FREE_MB=lambda: free_mb,
+        get_IMAGES=lambda: SimpleNamespace(get_ID=lambda: list(range(images))),
+        get_CLUSTERS=lambda: SimpleNamespace(get_ID=lambda: list(clusters)),
+    )
+
+
+def _placer(*datastores):
+    one_api = SimpleNamespace(datastorepool=SimpleNamespace(info=lambda: SimpleNamespace(DATASTORE=datastores)))
+    return placement.DatastorePlacer(one_api, cache_ttl=3600)
+
+
+def test_weighted_round_robin_follows_the_weights():
+    placer = _placer(_datastore(100), _datastore(101), _datastore(102))
+
+    chosen = [placer.choose([100, 101, 102], constant.PLACEMENT_WEIGHTED_ROUND_ROBIN, {100: 3, 101: 2}, 1)
+              for _ in range(12)]
+
+    assert Counter(chosen) == {100: 6, 101: 4, 102: 2}
+    # Smooth round-robin interleaves the datastores instead of bursts
+    assert chosen[:6] == [100, 101, 100, 102, 101, 100]
+
+
+def test_weighted_round_robin_skips_full_datastores():
+    placer = _placer(_datastore(100, free_mb=10), _datastore(101))
+
+    chosen = [placer.choose([100, 101], constant.PLACEMENT_WEIGHTED_ROUND_ROBIN, {100: 5}, 8) for _ in range(3)]
+
+    # The first volume uses up the view of datastore 100
+    assert chosen == [100, 101, 101]
+
+
+def test_most_free_and_fewest_images():
+    placer = _placer(_datastore(100, free_mb=500, images=1), _datastore(101, free_mb=800, images=4))
+
+    assert placer.choose([100, 101], constant.PLACEMENT_MOST_FREE, {}, 100) == 101
+    assert placer.choose([100, 101], constant.PLACEMENT_FEWEST_IMAGES, {}, 100) == 100
+
+
+def test_clusters_by_order_of_preference():
+    placer = _placer(_datastore(100, clusters=(0,)), _datastore(101, clusters=(1,)))
+
+    assert placer.choose([100, 101], constant.PLACEMENT_MOST_FREE, {}, 1, [1, 0]) == 101
+    assert placer.choose([100, 101], constant.PLACEMENT_MOST_FREE, {}, 1, [2, 0]) == 100
+    assert placer.clusters_of(101) == [1]
+    assert placer.clusters_of(102) == []
+
+
+def test_no_datastore_fits():
+    placer = _placer(_datastore(100, free_mb=10), _datastore(101, state=1))
+
+    with pytest.raises(ResourceExhausted):
+        placer.choose([100, 101], constant.PLACEMENT_MOST_FREE, {}, 100)
+    with pytest.raises(ResourceExhausted):
+        placer.choose([100], constant.PLACEMENT_MOST_FREE, {}, 1, [1])
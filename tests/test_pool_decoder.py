@@ -0,0 +1,47 @@
+import pool_decoder
+
+IMAGE = """<IMAGE><ID>5</ID><NAME>pvc-1</NAME><SIZE>1024</SIZE><STATE>1</STATE><TYPE>2</TYPE>
+<PERSISTENT>1</PERSISTENT><DATASTORE_ID>100</DATASTORE_ID><VMS><ID>7</ID><ID>8</ID></VMS>
+<SNAPSHOTS><SNAPSHOT><ID>0</ID><NAME>snap</NAME><DATE>1700000000</DATE><SIZE>1024</SIZE></SNAPSHOT></SNAPSHOTS>
+<TEMPLATE><ERROR>copy failed</ERROR></TEMPLATE></IMAGE>"""
+
+VM = """<VM><ID>7</ID><NAME>node</NAME><STATE>3</STATE><LCM_STATE>3</LCM_STATE>
+<TEMPLATE><DISK><DISK_ID>0</DISK_ID><IMAGE_ID>1</IMAGE_ID><TARGET>vda</TARGET></DISK>
+<DISK><DISK_ID>1</DISK_ID><IMAGE_ID>5</IMAGE_ID><TARGET>vdb</TARGET><READONLY>YES</READONLY></DISK>
+<DISK><DISK_ID>2</DISK_ID><TARGET>vdc</TARGET></DISK></TEMPLATE>
+<SNAPSHOTS><DISK_ID>1</DISK_ID><SNAPSHOT><ID>3</ID><NAME>s</NAME><DATE>1</DATE></SNAPSHOT></SNAPSHOTS></VM>"""
+
+
+def test_decode_image():
+    assert pool_decoder.decode_image(IMAGE) == pool_decoder.ImageRecord(
+        id=5, name="pvc-1", size=1024, state=1, type=2, persistent=True, datastore_id=100, vms=(7, 8),
+        snapshots=(pool_decoder.SnapshotRecord(id=0, name="snap", date=1700000000, size=1024),),
+        error="copy failed",
+    )
+
+
+def test_decode_vm():
+    vm = pool_decoder.decode_vm(VM)
+
+    assert (vm.id, vm.name, vm.state, vm.lcm_state) == (7, "node", 3, 3)
+    assert [(disk.disk_id, disk.image_id, disk.target, disk.readonly) for disk in vm.disks] == [
+        (0, 1, "vda", False), (1, 5, "vdb", True), (2, -1, "vdc", False),
+    ]
+    assert vm.disks[1].snapshots == (pool_decoder.SnapshotRecord(id=3, name="s", date=1, size=0),)
+    assert vm.disks[0].snapshots == ()
+
+
+def test_decode_pools_across_feed_chunks(monkeypatch):
+    monkeypatch.setattr(pool_decoder, "FEED_CHUNK_SIZE", 7)
+    images = [IMAGE.replace("<ID>5</ID>", f"<ID>{image_id}</ID>") for image_id in range(3)]
+
+    records = list(pool_decoder.decode_image_pool(f"<IMAGE_POOL>{''.join(images)}</IMAGE_POOL>"))
+    assert [record.id for record in records] == [0, 1, 2]
+    assert all(record.vms == (7, 8) for record in records)
+
+    vms = list(pool_decoder.decode_vm_pool(f"<VM_POOL>{VM}{VM}</VM_POOL>"))
+    assert [len(vm.disks) for vm in vms] == [3, 3]
+
+
+def test_decode_empty_pool():
+    assert list(pool_decoder.decode_image_pool("<IMAGE_POOL></IMAGE_POOL>")) == []
@@ -0,0 +1,66 @@
+import pytest
+
+from grpc_interceptor.exceptions import Aborted
+
+import leases
+import sharding
+
+
+def _coordinator(tmp_path, holder, shard_count=4):
+    return sharding.ShardCoordinator(backend=leases.FileLeaseBackend(str(tmp_path)),
+                                     holder=holder,
+                                     shard_count=shard_count)
+
+
+def test_a_single_replica_owns_every_shard(tmp_path):
+    coordinator = _coordinator(tmp_path, "replica-a")
+    coordinator.reconcile()
+
+    for datastore_id in range(10):
+        assert coordinator.owns(f"datastore/{datastore_id}")
+        coordinator.check(f"datastore/{datastore_id}")
+
+
+def test_replicas_converge_on_a_fair_share(tmp_path):
+    first, second = _coordinator(tmp_path, "replica-a"), _coordinator(tmp_path, "replica-b")
+    first.reconcile()
+    second.reconcile()
+    assert len(second._owned) == 0
+
+    # The first replica releases its extra shards, the second picks them up
+    first.reconcile()
+    second.reconcile()
+    assert len(first._owned) == len(second._owned) == 2
+    assert first._owned.isdisjoint(second._owned)
+
+    key = next(f"datastore/{i}" for i in range(100) if first.shard_of(f"datastore/{i}") in second._owned)
+    with pytest.raises(Aborted):
+        first.check(key)
+
+
+def test_shards_of_a_stopped_replica_are_taken_over(tmp_path):
+    first, second = _coordinator(tmp_path, "replica-a"), _coordinator(tmp_path, "replica-b")
+    first.reconcile()
+    second.reconcile()
+    first.reconcile()
+    second.reconcile()
+
+    second.stop()
+    first.reconcile()
+    assert len(first._owned) == 4
+
+
+def test_listeners_are_told_about_changes_only(tmp_path):
+    coordinator = _coordinator(tmp_path, "replica-a")
+    calls = []
+    coordinator.add_listener(lambda: calls.append(set(coordinator._owned)))
+
+    coordinator.reconcile()
+    coordinator.reconcile()
+    assert calls == [{0, 1, 2, 3}]
+
+
+def test_shard_of_is_stable(tmp_path):
+    coordinator = _coordinator(tmp_path, "replica-a", shard_count=16)
+    assert coordinator.shard_of("datastore/100") == coordinator.shard_of("datastore/100")
+    assert 0 <= coordinator.shard_of("datastore/100") < 16
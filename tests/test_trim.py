@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from grpc_interceptor.exceptions import DeadlineExceeded
+
+import deadlines
+import trim
+
+
+class _ExpiredContext:
+    def add_callback(self, callback):
+        pass
+
+    def time_remaining(self):
+        return 0
+
+    def is_active(self):
+        return True
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(trim.os, "statvfs", lambda path: type("Stat", (), {"f_blocks": 3, "f_frsize": trim.TRIM_CHUNK_SIZE})())
+    scheduler = trim.TrimScheduler(interval=0, max_duration=60, bandwidth=0)
+    scheduler.track("vol-1", "/staging/vol-1")
+    return scheduler
+
+
+def test_trims_every_chunk(monkeypatch, scheduler):
+    chunks = []
+    monkeypatch.setattr(trim, "fitrim", lambda path, start, length: chunks.append(start) or 10)
+
+    scheduler.run_once()
+
+    assert chunks == [0, trim.TRIM_CHUNK_SIZE, 2 * trim.TRIM_CHUNK_SIZE]
+    assert scheduler._volumes["vol-1"].last_trim_bytes == 30
+    assert scheduler._volumes["vol-1"].last_trim > 0
+
+
+def test_paused_volume_is_skipped(monkeypatch, scheduler):
+    monkeypatch.setattr(trim, "fitrim", lambda path, start, length: pytest.fail("paused volume trimmed"))
+
+    with scheduler.pause("vol-1", deadlines.Deadline()):
+        scheduler.run_once()
+
+    assert scheduler._volumes["vol-1"].last_trim == 0
+
+
+def test_pause_waits_for_the_chunk_in_flight(monkeypatch, scheduler):
+    in_chunk, release = threading.Event(), threading.Event()
+    chunks = []
+
+    def fitrim(path, start, length):
+        chunks.append(start)
+        in_chunk.set()
+        release.wait()
+        return 0
+
+    monkeypatch.setattr(trim, "fitrim", fitrim)
+    worker = threading.Thread(target=scheduler.run_once)
+    worker.start()
+    in_chunk.wait()
+
+    paused = threading.Event()
+
+    def pause():
+        with scheduler.pause("vol-1", deadlines.Deadline()):
+            paused.set()
+
+    pauser = threading.Thread(target=pause)
+    pauser.start()
+    assert not paused.wait(0.2)
+
+    release.set()
+    pauser.join()
+    worker.join()
+    assert paused.is_set()
+    assert len(chunks) == 1
+
+
+def test_pause_gives_up_at_the_deadline(scheduler):
+    scheduler._trimming = "vol-1"
+
+    with pytest.raises(DeadlineExceeded):
+        with scheduler.pause("vol-1", deadlines.Deadline(_ExpiredContext())):
+            pass
+    assert "vol-1" not in scheduler._paused
@@ -0,0 +1,60 @@
+import volume_stats
+
+COUNTERS = {
+    "read_ios": 100, "write_ios": 50, "read_sectors": 800, "write_sectors": 400,
+    "in_flight": 2, "io_ticks": 500, "time_in_queue": 300,
+}
+
+
+def _advance(counters: dict, **deltas) -> dict:
+    return {name: value + deltas.get(name, 0) for name, value in counters.items()}
+
+
+def test_io_rates_first_sample_sets_the_baseline():
+    tracked = volume_stats._TrackedVolume(staging_path="/staging", readonly=False)
+
+    assert volume_stats._io_rates(tracked, COUNTERS, 10.0) == {"io_in_flight": 2}
+    assert tracked.io_counters == COUNTERS
+    assert tracked.io_counters_at == 10.0
+
+
+def test_io_rates_per_second():
+    tracked = volume_stats._TrackedVolume(staging_path="/staging", readonly=False)
+    volume_stats._io_rates(tracked, COUNTERS, 10.0)
+
+    rates = volume_stats._io_rates(
+        tracked,
+        _advance(COUNTERS, read_ios=20, write_ios=10, read_sectors=16, io_ticks=1000, time_in_queue=60),
+        12.0,
+    )
+
+    assert rates["read_iops"] == 10
+    assert rates["write_iops"] == 5
+    assert rates["read_bytes_per_second"] == 16 * volume_stats.SECTOR_SIZE / 2
+    assert rates["write_bytes_per_second"] == 0
+    assert rates["io_utilization"] == 0.5
+    assert rates["io_queue_time_ms"] == 2
+
+
+def test_io_rates_ignore_counters_older_than_the_baseline():
+    tracked = volume_stats._TrackedVolume(staging_path="/staging", readonly=False)
+    newer = _advance(COUNTERS, read_ios=10)
+    volume_stats._io_rates(tracked, newer, 12.0)
+
+    assert volume_stats._io_rates(tracked, COUNTERS, 11.0) == {"io_in_flight": 2}
+    assert tracked.io_counters == newer
+    assert tracked.io_counters_at == 12.0
+
+
+def test_track_keeps_the_baselines_of_the_same_staging_path():
+    collector = volume_stats.VolumeStatsCollector(interval=60)
+    collector.track("vol-1", "/staging/vol-1")
+    tracked = collector._volumes["vol-1"]
+    tracked.io_errors_baseline = 3
+
+    collector.track("vol-1", "/staging/vol-1", readonly=True)
+    assert collector._volumes["vol-1"] is tracked
+    assert tracked.readonly
+
+    collector.track("vol-1", "/staging/other")
+    assert collector._volumes["vol-1"].io_errors_baseline is None
@@ -0,0 +1,210 @@
+"""
+Background scheduler running FITRIM on the staged file systems which are not
+mounted with online discard
+"""
+import fcntl
+import logging
+import os
+import random
+import struct
+import threading
+import time
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import deadlines
+import metrics
+
+logger = logging.getLogger("TrimScheduler")
+
+# _IOWR('X', 121, struct fstrim_range)
+FITRIM = 0xC0185879
+TRIM_CHUNK_SIZE = 1024 ** 3
+TRIM_JITTER = 0.25
+TRIM_PAUSE_POLL_INTERVAL = 1
+
+
+@dataclass
+class _TrimmedVolume:
+    staging_path: str
+    last_trim: float = 0.0
+    last_trim_bytes: int = 0
+    total_trimmed_bytes: int = 0
+
+
+def fitrim(path: str, start: int, length: int, minimum_length: int = 0) -> int:
+    """
+    Discards the unused blocks of a file system region
+    :param path: A path on the file system, usually its mount point
+    :param start: Byte offset at which to start searching for free blocks
+    :param length: Number of bytes to search for free blocks
+    :param minimum_length: Minimum contiguous free range to discard
+    :return: The number of bytes discarded
+    :rtype: int
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        result = fcntl.ioctl(fd, FITRIM, struct.pack("QQQ", start, length, minimum_length))
+        return struct.unpack("QQQ", result)[1]
+    finally:
+        os.close(fd)
+
+
+class TrimScheduler:
+    """
+    Periodically trims the tracked file systems, one at a time, within a time
+    and bandwidth budget. The period is jittered so that the nodes sharing a
+    datastore don't trim it at the same time. The trim does not take the
+    volume locks of the node operations, NodeStageVolume and
+    NodeUnstageVolume pause it instead, and publishing is never held up.
+    """
+
+    def __init__(self,
+                 interval: float,
+                 max_duration: float,
+                 bandwidth: int):
+        self._interval = interval
+        self._max_duration = max_duration
+        self._bandwidth = bandwidth
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._volumes: dict[str, _TrimmedVolume] = {}
+        self._paused: dict[str, int] = {}
+        self._trimming: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trim", daemon=True)
+
+    def start(self) -> None:
+        """
+        Starts the scheduler, unless it is disabled by a zero interval
+        """
+        if self._interval > 0:
+            self._thread.start()
+        else:
+            logger.info("Scheduled trim is disabled")
+
+    def stop(self) -> None:
+        """
+        Stops the scheduler after the current chunk
+        """
+        self._stop.set()
+
+    def track(self, volume_id: str, staging_path: str) -> None:
+        """
+        Adds a staged volume to the trim schedule
+        """
+        with self._lock:
+            if volume_id not in self._volumes:
+                self._volumes[volume_id] = _TrimmedVolume(staging_path=staging_path)
+
+    def untrack(self, volume_id: str) -> None:
+        """
+        Removes a volume from the trim schedule
+        """
+        with self._lock:
+            self._volumes.pop(volume_id, None)
+
+    @contextmanager
+    def pause(self, volume_id: str, deadline: deadlines.Deadline):
+        """
+        Keeps the trim off a volume for the duration of the context, waiting
+        for the chunk being trimmed, if any, to complete. The interrupted
+        trim resumes on the next run.
+        :raises DeadlineExceeded: If the chunk in flight outlives the deadline
+        """
+        with self._condition:
+            self._paused[volume_id] = self._paused.get(volume_id, 0) + 1
+        try:
+            with self._condition:
+                while self._trimming == volume_id:
+                    logger.debug(f"Waiting for the trim of volume {volume_id} to stop")
+                    deadline.check(f"waiting for the trim of volume {volume_id}")
+                    self._condition.wait(TRIM_PAUSE_POLL_INTERVAL)
+            yield
+        finally:
+            with self._condition:
+                self._paused[volume_id] -= 1
+                if not self._paused[volume_id]:
+                    del self._paused[volume_id]
+
+    def run_once(self) -> None:
+        """
+        Trims the tracked volumes, least recently trimmed first, until the
+        time budget is exhausted
+        """
+        deadline = time.monotonic() + self._max_duration
+
+        with self._lock:
+            volumes = sorted(self._volumes.items(), key=lambda item: item[1].last_trim)
+
+        for volume_id, volume in volumes:
+            if self._stop.is_set() or time.monotonic() >= deadline:
+                logger.info("Trim time budget exhausted, the remaining volumes will be trimmed next run")
+                return
+
+            try:
+                self._trim_volume(volume_id, volume, deadline)
+            except OSError as error:
+                logger.error(f"Trimming volume {volume_id} at {volume.staging_path} failed: {error}")
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the per-volume trim metrics
+        """
+        with self._lock:
+            volumes = list(self._volumes.items())
+
+        for volume_id, volume in volumes:
+            labels = {"volume_id": volume_id}
+            yield metrics.Sample("csi_volume_last_trim_timestamp_seconds", labels, volume.last_trim)
+            yield metrics.Sample("csi_volume_last_trim_bytes", labels, volume.last_trim_bytes)
+            yield metrics.Sample("csi_volume_trimmed_bytes_total", labels, volume.total_trimmed_bytes, "counter")
+
+    def _trim_volume(self, volume_id: str, volume: _TrimmedVolume, deadline: float) -> None:
+        stat = os.statvfs(volume.staging_path)
+        fs_size = stat.f_blocks * stat.f_frsize
+        trimmed = 0
+        started = time.monotonic()
+
+        logger.debug(f"Trimming volume {volume_id} at {volume.staging_path}")
+
+        for offset in range(0, fs_size, TRIM_CHUNK_SIZE):
+            if self._stop.is_set() or time.monotonic() >= deadline:
+                logger.info(f"Trim of volume {volume_id} interrupted at offset {offset}")
+                break
+
+            with self._condition:
+                if volume_id in self._paused or self._volumes.get(volume_id) is not volume:
+                    logger.debug(f"Volume {volume_id} is being staged or unstaged, skipping it until the next run")
+                    break
+                self._trimming = volume_id
+            try:
+                trimmed += fitrim(volume.staging_path, offset, TRIM_CHUNK_SIZE)
+            finally:
+                with self._condition:
+                    self._trimming = None
+                    self._condition.notify_all()
+
+            if self._bandwidth > 0:
+                self._stop.wait(max(trimmed / self._bandwidth - (time.monotonic() - started), 0))
+        else:
+            with self._lock:
+                volume.last_trim = time.time()
+                volume.last_trim_bytes = trimmed
+
+        with self._lock:
+            volume.total_trimmed_bytes += trimmed
+
+        logger.info(f"Trimmed {trimmed} bytes of volume {volume_id} in {time.monotonic() - started:.1f}s")
+
+    def _run(self) -> None:
+        self._stop.wait(random.uniform(0, self._interval))
+
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Scheduled trim failed: {error}")
+            self._stop.wait(self._interval * random.uniform(1 - TRIM_JITTER, 1 + TRIM_JITTER))
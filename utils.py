@@ -1,6 +1,7 @@
 """
 This module contains various utility functions
 """
+import os
 
 
 def get_mounted_devices() -> list[dict]:
@@ -23,3 +24,55 @@ def get_mounted_devices() -> list[dict]:
                 }
             )
         return result
+
+
+BLOCK_DEVICE_STAT_FIELDS = (
+    "read_ios",
+    "read_merges",
+    "read_sectors",
+    "read_ticks",
+    "write_ios",
+    "write_merges",
+    "write_sectors",
+    "write_ticks",
+    "in_flight",
+    "io_ticks",
+    "time_in_queue",
+)
+
+
+def get_block_device_name(device_path: str) -> str:
+    """
+    Returns the kernel name of a block device, resolving symbolic links
+    :param device_path: Path to the device node, e.g. /dev/vdb
+    :return: The kernel name of the device, e.g. vdb
+    :rtype: str
+    """
+    return os.path.basename(os.path.realpath(device_path))
+
+
+def read_block_device_stat(device_name: str) -> dict:
+    """
+    Reads the I/O counters of a block device from sysfs
+    :param device_name: Kernel name of the device
+    :return: A dictionary with the counters described in the kernel's
+             Documentation/block/stat.rst
+    :rtype: dict
+    """
+    with open(f"/sys/class/block/{device_name}/stat") as file:
+        values = [int(value) for value in file.read().split()]
+        return dict(zip(BLOCK_DEVICE_STAT_FIELDS, values))
+
+
+def read_block_device_io_errors(device_name: str) -> int:
+    """
+    Returns the number of I/O errors reported by a SCSI block device
+    :param device_name: Kernel name of the device
+    :return: The error count, 0 if the device does not report errors
+    :rtype: int
+    """
+    try:
+        with open(f"/sys/class/block/{device_name}/device/ioerr_cnt") as file:
+            return int(file.read().strip(), 16)
+    except (OSError, ValueError):
+        return 0
@@ -0,0 +1,285 @@
+"""
+Background collector of the statistics of the volumes staged on this node
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+import constant
+import metrics
+import utils
+
+logger = logging.getLogger("VolumeStats")
+
+SECTOR_SIZE = 512
+
+
+@dataclass
+class VolumeSample:
+    """
+    The last known state of a staged volume
+    """
+
+    volume_id: str
+    staging_path: str
+    mounted: bool = False
+    device: str = ""
+    bytes_total: int = 0
+    bytes_available: int = 0
+    bytes_used: int = 0
+    inodes_total: int = 0
+    inodes_available: int = 0
+    inodes_used: int = 0
+    abnormal: bool = False
+    message: str = ""
+    io: dict = field(default_factory=dict)
+    sampled_at: float = 0.0
+
+
+@dataclass
+class _TrackedVolume:
+    staging_path: str
+    readonly: bool
+    io_counters: Optional[dict] = None
+    io_counters_at: float = 0.0
+    io_errors_baseline: Optional[int] = None
+
+
+class VolumeStatsCollector:
+    """
+    Periodically samples statvfs and the block device I/O counters of all
+    staged volumes, so that NodeGetVolumeStats can be answered from memory
+    """
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._volumes: dict[str, _TrackedVolume] = {}
+        self._samples: dict[str, VolumeSample] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="volume-stats", daemon=True
+        )
+
+    def start(self) -> None:
+        """
+        Discovers the volumes which are already staged and starts sampling
+        """
+        for volume in discover_staged_volumes():
+            logger.debug(f"Discovered staged volume {volume['volume_id']} at {volume['staging_path']}")
+            self.track(volume["volume_id"], volume["staging_path"], "ro" in volume["options"])
+
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background sampling
+        """
+        self._stop.set()
+
+    def track(self, volume_id: str, staging_path: str, readonly: bool = False) -> None:
+        """
+        Starts collecting statistics for a staged volume. A volume staged
+        again at the same path, e.g. by a retried NodeStageVolume, keeps its
+        baselines and only has its read-only flag updated.
+        """
+        with self._lock:
+            tracked = self._volumes.get(volume_id)
+            if tracked is not None and tracked.staging_path == staging_path:
+                tracked.readonly = readonly
+                return
+            self._volumes[volume_id] = _TrackedVolume(staging_path=staging_path, readonly=readonly)
+
+    def untrack(self, volume_id: str) -> None:
+        """
+        Stops collecting statistics for a volume which has been unstaged
+        """
+        with self._lock:
+            self._volumes.pop(volume_id, None)
+            self._samples.pop(volume_id, None)
+
+    def get(self, volume_id: str) -> Optional[VolumeSample]:
+        """
+        Returns the last sample of a volume, None if it is not tracked
+        """
+        with self._lock:
+            return self._samples.get(volume_id)
+
+    def sample_volume(self, volume_id: str) -> Optional[VolumeSample]:
+        """
+        Samples a single tracked volume immediately
+        """
+        with self._lock:
+            tracked = self._volumes.get(volume_id)
+
+        if tracked is None:
+            return None
+
+        sample = self._sample(volume_id, tracked, _mounts_by_target())
+        with self._lock:
+            if volume_id in self._volumes:
+                self._samples[volume_id] = sample
+        return sample
+
+    def collect(self) -> None:
+        """
+        Samples all tracked volumes
+        """
+        with self._lock:
+            volumes = dict(self._volumes)
+
+        mounts = _mounts_by_target()
+        samples = {
+            volume_id: self._sample(volume_id, tracked, mounts)
+            for volume_id, tracked in volumes.items()
+        }
+
+        with self._lock:
+            for volume_id, sample in samples.items():
+                if volume_id in self._volumes:
+                    self._samples[volume_id] = sample
+
+    def metrics(self) -> Iterable[metrics.Sample]:
+        """
+        Returns the per-volume capacity and I/O metrics
+        """
+        with self._lock:
+            samples = list(self._samples.values())
+
+        for sample in samples:
+            labels = {"volume_id": sample.volume_id, "device": sample.device}
+            yield metrics.Sample("csi_volume_bytes_used", labels, sample.bytes_used)
+            yield metrics.Sample("csi_volume_bytes_total", labels, sample.bytes_total)
+            yield metrics.Sample("csi_volume_inodes_used", labels, sample.inodes_used)
+            yield metrics.Sample("csi_volume_abnormal", labels, int(sample.abnormal))
+            for name, value in sample.io.items():
+                yield metrics.Sample(f"csi_volume_{name}", labels, value)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.collect()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Collecting volume statistics failed: {error}")
+            self._stop.wait(max(self._interval - (time.monotonic() - started), 0))
+
+    def _sample(self, volume_id: str, tracked: _TrackedVolume, mounts: dict) -> VolumeSample:
+        sample = VolumeSample(volume_id=volume_id,
+                              staging_path=tracked.staging_path,
+                              sampled_at=time.time())
+
+        mount = mounts.get(tracked.staging_path)
+        if mount is None:
+            sample.abnormal = True
+            sample.message = f"Volume is not mounted at {tracked.staging_path}"
+            return sample
+
+        sample.mounted = True
+        sample.device = utils.get_block_device_name(mount["device"])
+
+        try:
+            stat = os.statvfs(tracked.staging_path)
+            sample.bytes_total = stat.f_blocks * stat.f_frsize
+            sample.bytes_available = stat.f_bavail * stat.f_frsize
+            sample.bytes_used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+            sample.inodes_total = stat.f_files
+            sample.inodes_available = stat.f_favail
+            sample.inodes_used = stat.f_files - stat.f_ffree
+        except OSError as error:
+            sample.abnormal = True
+            sample.message = f"statvfs on {tracked.staging_path} failed: {error}"
+
+        if not tracked.readonly and "ro" in mount["options"].split(","):
+            sample.abnormal = True
+            sample.message = "File system has been remounted read-only"
+
+        try:
+            counters = utils.read_block_device_stat(sample.device)
+        except OSError as error:
+            logger.debug(f"Cannot read I/O counters of {sample.device}: {error}")
+            counters = None
+        counters_at = time.monotonic()
+        io_errors = utils.read_block_device_io_errors(sample.device)
+
+        # The background collection and NodeGetVolumeStats can sample the
+        # same volume at once, the baselines are only moved under the lock
+        with self._lock:
+            if counters is not None:
+                sample.io = _io_rates(tracked, counters, counters_at)
+
+            if tracked.io_errors_baseline is None:
+                tracked.io_errors_baseline = io_errors
+            elif io_errors > tracked.io_errors_baseline:
+                sample.abnormal = True
+                sample.message = (f"Device {sample.device} reported {io_errors - tracked.io_errors_baseline} "
+                                  f"I/O errors since the volume was staged")
+
+        return sample
+
+
+def _io_rates(tracked: _TrackedVolume, counters: dict, now: float) -> dict:
+    """
+    Computes the I/O rates since the previous counters of a volume and makes
+    the new counters the baseline. Counters read before the baseline, by a
+    concurrent sample which lost the race for the lock, leave it untouched.
+    """
+    rates = {"io_in_flight": counters["in_flight"]}
+    previous, previous_at = tracked.io_counters, tracked.io_counters_at
+    if previous is not None and now <= previous_at:
+        return rates
+    tracked.io_counters, tracked.io_counters_at = counters, now
+    if previous is None:
+        return rates
+
+    elapsed = now - previous_at
+    ios = (counters["read_ios"] + counters["write_ios"]) - (previous["read_ios"] + previous["write_ios"])
+
+    rates["read_iops"] = (counters["read_ios"] - previous["read_ios"]) / elapsed
+    rates["write_iops"] = (counters["write_ios"] - previous["write_ios"]) / elapsed
+    rates["read_bytes_per_second"] = (counters["read_sectors"] - previous["read_sectors"]) * SECTOR_SIZE / elapsed
+    rates["write_bytes_per_second"] = (counters["write_sectors"] - previous["write_sectors"]) * SECTOR_SIZE / elapsed
+    rates["io_utilization"] = (counters["io_ticks"] - previous["io_ticks"]) / (elapsed * 1000)
+    rates["io_queue_time_ms"] = (
+        (counters["time_in_queue"] - previous["time_in_queue"]) / ios if ios > 0 else 0.0
+    )
+    return rates
+
+
+def _mounts_by_target() -> dict:
+    return {mount["target"]: mount for mount in utils.get_mounted_devices()}
+
+
+def discover_staged_volumes() -> list[dict]:
+    """
+    Finds the volumes of this driver which the Kubelet has already staged,
+    using the vol_data.json file it keeps next to each global mount
+    :return: A list of dictionaries with the volume ID, staging path and
+             mount options of each staged volume
+    """
+    result = []
+    for mount in utils.get_mounted_devices():
+        if not mount["target"].endswith("/globalmount"):
+            continue
+
+        vol_data_path = Path(mount["target"]).parent / "vol_data.json"
+        try:
+            with open(vol_data_path) as vol_data_file:
+                vol_data = json.load(vol_data_file)
+        except (OSError, ValueError):
+            continue
+
+        if vol_data.get("driverName") == constant.CSI_PLUGIN_NAME and vol_data.get("volumeHandle"):
+            result.append({
+                "volume_id": vol_data["volumeHandle"],
+                "staging_path": mount["target"],
+                "options": mount["options"].split(","),
+            })
+
+    return result